@@ -0,0 +1,319 @@
+"""Local stand-in for the CandFans API and media CDN.
+
+Serves synthetic subscription, user, timeline and purchased-content JSON plus
+mp4, jpg and m3u8/TS payloads. Latency, per-connection bandwidth and error
+injection are configurable so download and fetch paths can be measured
+without network access.
+
+Run standalone with ``python benchmarks/fake_server.py --port 8000``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeCandFans:
+    """Synthetic catalog and server settings shared by request handlers."""
+
+    def __init__(
+            self,
+            accounts: int = 3,
+            posts_per_account: int = 60,
+            purchased_months: int = 12,
+            purchased_per_month: int = 20,
+            mp4_size: int = 8 * 1024 * 1024,
+            jpg_size: int = 200 * 1024,
+            segments: int = 20,
+            latency: float = 0.0,
+            bandwidth: int = 0,
+            error_rate: float = 0.0,
+            segment_file: str | None = None,
+            seed: int = 1,
+            purchased_paging: bool = False,
+    ):
+        self.accounts = accounts
+        self.posts_per_account = posts_per_account
+        self.purchased_months = purchased_months
+        self.purchased_per_month = purchased_per_month
+        self.purchased_paging = purchased_paging
+        self.mp4_size = mp4_size
+        self.jpg_size = jpg_size
+        self.segments = segments
+        self.latency = latency
+        self.bandwidth = bandwidth  # bytes/sec per connection, 0 = unlimited
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.requests = 0
+        self.errors_injected = 0
+        self.segment = self._load_segment(segment_file)
+        self.base_url = ""
+
+    # ---- payloads ----
+    @staticmethod
+    def _load_segment(segment_file):
+        if segment_file:
+            with open(segment_file, "rb") as f:
+                return f.read()
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            # Not decodable, but fine for benchmarks that skip merging
+            return os.urandom(256 * 1024)
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "seg.ts")
+            subprocess.run(
+                [ffmpeg, "-loglevel", "error", "-y",
+                 "-f", "lavfi", "-i", "testsrc=duration=2:size=320x240:rate=25",
+                 "-f", "lavfi", "-i", "sine=duration=2",
+                 "-c:v", "libx264", "-c:a", "aac", "-shortest", "-f", "mpegts", out],
+                check=True)
+            with open(out, "rb") as f:
+                return f.read()
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def blob(size: int, seed: int) -> bytes:
+        block = random.Random(seed).randbytes(64 * 1024)
+        reps, rest = divmod(size, len(block))
+        return block * reps + block[:rest]
+
+    def _attachments(self, post_id: int, kind: str) -> list:
+        base = self.base_url
+        if kind == "m3u8":
+            return [{"default": f"{base}/media/{post_id}/playlist.m3u8"}]
+        if kind == "jpg":
+            return [{"default": f"{base}/media/{post_id}/{i}.jpg"} for i in range(4)]
+        return [{"default": f"{base}/media/{post_id}/video.mp4"}]
+
+    def _post(self, user_idx: int, n: int) -> dict:
+        post_id = user_idx * 100000 + n
+        kind = ("mp4", "m3u8", "jpg")[n % 3]
+        return {
+            "post_id": post_id,
+            "title": f"post {n} of user{user_idx}",
+            "month": f"2025-{n % 12 + 1:02d}",
+            "attachments": self._attachments(post_id, kind),
+        }
+
+    def subscriptions(self) -> dict:
+        return {"data": [{"user_code": f"user{i}", "plan_id": i}
+                         for i in range(self.accounts)]}
+
+    def user(self, user_code: str) -> dict:
+        idx = int(user_code.removeprefix("user") or 0)
+        return {"data": {"user": {"user_code": user_code,
+                                  "username": f"creator{idx}", "id": idx}}}
+
+    def timeline(self, user_id: int, page: int, record: int) -> dict:
+        start = (page - 1) * record
+        end = min(start + record, self.posts_per_account)
+        return {"data": [self._post(user_id, n) for n in range(start, end)]}
+
+    def purchased(self, page: int | None = None, record: int = 50) -> dict:
+        """Return the purchase history, newest month first.
+
+        With ``purchased_paging`` enabled and *page* given, only that page of
+        *record* items is returned along with ``last_page``.
+        """
+        data = {}
+        for m in range(self.purchased_months):
+            key = f"{2025 - m // 12}年{12 - m % 12:02d}月 購入履歴"
+            data[key] = [
+                {
+                    "post_id": 900000 + m * 1000 + i,
+                    "title": f"purchase {m}-{i}",
+                    "username": f"creator{i % max(self.accounts, 1)}",
+                    "price": 1000,
+                    "attachments": self._attachments(
+                        900000 + m * 1000 + i, "m3u8" if i % 2 else "mp4"),
+                }
+                for i in range(self.purchased_per_month)
+            ]
+        if not (self.purchased_paging and page):
+            return {"data": data}
+        items = [(key, item) for key, month in data.items() for item in month]
+        last_page = max(-(-len(items) // record), 1)
+        paged = {}
+        for key, item in items[(page - 1) * record:page * record]:
+            paged.setdefault(key, []).append(item)
+        return {"data": paged, "last_page": last_page}
+
+    def playlist(self) -> str:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:2"]
+        for i in range(self.segments):
+            lines += ["#EXTINF:2.000,", f"{i:04d}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def should_fail(self) -> bool:
+        with self.rng_lock:
+            self.requests += 1
+            fail = self.error_rate and self.rng.random() < self.error_rate
+            if fail:
+                self.errors_injected += 1
+            return bool(fail)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake: FakeCandFans = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._dispatch(head=True)
+
+    def do_GET(self):
+        self._dispatch(head=False)
+
+    def _dispatch(self, head: bool):
+        fake = self.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        if fake.should_fail():
+            self._send(503, b"injected error", "text/plain", head)
+            return
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path
+        if path == "/api/user/get-entry-plans":
+            self._json(fake.subscriptions(), head)
+        elif path == "/api/user/get-users":
+            self._json(fake.user(q.get("user_code", "user0")), head)
+        elif path == "/api/user/get-user-mine":
+            self._json({"data": {"users": [{"username": "bench"}]}}, head)
+        elif path == "/api/contents/get-timeline":
+            self._json(fake.timeline(int(q.get("user_id", 0)), int(q.get("page", 1)),
+                                     int(q.get("record", 12))), head)
+        elif path == "/api/contents/get-purchased-contents":
+            page = int(q["page"]) if "page" in q else None
+            self._json(fake.purchased(page, int(q.get("record", 50))), head)
+        elif path.endswith("/playlist.m3u8"):
+            self._send(200, fake.playlist().encode(),
+                       "application/vnd.apple.mpegurl", head)
+        elif path.endswith(".ts"):
+            self._send(200, fake.segment, "video/mp2t", head)
+        elif path.endswith(".mp4"):
+            self._send(200, FakeCandFans.blob(fake.mp4_size, zlib.crc32(path.encode()) % 16), "video/mp4", head)
+        elif path.endswith(".jpg"):
+            self._send(200, FakeCandFans.blob(fake.jpg_size, zlib.crc32(path.encode()) % 16), "image/jpeg", head)
+        else:
+            self._send(404, b"not found", "text/plain", head)
+
+    def _json(self, obj, head):
+        self._send(200, json.dumps(obj, ensure_ascii=False).encode(), "application/json", head)
+
+    def _send(self, status, body: bytes, ctype: str, head: bool):
+        start, end = 0, len(body) - 1
+        rng = self.headers.get("Range")
+        if status == 200 and rng and rng.startswith("bytes="):
+            first, _, last = rng[6:].split(",")[0].partition("-")
+            start = int(first) if first else max(len(body) - int(last), 0)
+            end = min(int(last), len(body) - 1) if first and last else end
+            status = 206
+        payload = body[start:end + 1]
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        self.end_headers()
+        if head:
+            return
+        self._write_throttled(payload)
+
+    def _write_throttled(self, payload: bytes):
+        bandwidth = self.fake.bandwidth
+        if not bandwidth:
+            self.wfile.write(payload)
+            return
+        chunk = max(bandwidth // 20, 4096)
+        started = time.monotonic()
+        sent = 0
+        view = memoryview(payload)
+        while sent < len(payload):
+            self.wfile.write(view[sent:sent + chunk])
+            sent += min(chunk, len(payload) - sent)
+            ahead = sent / bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def start_server(fake: FakeCandFans, host: str = "127.0.0.1", port: int = 0):
+    """Start serving *fake* in a daemon thread; return the server object."""
+    handler = type("Handler", (_Handler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    fake.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def config_for(fake: FakeCandFans, download_dir: str, state_dir: str | None = None) -> dict:
+    """Return a config dict pointing every endpoint at *fake*.
+
+    The job queue, dedup index, purchase cache and thumbnails go to
+    *state_dir* (default: ``state`` next to *download_dir*), so benchmark
+    runs never touch the real state next to ``config.yaml``.
+    """
+    base = fake.base_url
+    if state_dir is None:
+        state_dir = os.path.join(os.path.dirname(os.path.abspath(download_dir)), "state")
+    return {
+        "base_url": f"{base}/api/user/get-entry-plans",
+        "get_users_url": f"{base}/api/user/get-users",
+        "get_timeline_url": f"{base}/api/contents/get-timeline",
+        "get_user_mine_url": f"{base}/api/user/get-user-mine",
+        "get_purchased_url": f"{base}/api/contents/get-purchased-contents",
+        "download_dir": download_dir,
+        "job_db": os.path.join(state_dir, "jobs.sqlite3"),
+        "dedup_db": os.path.join(state_dir, "media.sqlite3"),
+        "purchased_cache": os.path.join(state_dir, "purchased_cache.json"),
+        "thumbnail_dir": os.path.join(state_dir, "thumbnails"),
+        "headers": {"accept": "application/json", "x-xsrf-token": "bench"},
+        "cookie": "bench=1",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds of delay added to every request")
+    parser.add_argument("--bandwidth", type=int, default=0,
+                        help="Per-connection bytes/sec (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 503")
+    parser.add_argument("--segment-file", help="Serve this file for every TS segment")
+    args = parser.parse_args()
+    fake = FakeCandFans(latency=args.latency, bandwidth=args.bandwidth,
+                        error_rate=args.error_rate, segment_file=args.segment_file)
+    server = start_server(fake, args.host, args.port)
+    print(f"Serving fake CandFans on {fake.base_url}")
+    print(json.dumps(config_for(fake, "./downloads"), indent=2))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
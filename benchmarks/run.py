@@ -0,0 +1,187 @@
+"""Offline benchmarks for the fetch and download paths.
+
+Starts :mod:`fake_server` on a local port, points the configuration at it and
+times the core code paths. Results are printed as JSON and can be compared
+against a previous run to catch regressions::
+
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --baseline baseline.json --threshold 0.15
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core import metrics, profiling  # noqa: E402
+from core.api import (  # noqa: E402
+    get_subscription_list,
+    get_timeline,
+    get_user_info_by_code,
+    iter_purchased_contents,
+    parse_subscription_list,
+)
+from core.config import load_config  # noqa: E402
+from fake_server import FakeCandFans, config_for, start_server  # noqa: E402
+
+
+def _quiet(_msg):
+    pass
+
+
+def bench_fetch_timelines(fake, workdir):
+    items = 0
+    subs = parse_subscription_list(get_subscription_list())
+    for sub in subs:
+        info = get_user_info_by_code(sub["user_code"])
+        page = 1
+        while True:
+            tl = get_timeline(info["user_id"], page=page)
+            items += sum(len(p.get("attachments", [])) for p in tl)
+            if len(tl) < 12:
+                break
+            page += 1
+    return {"items": items, "bytes": 0}
+
+
+def bench_fetch_purchased(fake, workdir):
+    items = sum(1 for _ in iter_purchased_contents())
+    return {"items": items, "bytes": 0}
+
+
+def _download(urls, workdir, url_type):
+    from core.downloader import download_and_merge
+
+    total = 0
+    for n, url in enumerate(urls):
+        target = os.path.join(workdir, url_type, str(n))
+        download_and_merge(url, target, f"item{n}", url_type=url_type,
+                           log=_quiet, progress_cb=lambda c, t: None)
+        total += sum(os.path.getsize(os.path.join(target, f)) for f in os.listdir(target))
+    return {"items": len(urls), "bytes": total}
+
+
+def bench_download_mp4(fake, workdir, count=4):
+    urls = [f"{fake.base_url}/media/{n}/video.mp4" for n in range(count)]
+    return _download(urls, workdir, "mp4")
+
+
+def bench_download_m3u8(fake, workdir, count=2):
+    urls = [f"{fake.base_url}/media/{n}/playlist.m3u8" for n in range(count)]
+    return _download(urls, workdir, "m3u8")
+
+
+def bench_download_jpg(fake, workdir, count=24):
+    urls = [f"{fake.base_url}/media/{n // 4}/{n % 4}.jpg" for n in range(count)]
+    return _download(urls, workdir, "jpg")
+
+
+SCENARIOS = {
+    "fetch_timelines": bench_fetch_timelines,
+    "fetch_purchased": bench_fetch_purchased,
+    "download_mp4": bench_download_mp4,
+    "download_m3u8": bench_download_m3u8,
+    "download_jpg": bench_download_jpg,
+}
+
+
+def run(names, fake, repeat=1):
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        cfg_path = os.path.join(workdir, "config.yaml")
+        with open(cfg_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(config_for(fake, os.path.join(workdir, "downloads")), f)
+        load_config(cfg_path)
+        for name in names:
+            best = None
+            for i in range(repeat):
+                out_dir = os.path.join(workdir, f"{name}-{i}")
+                started = time.perf_counter()
+                stats = SCENARIOS[name](fake, out_dir)
+                elapsed = time.perf_counter() - started
+                if best is None or elapsed < best["seconds"]:
+                    best = {
+                        "seconds": round(elapsed, 4),
+                        "items": stats["items"],
+                        "items_per_sec": round(stats["items"] / elapsed, 2),
+                        "mb_per_sec": round(stats["bytes"] / elapsed / 1e6, 2),
+                    }
+            results[name] = best
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions against *baseline*."""
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = res["seconds"] / max(base["seconds"], 1e-9)
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {base['seconds']:.3f}s -> {res['seconds']:.3f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline CandFans downloader benchmarks")
+    parser.add_argument("scenarios", nargs="*",
+                        help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario; best is kept")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--mp4-size", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--segments", type=int, default=20)
+    parser.add_argument("--segment-file", help="Serve this file for every TS segment")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous --save file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed slowdown before a scenario counts as a regression")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Include the core.metrics snapshot in the output")
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    profiling.configure()
+    fake = FakeCandFans(latency=args.latency, bandwidth=args.bandwidth,
+                        error_rate=args.error_rate, mp4_size=args.mp4_size,
+                        segments=args.segments, segment_file=args.segment_file)
+    server = start_server(fake)
+    try:
+        results = run(args.scenarios or list(SCENARIOS), fake, args.repeat)
+    finally:
+        server.shutdown()
+
+    report = {"results": results, "requests": fake.requests,
+              "errors_injected": fake.errors_injected}
+    if args.metrics:
+        report["metrics"] = metrics.snapshot()
+    print(json.dumps(report, indent=2))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"[Regression] {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""Headless command line interface for unattended downloads."""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+
+import yaml
+
+from core import metrics, profiling
+from core.config import cfg, load_config
+from core.app_log import log
+
+__all__ = ["main"]
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="candfans-downloader",
+        description="Download CandFans content without the GUI.")
+    parser.add_argument("--config", help="Path to config.yaml")
+    parser.add_argument("--metrics-out",
+                        help="Write collected metrics to this file on exit")
+    parser.add_argument("--metrics-format", choices=["json", "prometheus"],
+                        default="json", help="Format used for --metrics-out")
+    parser.add_argument("--account", metavar="NAME",
+                        help="Act as this login from the accounts config key")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="Split purchased, sync and resume across N worker processes")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="Only handle part I of N (for workers on several hosts)")
+    parser.add_argument("--shard-by", choices=["post", "creator"], default="post",
+                        help="Split the work by post id (default) or by creator")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    purchased = sub.add_parser("purchased", help="Download purchased contents")
+    purchased.add_argument("--keyword", default="",
+                           help="Only download titles containing this keyword")
+    purchased.add_argument("--month", default="",
+                           help='Only download a purchase month, e.g. "2025年09月"')
+    purchased.add_argument("--output",
+                           help="Download directory (defaults to download_dir)")
+    purchased.add_argument("--dry-run", action="store_true",
+                           help="Report the batch size and free space without downloading")
+
+    sync = sub.add_parser(
+        "sync", help="Download subscription timelines, starting while pages are fetched")
+    sync.add_argument("--creator", action="append", default=[], metavar="USER_CODE",
+                      help="Creator to sync (repeatable; default: all subscriptions)")
+    sync.add_argument("--type", action="append", default=[], dest="types",
+                      choices=["mp4", "m3u8", "jpg"],
+                      help="Only download this attachment type (repeatable)")
+    sync.add_argument("--keyword", default="",
+                      help="Only download titles containing this keyword")
+    sync.add_argument("--pages", type=int,
+                      help="Pages per creator (default: all)")
+    sync.add_argument("--output",
+                      help="Download directory (defaults to download_dir)")
+    sync.add_argument("--all-accounts", action="store_true",
+                      help="Sync the default login and every configured account concurrently")
+
+    catalog = sub.add_parser(
+        "catalog", help="Save fetched posts to a catalog file, or download from one")
+    catalog_sub = catalog.add_subparsers(dest="catalog_command", required=True)
+    export = catalog_sub.add_parser("export", help="Fetch posts and write them to FILE")
+    export.add_argument("file", metavar="FILE", help="Catalog file (SQLite)")
+    export.add_argument("--creator", action="append", default=[], metavar="USER_CODE",
+                        help="Creator to fetch (repeatable; default: all subscriptions)")
+    export.add_argument("--pages", type=int,
+                        help="Pages per creator (default: all)")
+    export.add_argument("--purchased", action="store_true",
+                        help="Also fetch purchased contents")
+    export.add_argument("--no-timelines", action="store_true",
+                        help="Skip subscription timelines")
+    download = catalog_sub.add_parser(
+        "download", help="Download posts listed in FILE without fetching them again")
+    download.add_argument("file", metavar="FILE", help="Catalog file (SQLite)")
+    download.add_argument("--source", choices=["subscription", "purchased"],
+                          help="Only download posts from this source")
+    download.add_argument("--type", action="append", default=[], dest="types",
+                          choices=["mp4", "m3u8", "jpg"],
+                          help="Only download this attachment type (repeatable)")
+    download.add_argument("--keyword", default="",
+                          help="Only download titles containing this keyword")
+    download.add_argument("--month", default="",
+                          help='Only download posts of a month, e.g. "2025年09月"')
+    download.add_argument("--output",
+                          help="Download directory (defaults to download_dir)")
+
+    sub.add_parser("resume", help="Resume downloads left unfinished by a previous run")
+    sub.add_parser("dedup-report", help="Show space and transfer saved by deduplication")
+
+    scan = sub.add_parser("scan", help="Re-check finished downloads for damaged files")
+    scan.add_argument("--hash", action="store_true",
+                      help="Also compare content hashes recorded with verify_hash")
+    scan.add_argument("--processes", type=int, metavar="N",
+                      help="Files checked in parallel (default: one per CPU)")
+    scan.add_argument("--requeue", action="store_true",
+                      help="Queue damaged files for download again (see resume)")
+    return parser
+
+
+def _resume(shard) -> None:
+    from core.downloader import download_images, download_job
+    from core.jobs import get_job_store
+    from core.scheduler import DownloadQueue
+
+    store = get_job_store()
+    jobs = [job for job in store.unfinished() if shard is None or shard.owns(job)]
+    log(f"[Queue] {len(jobs)} unfinished download(s)")
+    download_queue = DownloadQueue(jobs)
+    for n, job in enumerate(iter(download_queue.pop, None), start=1):
+        log(f"[{n}/{len(jobs)}] {job['username']} / {job['output_name']}")
+        if job["url_type"] == "jpg":
+            batch = [job] + download_queue.take(
+                lambda other: other["url_type"] == "jpg"
+                and (other["username"], other["post_id"]) == (job["username"], job["post_id"]))
+            batch = [image for image in batch if store.claim(image["id"])]
+            if batch:
+                download_images(batch, store, progress_cb=lambda c, t: None)
+            continue
+        # Another worker may have picked it up since the list was read
+        if not store.claim(job["id"]):
+            continue
+        try:
+            download_job(job, store, progress_cb=lambda c, t: None)
+        except Exception as e:
+            log(f"    [Failed] {job['output_name']}: {e}")
+
+
+def _sync_account(args, account, shard=None) -> None:
+    from core.sync import resolve_creators, sync_timelines
+
+    prefix = f"[Sync {account.name}]" if account is not None else "[Sync]"
+    creators = resolve_creators(args.creator, account)
+    log(f"{prefix} {len(creators)} creator(s)")
+    counts = sync_timelines(
+        creators,
+        args.output or cfg.get("download_dir") or "downloads",
+        url_types=args.types,
+        keyword=args.keyword,
+        max_pages=args.pages,
+        progress_cb=lambda c, t: None,
+        account=account,
+        shard=shard,
+    )
+    log(f"{prefix} {counts['downloaded']} downloaded, {counts['skipped']} skipped, "
+        f"{counts['failed']} failed")
+
+
+def _sync(args, account, shard) -> None:
+    if not args.all_accounts:
+        _sync_account(args, account, shard)
+        return
+
+    from core.accounts import configured_accounts, get_account
+
+    # One thread per login; they share the job store and download directory
+    accounts = [None] + [get_account(name) for name in configured_accounts()]
+
+    def run(account):
+        try:
+            _sync_account(args, account, shard)
+        except Exception as e:
+            name = account.name if account is not None else "default"
+            log(f"[Sync {name}] Failed: {e}")
+
+    threads = [threading.Thread(target=run, args=(a,), daemon=True,
+                                name=f"sync-{a.name if a is not None else 'default'}")
+               for a in accounts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(0.5)
+
+
+def _catalog_export(args, account) -> None:
+    from core.api import iter_purchased_contents
+    from core.catalog import Catalog
+    from core.sync import iter_timeline, resolve_creators
+
+    with Catalog(args.file) as catalog:
+        if not args.no_timelines:
+            creators = resolve_creators(args.creator, account)
+            catalog.add_creators(creators)
+            for creator in creators:
+                count = 0
+                for posts in iter_timeline(creator, args.pages, account):
+                    count += catalog.add_posts("subscription", posts, creator)
+                log(f"[Catalog] {creator['username']}: {count} post(s)")
+        if args.purchased:
+            batch = []
+            for content in iter_purchased_contents(account):
+                batch.append(content)
+                if len(batch) >= 500:
+                    catalog.add_posts("purchased", batch)
+                    batch = []
+            catalog.add_posts("purchased", batch)
+            log(f"[Catalog] {catalog.count('purchased')} purchased content(s)")
+        log(f"[Catalog] {catalog.count()} post(s) in {args.file}")
+
+
+def _catalog_download(args, account) -> None:
+    import os
+
+    from core.catalog import Catalog
+    from core.sync import download_pipelined
+
+    if not os.path.exists(args.file):
+        log(f"[Catalog] Not found: {args.file}")
+        return
+    with Catalog(args.file) as catalog:
+        jobs = catalog.jobs(
+            args.output or cfg.get("download_dir") or "downloads",
+            source=args.source,
+            url_types=args.types,
+            keyword=args.keyword,
+            month=args.month,
+            account=account.name if account is not None else "",
+        )
+    log(f"[Catalog] {len(jobs)} download(s) from {args.file}")
+
+    def produce(put):
+        # One post at a time so its images are fetched together
+        post = []
+        for job in jobs:
+            if post and (job["username"], job["post_id"]) != (post[0]["username"],
+                                                              post[0]["post_id"]):
+                put(post)
+                post = []
+            post.append(job)
+        if post:
+            put(post)
+
+    counts = download_pipelined(produce, progress_cb=lambda c, t: None)
+    log(f"[Catalog] {counts['downloaded']} downloaded, {counts['skipped']} skipped, "
+        f"{counts['failed']} failed")
+
+
+def _dedup_report() -> None:
+    from core.dedup import get_media_index
+
+    index = get_media_index()
+    if index is None:
+        log("Deduplication is disabled (dedup: false)")
+        return
+    report = index.report()
+    for kind, label in (("transfer", "Downloads skipped"), ("storage", "Duplicates linked")):
+        entry = report.get(kind, {"files": 0, "bytes": 0})
+        log(f"{label}: {entry['files']} file(s), {entry['bytes'] / 1024 ** 2:.1f} MB saved")
+
+
+def _run_workers(argv: list[str], count: int) -> int:
+    """Run the command in *count* worker processes, one shard each.
+
+    Returns the highest worker exit code.
+    """
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (src, env.get("PYTHONPATH")) if p)
+    log(f"[Workers] Starting {count} worker processes")
+    procs = [subprocess.Popen([sys.executable, "-m", "cli", "--shard", f"{i}/{count}", *argv],
+                              env=env)
+             for i in range(1, count + 1)]
+    status = 0
+    for i, proc in enumerate(procs, start=1):
+        while True:
+            try:
+                code = proc.wait()
+                break
+            except KeyboardInterrupt:
+                # Workers share the terminal and are interrupted as well
+                continue
+        if code:
+            log(f"[Workers] Worker {i}/{count} exited with status {code}")
+        status = max(status, code)
+    return status
+
+
+def _scan(args) -> None:
+    from core import jobs
+    from core.verify import scan_archive
+
+    store = jobs.get_job_store()
+    finished = store.finished()
+    log(f"[Scan] Checking {len(finished)} file(s)")
+    broken = scan_archive(finished, args.processes, args.hash)
+    for job, problem in broken:
+        log(f"    [Damaged] {job['username']} / {job['output_name']}: {problem}")
+        if args.requeue:
+            store.mark(job["id"], jobs.PENDING, problem)
+    log(f"[Scan] {len(broken)} damaged file(s)"
+        + (", queued again; run resume to download them" if args.requeue and broken else ""))
+
+
+def main(argv=None) -> int:
+    """Parse *argv*, run the requested command and return an exit code."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = _build_parser().parse_args(argv)
+
+    try:
+        load_config(args.config)
+    except yaml.YAMLError as e:
+        log(f"Invalid configuration file format: {e}")
+        return 1
+    shard = None
+    if args.shard:
+        from core.shards import Shard
+        try:
+            shard = Shard.parse(args.shard, args.shard_by)
+        except ValueError as e:
+            log(str(e))
+            return 1
+        if args.metrics_out:
+            root, ext = os.path.splitext(args.metrics_out)
+            args.metrics_out = f"{root}.{shard.index + 1}{ext}"
+    elif args.workers > 1 and args.command in ("purchased", "sync", "resume"):
+        return _run_workers(argv, args.workers)
+    # Shards run at the same time and must not share a trace file
+    trace_path = profiling.configure(cfg, f".{shard.index + 1}" if shard else "")
+    if trace_path:
+        log(f"[Profile] Writing trace to {trace_path}")
+
+    # Imported lazily: the downloader refuses to load without ffmpeg
+    from core.accounts import get_account
+    from core.downloader import download_purchased_contents
+
+    try:
+        account = get_account(args.account)
+    except KeyError as e:
+        log(e.args[0])
+        return 1
+
+    status = 0
+    try:
+        if args.command == "purchased":
+            download_purchased_contents(
+                target_dir=args.output or cfg.get("download_dir") or "downloads",
+                keyword=args.keyword,
+                month_filter=args.month,
+                dry_run=args.dry_run,
+                account=account,
+                shard=shard,
+            )
+        elif args.command == "sync":
+            _sync(args, account, shard)
+        elif args.command == "catalog" and args.catalog_command == "export":
+            _catalog_export(args, account)
+        elif args.command == "catalog":
+            _catalog_download(args, account)
+        elif args.command == "resume":
+            _resume(shard)
+        elif args.command == "dedup-report":
+            _dedup_report()
+        elif args.command == "scan":
+            _scan(args)
+    except KeyboardInterrupt:
+        log("[Cancelled] Interrupted by user.")
+        status = 130
+    finally:
+        if args.metrics_out:
+            metrics.dump(args.metrics_out, args.metrics_format)
+            log(f"[Metrics] Written to {args.metrics_out}")
+    return status
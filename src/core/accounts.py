@@ -0,0 +1,104 @@
+"""Account-scoped sessions for running several logins in one process.
+
+Each :class:`Account` owns its credentials, HTTP session (cookie jar and
+connection pool) and request rate limit. Functions in :mod:`core.api`,
+:mod:`core.downloader` and :mod:`core.sync` accept one through their
+``account`` argument; without it they use the global session and the
+credentials from ``config.yaml``.
+
+Additional accounts are listed under the ``accounts`` config key::
+
+    accounts:
+      - name: shop2
+        cookie: "..."
+        headers: {x-xsrf-token: "..."}   # merged over the global headers
+        rate_limit: 4                    # requests per second, optional
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from . import config
+from .config import Credentials, build_headers, cfg
+from .network import create_session
+
+_accounts: dict[str, "Account"] = {}
+_accounts_lock = threading.Lock()
+
+
+class Account:
+    """One logged-in user: credentials, HTTP session and rate limit."""
+
+    def __init__(self, name: str, headers: dict | None = None,
+                 rate_limit: float | None = None):
+        self.name = name
+        self.credentials = Credentials(label=name, reload=self._reload)
+        self.credentials.update(headers or {})
+        self.session = create_session()
+        self.rate_limit = rate_limit
+        self._throttle_lock = threading.Lock()
+        self._next_request = 0.0
+
+    def __repr__(self) -> str:
+        return f"Account({self.name!r})"
+
+    def throttle(self) -> None:
+        """Sleep as needed to keep requests under ``rate_limit`` per second."""
+        if not self.rate_limit:
+            return
+        with self._throttle_lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + 1.0 / self.rate_limit
+        if wait > 0:
+            time.sleep(wait)
+
+    def _reload(self) -> None:
+        """Pick up a new cookie for this account from an edited config.yaml."""
+        config.reload_if_config_changed()
+        entry = _config_entry(self.name)
+        if entry is None:
+            return
+        headers = _entry_headers(entry)
+        if headers != self.credentials.snapshot()[0]:
+            self.credentials.update(headers)
+
+
+def _config_entry(name: str) -> dict | None:
+    for entry in cfg.get("accounts") or []:
+        if entry.get("name") == name:
+            return entry
+    return None
+
+
+def _entry_headers(entry: dict) -> dict:
+    headers = dict(cfg.get("headers") or {})
+    headers.update(entry.get("headers") or {})
+    return build_headers(headers, entry.get("cookie"))
+
+
+def configured_accounts() -> list[str]:
+    """Return the names listed under the ``accounts`` config key."""
+    return [entry["name"] for entry in cfg.get("accounts") or [] if entry.get("name")]
+
+
+def get_account(name: str | None) -> Account | None:
+    """Return the :class:`Account` called *name*, creating it on first use.
+
+    An empty *name* means the default login from ``config.yaml`` and returns
+    None, which the request functions treat as the global session. Raises
+    ``KeyError`` for names missing from the ``accounts`` config key.
+    """
+    if not name:
+        return None
+    with _accounts_lock:
+        account = _accounts.get(name)
+        if account is None:
+            entry = _config_entry(name)
+            if entry is None:
+                raise KeyError(f"Unknown account: {name}")
+            account = Account(name, _entry_headers(entry), entry.get("rate_limit"))
+            _accounts[name] = account
+        return account
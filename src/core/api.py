@@ -1,10 +1,52 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import requests
+
+from . import profiling
+from .app_log import log as app_log
+from .jsonstream import JsonStream
 from .network import safe_get
-from .config import HEADERS, cfg
+from .config import cfg, headers_snapshot, state_dir
+
+USER_MINE_URL = "https://candfans.jp/api/user/get-user-mine"
+PURCHASED_CONTENTS_URL = "https://candfans.jp/api/contents/get-purchased-contents"
+
+# Keys that may carry the page count of a paged purchased-contents response
+PAGE_COUNT_KEYS = ("last_page", "total_pages", "page_count")
+DEFAULT_PURCHASED_PAGE_SIZE = 50
+DEFAULT_PURCHASED_PAGE_WORKERS = 4
+
+# Purchase months are Japanese calendar months
+try:
+    JST = ZoneInfo("Asia/Tokyo")
+except ZoneInfoNotFoundError:
+    # No time zone database (e.g. Windows without tzdata); Japan has no DST
+    JST = timezone(timedelta(hours=9), "JST")
+
+# Result of probing the purchased endpoint for paging, per _purchased_identity()
+_purchased_paging: dict = {}
+_purchased_paging_lock = threading.Lock()
+
+# (account name, credential generation, URL) -> key of the purchase history seen
+_purchased_identities: dict = {}
+_purchased_identities_lock = threading.Lock()
+
 
+def get_subscription_list(account=None):
+    """Fetch subscription list using configured base URL.
 
-def get_subscription_list():
-    """Fetch subscription list using configured base URL."""
-    resp = safe_get(cfg["base_url"], headers=HEADERS)
+    Every request function takes an optional *account*
+    (:class:`core.accounts.Account`) to act as that login instead of the
+    default one.
+    """
+    resp = safe_get(cfg["base_url"], endpoint="subscriptions", account=account)
     resp.raise_for_status()
     return resp.json()
 
@@ -18,10 +60,11 @@ def parse_subscription_list(resp_json):
     return subs
 
 
-def get_user_info_by_code(user_code):
+def get_user_info_by_code(user_code, account=None):
     """Retrieve user information by user_code."""
-    resp = safe_get(cfg["get_users_url"], headers=HEADERS,
-                    params={"user_code": user_code})
+    resp = safe_get(cfg["get_users_url"],
+                    params={"user_code": user_code}, endpoint="user_info",
+                    account=account)
     resp.raise_for_status()
     data = resp.json()
     user = data["data"]["user"]
@@ -32,17 +75,24 @@ def get_user_info_by_code(user_code):
     }
 
 
-def get_user_mine(headers=None):
-    """Retrieve information of the currently logged in user."""
+def get_user_mine(headers=None, account=None):
+    """Retrieve information of the currently logged in user.
+
+    Pass *headers* to check specific credentials; a 401 is then raised
+    immediately instead of waiting for a new login.
+    """
+    kwargs = {"headers": headers} if headers is not None else {}
     resp = safe_get(
-        "https://candfans.jp/api/user/get-user-mine",
-        headers=headers or HEADERS,
+        cfg.get("get_user_mine_url") or USER_MINE_URL,
+        endpoint="user_mine",
+        account=account,
+        **kwargs,
     )
     resp.raise_for_status()
     return resp.json()
 
 
-def get_timeline(user_id, page=1, record=12):
+def get_timeline(user_id, page=1, record=12, account=None):
     """Fetch timeline posts for a user."""
     params = {
         "user_id": user_id,
@@ -51,20 +101,307 @@ def get_timeline(user_id, page=1, record=12):
         "page": page,
         "post_type[0]": 1,
     }
-    resp = safe_get(cfg["get_timeline_url"], headers=HEADERS, params=params)
+    resp = safe_get(cfg["get_timeline_url"], params=params,
+                    endpoint="timeline", account=account)
     resp.raise_for_status()
     data = resp.json()
     return data.get("data", [])
 
 
-def get_purchased_contents():
+def get_purchased_contents(account=None):
     """Fetch purchased contents list."""
     resp = safe_get(
-        "https://candfans.jp/api/contents/get-purchased-contents", headers=HEADERS)
+        cfg.get("get_purchased_url") or PURCHASED_CONTENTS_URL,
+        endpoint="purchased", account=account)
     resp.raise_for_status()
     return resp.json()
 
 
+def _stream_purchased_contents(chunk_size=64 * 1024, account=None):
+    """Stream the unpaged purchased contents list, yielding items as they arrive.
+
+    The response body is parsed incrementally (see :mod:`core.jsonstream`),
+    so memory use does not grow with the purchase history.
+    """
+    resp = safe_get(
+        cfg.get("get_purchased_url") or PURCHASED_CONTENTS_URL,
+        stream=True, endpoint="purchased", account=account)
+    with resp:
+        resp.raise_for_status()
+        stream = JsonStream(resp.iter_content(chunk_size))
+        for key in stream.iter_object():
+            if key != "data" or stream.peek() != "{":
+                stream.value()
+                continue
+            for month_key in stream.iter_object():
+                if stream.peek() != "[":
+                    stream.value()
+                    continue
+                # Extract month from key like "2025年09月 購入履歴"
+                purchase_month = month_key.split()[0] if month_key.strip() else ""
+                for content in stream.iter_array():
+                    content["purchase_month"] = purchase_month
+                    yield content
+
+
+def _page_count(resp_json) -> int | None:
+    for container in (resp_json, resp_json.get("meta"), resp_json.get("pagination")):
+        if isinstance(container, dict):
+            for key in PAGE_COUNT_KEYS:
+                try:
+                    return int(container[key])
+                except (KeyError, TypeError, ValueError):
+                    pass
+    return None
+
+
+def get_purchased_page(page: int, record: int, account=None) -> tuple[list, int | None]:
+    """Fetch one page of purchased contents.
+
+    Returns the flattened items (see :func:`parse_purchased_contents`) and
+    the page count when the response reports one.
+    """
+    resp = safe_get(
+        cfg.get("get_purchased_url") or PURCHASED_CONTENTS_URL,
+        params={"page": page, "record": record}, endpoint="purchased_page",
+        account=account)
+    resp.raise_for_status()
+    data = resp.json()
+    return parse_purchased_contents(data), _page_count(data)
+
+
+def _probe_purchased_page(page: int, record: int, account=None) -> tuple[list, int | None, bool]:
+    """Read one page of purchased contents for :func:`discover_purchased_paging`.
+
+    The body is streamed and reading stops as soon as more than *record*
+    items arrive, i.e. when the endpoint ignores the paging parameters and
+    sends the whole history. Returns the items read, the page count if the
+    response reports one, and whether reading stopped early.
+    """
+    resp = safe_get(
+        cfg.get("get_purchased_url") or PURCHASED_CONTENTS_URL,
+        params={"page": page, "record": record}, stream=True, endpoint="purchased_page",
+        account=account)
+    items = []
+    meta = {}
+    with resp:
+        resp.raise_for_status()
+        stream = JsonStream(resp.iter_content(64 * 1024))
+        for key in stream.iter_object():
+            if key != "data" or stream.peek() != "{":
+                meta[key] = stream.value()
+                continue
+            for month_key in stream.iter_object():
+                if stream.peek() != "[":
+                    stream.value()
+                    continue
+                purchase_month = month_key.split()[0] if month_key.strip() else ""
+                for content in stream.iter_array():
+                    content["purchase_month"] = purchase_month
+                    items.append(content)
+                    if len(items) > record:
+                        return items, None, True
+    return items, _page_count(meta), False
+
+
+def discover_purchased_paging(account=None) -> dict | None:
+    """Return ``{"record": n}`` if the purchased endpoint honours paging.
+
+    The endpoint is probed once per process for each server and login (see
+    :func:`_purchased_identity`) with ``page``/``record`` parameters: a
+    reported page count, or a full first page followed by a different
+    second page, means paging works. The probe stops reading after
+    ``record + 1`` items, so an endpoint that ignores paging costs one
+    partial response. ``purchased_paging: false`` skips the probe.
+    """
+    if cfg.get("purchased_paging") is False:
+        return None
+    key = _purchased_identity(account)
+    # Not held across the probe: a slow account must not hold up the others
+    with _purchased_paging_lock:
+        paging = _purchased_paging.get(key)
+    if paging is None:
+        record = int(cfg.get("purchased_page_size") or DEFAULT_PURCHASED_PAGE_SIZE)
+        first, pages, truncated = _probe_purchased_page(1, record, account)
+        if truncated:
+            paging = False
+        elif pages is not None or len(first) < record:
+            paging = {"record": record}
+        else:
+            second, _, truncated = _probe_purchased_page(2, record, account)
+            paging = {"record": record} if second and not truncated and second != first else False
+        with _purchased_paging_lock:
+            paging = _purchased_paging.setdefault(key, paging)
+    return paging or None
+
+
+def _purchased_identity(account=None) -> str:
+    """Return a key for the purchase history that *account* sees.
+
+    It combines the purchased-contents URL with the logged-in user (the id
+    from :func:`get_user_mine`, or a hash of the cookie if that fails), so
+    cached months never carry over to another login or server. It is
+    worked out again whenever the credentials change.
+    """
+    if account is not None:
+        headers, generation = account.credentials.snapshot()
+    else:
+        headers, generation = headers_snapshot()
+    url = cfg.get("get_purchased_url") or PURCHASED_CONTENTS_URL
+    slot = (account.name if account is not None else "", generation, url)
+    with _purchased_identities_lock:
+        key = _purchased_identities.get(slot)
+    if key is not None:
+        return key
+    try:
+        user = get_user_mine(headers=headers, account=account)["data"]["users"][0]
+        who = str(user.get("id") or user.get("user_code") or user["username"])
+    except (requests.RequestException, ValueError, LookupError, TypeError):
+        cookie = next((v for k, v in headers.items() if k.lower() == "cookie"), "")
+        who = "cookie:" + hashlib.sha256(cookie.encode("utf-8")).hexdigest()
+    key = hashlib.sha256(f"{url}\n{who}".encode("utf-8")).hexdigest()[:16]
+    with _purchased_identities_lock:
+        _purchased_identities[slot] = key
+    return key
+
+
+def _purchased_cache_path(account=None) -> str:
+    path = cfg.get("purchased_cache") or os.path.join(state_dir(), "purchased_cache.json")
+    if account is not None:
+        # Purchase histories differ per login
+        base, ext = os.path.splitext(path)
+        path = f"{base}-{account.name}{ext}"
+    return path
+
+
+def _load_purchased_cache(key: str, account=None) -> tuple[dict, str | None]:
+    """Return the cached months and the month the cache is complete up to.
+
+    Nothing is returned if the cache belongs to another *key*.
+    """
+    try:
+        with open(_purchased_cache_path(account), encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("key") == key:
+            return data.get("months", {}), data.get("complete")
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {}, None
+
+
+def _save_purchased_cache(months: dict, key: str, account=None, complete: str | None = None) -> None:
+    path = _purchased_cache_path(account)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # A private temporary file: worker processes may save at the same time
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                               dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "months": months, "complete": complete}, f,
+                      ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _iter_purchased_pages(record: int, account=None):
+    """Yield purchased items page by page, newest first, using the month cache.
+
+    Months before the current one (in Japan time) cannot change, so they
+    are cached on disk as soon as they are fully fetched, for this server
+    and user (see :func:`_purchased_identity`); a run stopped early keeps
+    the months it finished. Cached months are served from the cache, and
+    paging stops at the first page made up only of months the cache holds
+    completely, i.e. along with every older month.
+    """
+    key = _purchased_identity(account)
+    cache, complete = _load_purchased_cache(key, account)
+    saved = dict(cache)  # the cache on disk, with the months closed since
+    current_month = datetime.now(JST).strftime("%Y年%m月")
+    workers = max(int(cfg.get("purchased_page_workers") or DEFAULT_PURCHASED_PAGE_WORKERS), 1)
+    fetched: dict = {}  # purchase_month -> items, for months not in the cache
+    served: set = set()  # cached months already yielded
+    last_month = None
+
+    def close(months, finished=False):
+        nonlocal complete
+        closed = {m: fetched[m] for m in months
+                  if m and m < current_month and m in fetched and m not in saved}
+        saved.update(closed)
+        # A run that got to the end has seen (or had cached) every older month
+        reached = max(saved) if finished and saved else complete
+        if not closed and reached == complete:
+            return
+        complete = reached
+        try:
+            _save_purchased_cache(saved, key, account, complete)
+        except OSError as e:
+            app_log(f"[Warning] Could not save the purchase month cache: {e}")
+
+    page = 1
+    last_page = None
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="purchased") as pool:
+        done = False
+        while not done:
+            # The first page alone tells us the page count, if any
+            count = 1 if page == 1 else workers
+            if last_page is not None:
+                count = min(count, last_page - page + 1)
+            if count <= 0:
+                break
+            numbers = range(page, page + count)
+            for items, pages in pool.map(lambda n: get_purchased_page(n, record, account), numbers):
+                page += 1
+                if pages is not None:
+                    last_page = pages
+                months = {c.get("purchase_month", "") for c in items}
+                if complete and months and max(months) <= complete:
+                    done = True
+                    break
+                for content in items:
+                    month = content.get("purchase_month", "")
+                    if month != last_month:
+                        # Items come newest first: the previous month is complete
+                        if last_month is not None:
+                            close([last_month])
+                        last_month = month
+                    if month in cache:
+                        if month not in served:
+                            served.add(month)
+                            yield from cache[month]
+                        continue
+                    fetched.setdefault(month, []).append(content)
+                    yield content
+                if len(items) < record:
+                    done = True
+                    break
+    close(list(fetched), finished=True)
+
+    for month in sorted(cache, reverse=True):
+        if month not in served:
+            yield from cache[month]
+
+
+def iter_purchased_contents(account=None):
+    """Yield purchased contents, each with a ``purchase_month`` field.
+
+    Uses paged, cached retrieval when the endpoint supports it (see
+    :func:`discover_purchased_paging`) and otherwise streams the full list.
+    Items are not copied.
+    """
+    paging = discover_purchased_paging(account)
+    if paging:
+        yield from _iter_purchased_pages(paging["record"], account)
+    else:
+        yield from _stream_purchased_contents(account=account)
+
+
+@profiling.traced("parse_purchased_contents", "parse")
 def parse_purchased_contents(resp_json):
     """Parse purchased contents JSON into a flattened list.
 
@@ -82,9 +419,8 @@ def parse_purchased_contents(resp_json):
         purchase_month = month_key.split()[0]  # "2025年09月"
 
         for content in contents_list:
-            # Add purchase month to each content item
-            content_with_month = content.copy()
-            content_with_month["purchase_month"] = purchase_month
-            all_contents.append(content_with_month)
+            # Items are not shared with anything else, so tag them in place
+            content["purchase_month"] = purchase_month
+            all_contents.append(content)
 
     return all_contents
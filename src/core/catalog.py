@@ -0,0 +1,219 @@
+"""Fetched catalogs saved to disk: timelines and purchased contents.
+
+A catalog is a single SQLite file with one row per post and one per
+attachment, holding the columns the downloader and the post lists need, plus
+the original API item compressed for anything else. Opening a catalog reads
+nothing up front; :meth:`Catalog.iter_posts` streams rows from a memory-mapped
+database, so large catalogs load quickly and can feed the download queue
+(see :func:`Catalog.jobs`) or be queried directly with any SQLite tool.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+SOURCES = ("subscription", "purchased")
+
+# Bytes of the database file mapped into memory
+MMAP_SIZE = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS creators (
+    user_code TEXT PRIMARY KEY,
+    username TEXT NOT NULL DEFAULT '',
+    user_id TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    user_code TEXT NOT NULL DEFAULT '',
+    username TEXT NOT NULL DEFAULT '',
+    post_id TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    month TEXT NOT NULL DEFAULT '',
+    price TEXT NOT NULL DEFAULT '',
+    raw BLOB,
+    fetched REAL NOT NULL,
+    UNIQUE (source, username, post_id)
+);
+CREATE INDEX IF NOT EXISTS posts_user ON posts (source, username);
+CREATE TABLE IF NOT EXISTS attachments (
+    post INTEGER NOT NULL REFERENCES posts (id) ON DELETE CASCADE,
+    n INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    url_type TEXT NOT NULL,
+    PRIMARY KEY (post, n)
+) WITHOUT ROWID;
+"""
+
+
+def _url_type(url: str) -> str:
+    # Imported lazily: the downloader refuses to load without ffmpeg
+    from .downloader import infer_url_type
+    return infer_url_type(url)
+
+
+class Catalog:
+    """Thread-safe catalog file (see module docstring)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add_creators(self, creators: list[dict]) -> None:
+        """Record creator dicts (``user_code``, ``username``, ``user_id``)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """INSERT INTO creators (user_code, username, user_id) VALUES (?, ?, ?)
+                   ON CONFLICT (user_code) DO UPDATE SET
+                       username = excluded.username, user_id = excluded.user_id""",
+                [(c["user_code"], c.get("username", ""), str(c.get("user_id", "")))
+                 for c in creators])
+
+    def add_posts(self, source: str, posts: list[dict], creator: dict | None = None) -> int:
+        """Store *posts* (API items) of *source*; return how many were written.
+
+        Timeline posts need the *creator* they belong to; purchased contents
+        carry ``username`` and ``purchase_month`` themselves. Posts already in
+        the catalog are replaced.
+        """
+        if source not in SOURCES:
+            raise ValueError(f"Unknown catalog source: {source}")
+        now = time.time()
+        with self._lock, self._conn:
+            for post in posts:
+                username = creator["username"] if creator else post.get("username", "")
+                month = post.get("month") if source == "subscription" else post.get("purchase_month")
+                raw = zlib.compress(json.dumps(post, ensure_ascii=False).encode("utf-8"))
+                post_id = str(post.get("post_id", ""))
+                self._conn.execute(
+                    """INSERT INTO posts (source, user_code, username, post_id, title, month,
+                                          price, raw, fetched)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (source, username, post_id) DO UPDATE SET
+                           title = excluded.title, month = excluded.month,
+                           price = excluded.price, raw = excluded.raw,
+                           fetched = excluded.fetched""",
+                    (source, creator.get("user_code", "") if creator else "", username,
+                     post_id, post.get("title") or "", month or "",
+                     str(post.get("price") or ""), raw, now))
+                row = self._conn.execute(
+                    "SELECT id FROM posts WHERE source = ? AND username = ? AND post_id = ?",
+                    (source, username, post_id)).fetchone()
+                self._conn.execute("DELETE FROM attachments WHERE post = ?", (row[0],))
+                urls = [a.get("default") for a in post.get("attachments") or [] if a.get("default")]
+                self._conn.executemany(
+                    "INSERT INTO attachments (post, n, url, url_type) VALUES (?, ?, ?, ?)",
+                    [(row[0], n, url, _url_type(url)) for n, url in enumerate(urls)])
+        return len(posts)
+
+    def creators(self) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_code, username, user_id FROM creators ORDER BY username").fetchall()
+        return [dict(r) for r in rows]
+
+    def count(self, source: str | None = None) -> int:
+        with self._lock:
+            if source:
+                return self._conn.execute(
+                    "SELECT COUNT(*) FROM posts WHERE source = ?", (source,)).fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def iter_posts(self, source: str | None = None, username: str | None = None,
+                   batch: int = 1000):
+        """Yield posts as light dicts, in the catalog's order.
+
+        Each dict has ``source``, ``user_code``, ``username``, ``post_id``,
+        ``title``, ``month`` (``purchase_month`` for purchased contents, too),
+        ``price`` and ``attachments`` (``[{"default": url}]``), which is what
+        the post lists and :func:`core.downloader.build_post_jobs` use. The
+        original API item is available from :meth:`raw`.
+        """
+        where, params = [], []
+        if source:
+            where.append("p.source = ?")
+            params.append(source)
+        if username:
+            where.append("p.username = ?")
+            params.append(username)
+        sql = f"""SELECT p.id, p.source, p.user_code, p.username, p.post_id, p.title,
+                         p.month, p.price, a.url
+                  FROM posts p LEFT JOIN attachments a ON a.post = p.id
+                  {"WHERE " + " AND ".join(where) if where else ""}
+                  ORDER BY p.id, a.n"""
+        # A private connection keeps the cursor independent of writers
+        conn = sqlite3.connect(self.path)
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        try:
+            cur = conn.execute(sql, params)
+            post = None
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                for rowid, src, user_code, username, post_id, title, month, price, url in rows:
+                    if post is None or post["id"] != rowid:
+                        if post is not None:
+                            yield post
+                        post = {"id": rowid, "source": src, "user_code": user_code,
+                                "username": username, "post_id": post_id, "title": title,
+                                "month": month, "price": price, "attachments": []}
+                        if src == "purchased":
+                            post["purchase_month"] = month
+                    if url is not None:
+                        post["attachments"].append({"default": url})
+            if post is not None:
+                yield post
+        finally:
+            conn.close()
+
+    def raw(self, post: dict) -> dict:
+        """Return the original API item of a post from :meth:`iter_posts`."""
+        with self._lock:
+            row = self._conn.execute("SELECT raw FROM posts WHERE id = ?", (post["id"],)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row and row[0] else {}
+
+    def jobs(self, download_dir: str, source: str | None = None, url_types=None,
+             keyword: str = "", month: str = "", account: str = "") -> list[dict]:
+        """Return download jobs for the catalog's posts matching the filters.
+
+        *account* is the name recorded on the jobs, i.e. the login that
+        downloads them.
+        """
+        from .downloader import build_post_jobs
+
+        jobs = []
+        for post in self.iter_posts(source):
+            if keyword and keyword not in post["title"]:
+                continue
+            if month and post["month"] != month:
+                continue
+            jobs += [job for job in build_post_jobs(
+                         post["source"], post["username"], post["post_id"], post["title"],
+                         post["attachments"], download_dir, account, post["month"])
+                     if not url_types or job["url_type"] in url_types]
+        return jobs
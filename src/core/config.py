@@ -1,6 +1,8 @@
 import copy
 import os
 import sys
+import threading
+import time
 from importlib import metadata
 from pathlib import Path
 
@@ -12,6 +14,98 @@ from .app_log import log
 cfg: dict = {}
 HEADERS: dict = {}
 
+# Config file last loaded or saved, watched while waiting for credentials
+_config_file: str | None = None
+_config_mtime: float | None = None
+
+# Seconds between checks of config.yaml while waiting for new credentials
+CREDENTIALS_POLL_INTERVAL = 2.0
+
+
+class Credentials:
+    """Request headers of one login plus the expired-session gate.
+
+    Updates replace the headers atomically with respect to :meth:`snapshot`
+    and bump a generation counter. Requests rejected as unauthorised call
+    :meth:`wait` with the generation they were sent with and resume once
+    newer credentials are set.
+    """
+
+    def __init__(self, headers: dict | None = None, label: str = "", reload=None):
+        self.headers = headers if headers is not None else {}
+        self.label = label
+        # Called periodically while waiting, to pick up edited credentials
+        self.reload = reload
+        # Re-entrant so reload() may update the credentials while waiting
+        self._cond = threading.Condition(threading.RLock())
+        self._generation = 0
+        self._expired = False
+        # Generation whose waiters were told to give up (see release())
+        self._released = -1
+        self._listeners: list = []
+
+    def update(self, headers: dict) -> None:
+        """Replace the headers and release waiting requests."""
+        with self._cond:
+            self.headers.clear()
+            self.headers.update(headers)
+            self._generation += 1
+            self._expired = False
+            self._cond.notify_all()
+
+    def snapshot(self) -> tuple[dict, int]:
+        """Return a copy of the headers and the generation they belong to."""
+        with self._cond:
+            return dict(self.headers), self._generation
+
+    def add_listener(self, callback) -> None:
+        """Call *callback()* (from a worker thread) when the session expires."""
+        self._listeners.append(callback)
+
+    def release(self) -> None:
+        """Fail requests rejected with the current headers instead of waiting.
+
+        Applies until new credentials are set.
+        """
+        with self._cond:
+            self._released = self._generation
+            self._cond.notify_all()
+
+    def wait(self, generation: int, timeout: float | None = None) -> bool:
+        """Block until credentials newer than *generation* are set.
+
+        The first caller for a generation notifies the listeners. Returns
+        False on *timeout* or after :meth:`release`.
+        """
+        with self._cond:
+            if self._generation != generation:
+                return True
+            if self._released == generation:
+                return False
+            first = not self._expired
+            self._expired = True
+        if first:
+            who = f" for {self.label}" if self.label else ""
+            log(f"[Session] Credentials{who} were rejected; requests are paused until "
+                "you log in again or update the cookie in config.yaml")
+            for callback in list(self._listeners):
+                try:
+                    callback()
+                except Exception as e:
+                    log(e)
+        deadline = None if not timeout else time.monotonic() + timeout
+        with self._cond:
+            while self._generation == generation and self._released != generation:
+                wait = CREDENTIALS_POLL_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                self._cond.wait(wait)
+                if self.reload is not None:
+                    self.reload()
+            return self._generation != generation
+
 
 def _default_config_path() -> Path:
     """Return the default config.yaml location."""
@@ -26,6 +120,11 @@ def _default_config_path() -> Path:
     return Path(__file__).resolve().parents[2] / "config.yaml"
 
 
+def state_dir() -> Path:
+    """Return the directory holding config.yaml and other persistent state."""
+    return _default_config_path().parent
+
+
 def load_config(path: str | None = None) -> dict:
     """Load configuration from *path* and refresh HEADERS.
 
@@ -71,6 +170,7 @@ def load_config(path: str | None = None) -> dict:
 
     with open(cfg_path, "r", encoding="utf-8") as f:
         data = yaml.safe_load(f)
+    _remember_config_file(cfg_path)
     cfg.clear()
     if data:
         cfg.update(data)
@@ -86,19 +186,84 @@ def save_config(config: dict, path: str | None = None) -> None:
     out_path.parent.mkdir(parents=True, exist_ok=True)
     with open(out_path, "w", encoding="utf-8") as f:
         yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    _remember_config_file(out_path)
     cfg.clear()
     cfg.update(config)
     refresh_headers_from_cfg()
 
 
-def refresh_headers_from_cfg() -> None:
-    """Refresh HEADERS using values from global cfg."""
-    HEADERS.clear()
-    headers = copy.deepcopy(cfg.get("headers", {})) if cfg else {}
-    cookie = cfg.get("cookie") if cfg else None
+def _remember_config_file(path: Path) -> None:
+    global _config_file, _config_mtime
+    _config_file = str(path)
+    try:
+        _config_mtime = os.path.getmtime(path)
+    except OSError:
+        _config_mtime = None
+
+
+def build_headers(headers: dict | None, cookie: str | None) -> dict:
+    """Return request headers from a ``headers`` mapping and a cookie string."""
+    out = copy.deepcopy(headers or {})
     if cookie:
-        headers["Cookie"] = cookie
-    HEADERS.update(headers)
+        out["Cookie"] = cookie
+    return out
+
+
+def refresh_headers_from_cfg() -> None:
+    """Refresh HEADERS using values from global cfg.
+
+    The new headers replace the old ones atomically with respect to
+    :func:`get_headers`, and requests waiting for new credentials (see
+    :meth:`Credentials.wait`) are released.
+    """
+    _credentials.update(build_headers(cfg.get("headers"), cfg.get("cookie")))
+
+
+def get_headers() -> dict:
+    """Return a private copy of the current request headers."""
+    return _credentials.snapshot()[0]
+
+
+def headers_snapshot() -> tuple[dict, int]:
+    """Return a copy of the headers and the generation they belong to."""
+    return _credentials.snapshot()
+
+
+def default_credentials() -> Credentials:
+    """Return the :class:`Credentials` backing HEADERS."""
+    return _credentials
+
+
+def add_credentials_expired_listener(callback) -> None:
+    """Call *callback()* (from a worker thread) when the session expires."""
+    _credentials.add_listener(callback)
+
+
+def release_credential_waiters() -> None:
+    """Fail requests rejected with the current credentials instead of waiting.
+
+    Applies until new credentials are loaded.
+    """
+    _credentials.release()
+
+
+def reload_if_config_changed() -> None:
+    """Reload the config file if it was modified since it was last read."""
+    if not _config_file:
+        return
+    try:
+        mtime = os.path.getmtime(_config_file)
+    except OSError:
+        return
+    if mtime != _config_mtime:
+        try:
+            load_config(_config_file)
+            log("[Session] Reloaded credentials from " + _config_file)
+        except (OSError, yaml.YAMLError) as e:
+            log(f"[Session] Could not reload {_config_file}: {e}")
+
+
+_credentials = Credentials(HEADERS, reload=reload_if_config_changed)
 
 
 def check_requirements(req_file: str = "requirements.txt") -> bool:
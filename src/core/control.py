@@ -0,0 +1,380 @@
+"""Pause and cancel for single jobs of a running batch.
+
+A batch is controlled by two events, as everywhere in the downloader: a
+pause event (set while running) and a cancel event. :class:`JobControls`
+adds a :class:`JobControl` per job on top of them, so one post can be
+paused or cancelled while the rest of the batch carries on. A job control
+exposes ``pause_event`` and ``cancel_event`` objects that behave like
+``threading.Event`` and combine the job's state with the batch's, so they
+are passed to :func:`core.downloader.download_job` and friends unchanged.
+
+The job controls of a batch share one condition variable, notified when a
+job is paused, resumed or cancelled. Batch events created as
+:class:`BatchEvent` notify it as well, so waiters wake as soon as anything
+changes; plain ``threading.Event`` objects still work but are only checked
+every :data:`POLL_INTERVAL` seconds.
+
+A job cancelled on its own is marked ``cancelled`` in the job store, so a
+later resume does not bring it back; jobs cancelled with their whole batch
+stay ``pending`` to be resumed.
+
+Each job also keeps the FFmpeg processes it started (through its
+``on_ffmpeg`` callback), so cancelling a job terminates exactly its own
+processes, however many jobs are running.
+
+A runner that hands jobs out one at a time (see :meth:`JobControls.run`)
+moves a job that gets paused to the background and starts the next one;
+jobs paused before they start are held back until they are resumed.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import weakref
+
+from . import jobs as jobstore
+from .ffmpeg import terminate
+
+# Seconds between checks of batch events that are not a BatchEvent
+POLL_INTERVAL = 0.2
+
+
+class BatchEvent(threading.Event):
+    """``threading.Event`` for a batch's pause or cancel state.
+
+    Setting or clearing it also wakes the waiters of the job controls
+    combined with it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._watchers = weakref.WeakSet()
+        self._watchers_lock = threading.Lock()
+
+    def watch(self, cond: threading.Condition) -> None:
+        """Notify *cond* whenever the event is set or cleared."""
+        with self._watchers_lock:
+            self._watchers.add(cond)
+
+    def set(self) -> None:
+        super().set()
+        self._notify()
+
+    def clear(self) -> None:
+        super().clear()
+        self._notify()
+
+    def _notify(self) -> None:
+        with self._watchers_lock:
+            watchers = list(self._watchers)
+        for cond in watchers:
+            with cond:
+                cond.notify_all()
+
+
+def _wait_for(cond: threading.Condition, predicate, timeout: float | None, poll: bool) -> bool:
+    """``cond.wait_for(predicate, timeout)``, checking every POLL_INTERVAL if *poll*."""
+    if not poll:
+        with cond:
+            return cond.wait_for(predicate, timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with cond:
+        while not predicate():
+            remaining = POLL_INTERVAL if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            cond.wait(min(remaining, POLL_INTERVAL))
+        return predicate()
+
+
+def _needs_polling(*events) -> bool:
+    return any(e is not None and not isinstance(e, BatchEvent) for e in events)
+
+
+class _PauseView:
+    """Event-like view that is set while neither job nor batch is paused."""
+
+    def __init__(self, control: "JobControl"):
+        self._control = control
+
+    def is_set(self) -> bool:
+        return not self._control.paused
+
+    def wait(self, timeout: float | None = None) -> bool:
+        # Also returns on cancel, so a paused download notices it
+        control = self._control
+        _wait_for(control.cond, lambda: not control.paused or control.cancelled,
+                  timeout, control.polled)
+        return self.is_set()
+
+
+class _CancelView:
+    """Event-like view that is set once the job or its batch is cancelled."""
+
+    def __init__(self, control: "JobControl"):
+        self._control = control
+
+    def is_set(self) -> bool:
+        return self._control.cancelled
+
+    def wait(self, timeout: float | None = None) -> bool:
+        control = self._control
+        return _wait_for(control.cond, lambda: control.cancelled, timeout, control.polled)
+
+
+class JobControl:
+    """Pause and cancel state of one *job* within its batch.
+
+    *cond* is notified on every change; it is shared by the controls of a
+    batch (see :class:`JobControls`).
+    """
+
+    def __init__(self, job: dict, batch_pause=None, batch_cancel=None, cond=None):
+        self.job = job
+        self._batch_pause = batch_pause
+        self._batch_cancel = batch_cancel
+        self.cond = cond if cond is not None else threading.Condition(threading.RLock())
+        for event in (batch_pause, batch_cancel):
+            if isinstance(event, BatchEvent):
+                event.watch(self.cond)
+        self.polled = _needs_polling(batch_pause, batch_cancel)
+        self._paused = False
+        self._cancelled = False
+        self._procs: set = set()
+        self._lock = threading.Lock()
+        self.started = False
+        self._alone = False
+        self.pause_event = _PauseView(self)
+        self.cancel_event = _CancelView(self)
+
+    @property
+    def paused(self) -> bool:
+        """True while the job itself or the whole batch is paused."""
+        return self._paused or (
+            self._batch_pause is not None and not self._batch_pause.is_set())
+
+    @property
+    def held(self) -> bool:
+        """True while the job itself (not just the batch) is paused."""
+        return self._paused
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or (
+            self._batch_cancel is not None and self._batch_cancel.is_set())
+
+    @property
+    def cancelled_alone(self) -> bool:
+        """True if the job itself was cancelled while its batch was not."""
+        return self._alone
+
+    def pause(self) -> None:
+        with self.cond:
+            self._paused = True
+            self.cond.notify_all()
+
+    def resume(self) -> None:
+        with self.cond:
+            self._paused = False
+            self.cond.notify_all()
+
+    def cancel(self) -> None:
+        """Cancel the job and terminate the FFmpeg processes it runs."""
+        with self.cond:
+            if not self.cancelled:
+                self._alone = True
+            self._cancelled = True
+            self.cond.notify_all()
+        self.terminate()
+
+    def on_ffmpeg(self, proc) -> None:
+        """``on_ffmpeg`` callback: track *proc*, or forget finished ones."""
+        with self._lock:
+            if proc is None:
+                self._procs = {p for p in self._procs if p.poll() is None}
+            else:
+                self._procs.add(proc)
+
+    def terminate(self) -> None:
+        """Terminate the job's FFmpeg processes (in the background)."""
+        with self._lock:
+            procs, self._procs = list(self._procs), set()
+        for proc in procs:
+            # terminate() waits for the process to exit; keep the caller free
+            threading.Thread(target=terminate, args=(proc,), daemon=True).start()
+
+
+class JobControls:
+    """The :class:`JobControl` of every job of one batch.
+
+    *pause_event* and *cancel_event* are the batch's events (preferably
+    :class:`BatchEvent`); they apply to every job on top of the job's own
+    state. Jobs cancelled on their own are recorded in *store*.
+    """
+
+    def __init__(self, pause_event=None, cancel_event=None, store=None):
+        self.pause_event = pause_event
+        self.cancel_event = cancel_event
+        self.store = store
+        self._controls: dict = {}   # job id -> JobControl
+        self._held: dict = {}       # job id -> job paused before it started
+        self._resumed: list = []    # held jobs resumed since the last take_resumed()
+        self._background: set = set()
+        # Shared with every JobControl of the batch
+        self._cond = threading.Condition(threading.RLock())
+        for event in (pause_event, cancel_event):
+            if isinstance(event, BatchEvent):
+                event.watch(self._cond)
+        self._polled = _needs_polling(pause_event, cancel_event)
+
+    def get(self, job: dict) -> JobControl:
+        """Return the control of *job*, creating it on first use."""
+        with self._cond:
+            control = self._controls.get(job["id"])
+            if control is None:
+                control = JobControl(job, self.pause_event, self.cancel_event, self._cond)
+                self._controls[job["id"]] = control
+            return control
+
+    def add(self, jobs) -> None:
+        """Register *jobs*, so they can be paused or cancelled before they start."""
+        for job in jobs:
+            self.get(job)
+
+    def _select(self, match) -> list[JobControl]:
+        with self._cond:
+            return [c for c in self._controls.values() if match(c.job)]
+
+    def pause(self, match) -> int:
+        """Pause the jobs for which *match(job)* is true; return how many."""
+        controls = self._select(match)
+        for control in controls:
+            control.pause()
+        return len(controls)
+
+    def resume(self, match) -> int:
+        """Resume the jobs for which *match(job)* is true; return how many."""
+        controls = self._select(match)
+        with self._cond:
+            for control in controls:
+                control.resume()
+                item = self._held.pop(control.job["id"], None)
+                if item is not None:
+                    self._resumed.append(item)
+            self._cond.notify_all()
+        return len(controls)
+
+    def cancel(self, match) -> int:
+        """Cancel the jobs for which *match(job)* is true; return how many.
+
+        Jobs that have not started are marked ``cancelled`` right away; the
+        runner records the others with :meth:`record_cancelled`.
+        """
+        controls = self._select(match)
+        with self._cond:
+            for control in controls:
+                control.cancel()
+                self._held.pop(control.job["id"], None)
+            self._cond.notify_all()
+        for control in controls:
+            if not control.started:
+                self.record_cancelled(control, [control.job])
+        return len(controls)
+
+    def record_cancelled(self, control: JobControl, jobs) -> None:
+        """Mark the unfinished *jobs* cancelled if *control* was cancelled alone."""
+        if self.store is None or not control.cancelled_alone:
+            return
+        for job in jobs:
+            current = self.store.get(job["id"])
+            if current is not None and current["state"] not in (jobstore.DONE,
+                                                                 jobstore.CANCELLED):
+                self.store.mark(job["id"], jobstore.CANCELLED)
+
+    def terminate_all(self) -> None:
+        """Terminate the FFmpeg processes of every job (on batch cancel)."""
+        for control in self._select(lambda job: True):
+            control.terminate()
+
+    def hold(self, job: dict, item=None) -> None:
+        """Set aside a paused *job* that has not started yet.
+
+        *item* (default: *job*) comes back from :meth:`take_resumed` once
+        the job is resumed, e.g. the list of images *job* heads.
+        """
+        with self._cond:
+            self._held[job["id"]] = job if item is None else item
+            # The job may have been resumed meanwhile
+            if not self.get(job).held:
+                self._resumed.append(self._held.pop(job["id"]))
+            self._cond.notify_all()
+
+    def take_resumed(self) -> list:
+        """Return (and forget) the held items resumed since the last call."""
+        with self._cond:
+            jobs, self._resumed = self._resumed, []
+            return jobs
+
+    def run(self, job: dict, fn) -> bool:
+        """Run ``fn(control)`` for *job* on a thread and wait for it.
+
+        Returns True once it finished, re-raising its exception, or False as
+        soon as the job itself is paused: it then finishes in the
+        background, and *fn* must report its own outcome. Pausing the
+        whole batch does not move a job to the background.
+        """
+        control = self.get(job)
+        control.started = True
+        finished = threading.Event()
+        error = []
+
+        def target():
+            try:
+                fn(control)
+            except BaseException as e:
+                error.append(e)
+            finally:
+                with self._cond:
+                    finished.set()
+                    self._background.discard(thread)
+                    self._cond.notify_all()
+
+        thread = threading.Thread(target=target, name=f"job-{job['id']}", daemon=True)
+        thread.start()
+        with self._cond:
+            # Woken by the job finishing or by pause() (see JobControl)
+            self._cond.wait_for(lambda: finished.is_set() or control.held)
+            if not finished.is_set():
+                self._background.add(thread)
+                return False
+        if error:
+            raise error[0]
+        return True
+
+    def wait_for_work(self) -> list:
+        """Block while paused jobs remain; return the next resumed held items.
+
+        Returns an empty list when nothing is left: no held jobs, no jobs
+        running in the background, or the batch was cancelled. Jobs running
+        in the background are waited for first (see :meth:`wait_background`),
+        so the batch is over once this returns an empty list.
+        """
+        with self._cond:
+            while True:
+                if self._resumed:
+                    items, self._resumed = self._resumed, []
+                    return items
+                cancelled = self.cancel_event is not None and self.cancel_event.is_set()
+                if not self._background and (cancelled or not self._held):
+                    return []
+                self._cond.wait(POLL_INTERVAL if self._polled else None)
+
+    def wait_background(self) -> None:
+        """Wait until the jobs moved to the background have finished.
+
+        Runners call it before reporting the batch over, e.g. after the
+        batch was cancelled.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._background)
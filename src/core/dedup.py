@@ -0,0 +1,228 @@
+"""Deduplication of downloaded media across creators and purchases.
+
+The same attachment can appear in a creator timeline and in the purchased
+contents, where it is saved under a different name. Every finished download is
+recorded in a small SQLite index keyed by the normalised media URL path (CDN
+query strings are signed and change between fetches) and by the SHA-256 of the
+file. A job whose URL was already downloaded is linked to the existing file
+instead of being fetched again; a freshly downloaded file whose content
+matches an earlier one is replaced by a link to it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from . import metrics
+from .config import cfg, state_dir
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    url_key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_sha256 ON media (sha256);
+CREATE TABLE IF NOT EXISTS savings (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+HASH_CHUNK = 1024 * 1024
+
+
+def url_key(url: str) -> str:
+    """Return *url* reduced to host and path, without the signed query."""
+    parts = urlparse(url)
+    return f"{parts.netloc.lower()}{parts.path}"
+
+
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 digest of the file at *path*."""
+    digest = hashlib.sha256()
+    buf = bytearray(HASH_CHUNK)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def link_file(source: str, dest: str, allow_copy: bool = True) -> str | None:
+    """Make *dest* refer to the content of *source*.
+
+    A hard link is tried first, then a copy (``shutil.copyfile`` uses
+    ``copy_file_range`` where available, which reflinks on CoW filesystems).
+    ``dedup_link: copy`` skips the hard link; *allow_copy* False disables the
+    copy. Returns ``"hardlink"``, ``"copy"`` or ``None`` on failure; an
+    existing *dest* is replaced atomically.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp = f"{dest}.dedup-{os.getpid()}-{threading.get_ident()}"
+    methods = ["copy"] if cfg.get("dedup_link") == "copy" else ["hardlink", "copy"]
+    if not allow_copy:
+        methods = [m for m in methods if m != "copy"]
+    for method in methods:
+        try:
+            if method == "hardlink":
+                os.link(source, tmp)
+            else:
+                shutil.copyfile(source, tmp)
+            os.replace(tmp, dest)
+            return method
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return None
+
+
+class MediaIndex:
+    """Thread-safe SQLite index of downloaded media."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _valid(self, row) -> str | None:
+        """Return the row's path if the file is still there unchanged."""
+        if row is None:
+            return None
+        path, size = row
+        try:
+            return path if os.path.getsize(path) == size else None
+        except OSError:
+            return None
+
+    def find_url(self, url: str) -> str | None:
+        """Return an existing download of *url*, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size FROM media WHERE url_key = ?", (url_key(url),)).fetchone()
+        return self._valid(row)
+
+    def find_hash(self, sha256: str, exclude: str) -> str | None:
+        """Return another existing file with digest *sha256*."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size FROM media WHERE sha256 = ? AND path != ?",
+                (sha256, exclude)).fetchall()
+        for row in rows:
+            path = self._valid(row)
+            if path:
+                return path
+        return None
+
+    def add(self, url: str, path: str, sha256: str) -> None:
+        """Record that *url* was downloaded to *path*."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO media (url_key, path, size, sha256, created)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (url_key) DO UPDATE SET
+                       path = excluded.path, size = excluded.size,
+                       sha256 = excluded.sha256""",
+                (url_key(url), path, os.path.getsize(path), sha256, time.time()))
+
+    def record_saving(self, path: str, source: str, kind: str, size: int) -> None:
+        """Remember that *path* was linked to *source* instead of stored again.
+
+        *kind* is ``"transfer"`` (download skipped) or ``"storage"`` (file
+        replaced by a link after downloading).
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO savings (path, source, kind, size, created)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (path, source, kind, size, time.time()))
+        metrics.inc("dedup_hits_total", kind=kind)
+        metrics.inc("dedup_bytes_saved_total", size, kind=kind)
+
+    def report(self) -> dict:
+        """Return ``{kind: {"files": n, "bytes": n}}`` for all recorded savings."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, COUNT(*), SUM(size) FROM savings GROUP BY kind").fetchall()
+        return {kind: {"files": n, "bytes": size or 0} for kind, n, size in rows}
+
+
+_index: MediaIndex | None = None
+_index_lock = threading.Lock()
+
+
+def default_index_db() -> str:
+    """Return the index path (``dedup_db`` config key or state dir)."""
+    return cfg.get("dedup_db") or os.path.join(state_dir(), "media.sqlite3")
+
+
+def get_media_index() -> MediaIndex | None:
+    """Return the shared :class:`MediaIndex`, or ``None`` when ``dedup`` is off."""
+    global _index
+    if not cfg.get("dedup", True):
+        return None
+    with _index_lock:
+        if _index is None:
+            path = default_index_db()
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            _index = MediaIndex(path)
+        return _index
+
+
+def reuse_existing(url: str, dest: str) -> str | None:
+    """Link *dest* to an earlier download of *url*; return the source path."""
+    index = get_media_index()
+    if index is None:
+        return None
+    source = index.find_url(url)
+    if not source or os.path.abspath(source) == os.path.abspath(dest):
+        return None
+    if link_file(source, dest) is None:
+        return None
+    index.record_saving(dest, source, "transfer", os.path.getsize(dest))
+    return source
+
+
+def register_download(url: str, path: str, sha256: str | None = None) -> str | None:
+    """Index a finished download at *path*.
+
+    *sha256* saves hashing the file again when the caller already did. If an
+    identical file already exists elsewhere, *path* is replaced by a link to
+    it and that file's path is returned.
+    """
+    index = get_media_index()
+    if index is None or not os.path.exists(path):
+        return None
+    sha256 = sha256 or file_sha256(path)
+    source = index.find_hash(sha256, path)
+    linked = None
+    # Only a hard link saves space here; copying would just rewrite the file
+    if (source and not os.path.samefile(source, path)
+            and link_file(source, path, allow_copy=False) is not None):
+        index.record_saving(path, source, "storage", os.path.getsize(path))
+        linked = source
+    index.add(url, path, sha256)
+    return linked
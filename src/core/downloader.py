@@ -1,17 +1,23 @@
 import os
 import re
 import shutil
-import subprocess
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin, urlparse
 
 import requests
+import urllib3
 from tqdm import tqdm
 
 from .network import safe_get
-from .config import HEADERS
-from .api import get_purchased_contents, parse_purchased_contents
+from .config import cfg
+from .accounts import get_account
+from .api import iter_purchased_contents
 from .app_log import log as app_log
+from .ffmpeg import merge_segments, playlist_duration
+from . import dedup
+from . import jobs as jobstore
+from . import layout, metrics, planner, profiling, thumbnails, tuning, verify
 
 ffmpeg_path = shutil.which("ffmpeg")
 if ffmpeg_path is None:
@@ -52,7 +58,145 @@ def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def _download_ts_segment(ts_url, ts_path, idx, total, log, pause_event, cancel_event, progress_cb=None):
+def _chunk_size() -> int:
+    """Return the read size for media bodies (``download_chunk_kb``, default 1024)."""
+    return max(int(cfg.get("download_chunk_kb") or 1024), 16) * 1024
+
+
+def _iter_body(resp, chunk_size: int):
+    """Yield the body of a streamed *resp* in chunks of up to *chunk_size*.
+
+    Uncompressed bodies are read with ``readinto`` on the urllib3 response
+    into a single reused buffer, which still enforces the content length
+    and returns the connection to the pool once the body is drained.
+    Encoded bodies go through ``iter_content``. The yielded memoryview is
+    only valid until the next iteration.
+    """
+    raw = resp.raw
+    encoding = resp.headers.get("content-encoding", "identity").lower()
+    if encoding not in ("identity", "") or not hasattr(raw, "readinto"):
+        yield from resp.iter_content(chunk_size)
+        return
+    raw.decode_content = False
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    complete = False
+    try:
+        while True:
+            # The same translation as requests' iter_content
+            try:
+                n = raw.readinto(buf)
+            except urllib3.exceptions.ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e) from e
+            except urllib3.exceptions.ReadTimeoutError as e:
+                raise requests.exceptions.ConnectionError(e) from e
+            except urllib3.exceptions.SSLError as e:
+                raise requests.exceptions.SSLError(e) from e
+            if not n:
+                break
+            yield view[:n]
+        complete = True
+    finally:
+        if not complete:
+            resp.close()
+
+
+# Attempts per byte range before a ranged download gives up
+RANGE_RETRIES = 3
+
+# Images fetched in parallel by download_images()
+IMAGE_WORKERS = 8
+
+
+class _RangesUnsupported(Exception):
+    """The server answered a Range request with the full body."""
+
+
+def _range_connections(total_size: int) -> int:
+    """Return how many connections to use for a file of *total_size* bytes.
+
+    Controlled by ``mp4_connections`` (default 4) and
+    ``mp4_split_threshold_mb`` (default 64); returns 1 for small files.
+    """
+    connections = int(cfg.get("mp4_connections") or 4)
+    threshold = float(cfg.get("mp4_split_threshold_mb") or 64) * 1024 * 1024
+    if connections < 2 or total_size < threshold:
+        return 1
+    return connections
+
+
+def _download_ranged(file_url, output_path, total_size, connections, on_bytes,
+                     should_cancel, wait_if_paused, account=None, is_paused=None):
+    """Fetch *file_url* as parallel byte ranges into a preallocated file.
+
+    Each range is written at its own offset through a separate file handle
+    and resumed from the last written byte on connection errors. Raises
+    :class:`_RangesUnsupported` if the server ignores ``Range``.
+    """
+    part = -(-total_size // connections)
+    ranges = [(start, min(start + part, total_size) - 1)
+              for start in range(0, total_size, part)]
+    with open(output_path, "wb") as f:
+        f.truncate(total_size)
+    failed = threading.Event()
+    chunk_size = _chunk_size()
+    controller = tuning.get_controller()
+
+    def fetch(start, end):
+        pos = start
+        attempts = 0
+        with open(output_path, "r+b") as f:
+            f.seek(start)
+            while pos <= end:
+                try:
+                    with controller.slot() as slot:
+                        resp = safe_get(file_url, extra_headers={"Range": f"bytes={pos}-{end}"},
+                                        stream=True, endpoint="media_range", account=account)
+                        slot.response(resp)
+                        resp.raise_for_status()
+                        if resp.status_code != 206:
+                            resp.close()
+                            raise _RangesUnsupported()
+                        for chunk in _iter_body(resp, chunk_size):
+                            if failed.is_set():
+                                return
+                            if should_cancel():
+                                raise RuntimeError("Cancelled")
+                            if is_paused is not None and is_paused():
+                                # A paused download must not keep others from running
+                                with slot.released():
+                                    wait_if_paused()
+                            chunk = chunk[:end + 1 - pos]
+                            with profiling.span("write", "disk"):
+                                f.write(chunk)
+                            pos += len(chunk)
+                            slot.add_bytes(len(chunk))
+                            on_bytes(len(chunk))
+                            if pos > end:
+                                break
+                    if pos <= end:
+                        raise requests.exceptions.ChunkedEncodingError(
+                            f"range {start}-{end} ended at {pos}")
+                except (requests.ConnectionError, requests.Timeout,
+                        requests.exceptions.ChunkedEncodingError):
+                    attempts += 1
+                    if attempts > RANGE_RETRIES:
+                        raise
+                    metrics.inc("request_retries_total", endpoint="media_range")
+
+    with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="range") as pool:
+        futures = [pool.submit(fetch, start, end) for start, end in ranges]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            failed.set()
+            raise
+
+
+@profiling.traced("ts_segment", "network")
+def _download_ts_segment(ts_url, ts_path, idx, total, log, pause_event, cancel_event, progress_cb=None,
+                         meter=None, account=None):
     def _log(msg):
         if log:
             log(msg)
@@ -60,28 +204,45 @@ def _download_ts_segment(ts_url, ts_path, idx, total, log, pause_event, cancel_e
             app_log(msg)
 
     def _wait_if_paused():
-        if pause_event is not None:
+        if meter is not None:
+            meter.wait_if_paused(pause_event)
+        elif pause_event is not None:
             pause_event.wait()
 
     def _should_cancel():
         return cancel_event is not None and cancel_event.is_set()
 
-    try:
-        resp = safe_get(ts_url, headers=HEADERS, stream=True)
-        resp.raise_for_status()
-    except requests.exceptions.SSLError as e:
-        _log(f"[Retrying] TS {idx} SSL error: {e}")
-        resp = safe_get(ts_url, headers=HEADERS, stream=True)
-        resp.raise_for_status()
-
-    with open(ts_path, "wb") as ts_f:
-        for chunk in resp.iter_content(1024 * 1024):
-            if _should_cancel():
-                _log("[Cancelled] User cancelled (downloading TS segment).")
-                raise RuntimeError("Cancelled")
-            _wait_if_paused()
-            if chunk:
-                ts_f.write(chunk)
+    with tuning.get_controller().slot() as slot:
+        try:
+            resp = safe_get(ts_url, stream=True, endpoint="segment", account=account)
+            slot.response(resp)
+            resp.raise_for_status()
+        except requests.exceptions.SSLError as e:
+            _log(f"[Retrying] TS {idx} SSL error: {e}")
+            metrics.inc("request_retries_total", endpoint="segment")
+            resp = safe_get(ts_url, stream=True, endpoint="segment", account=account)
+            slot.response(resp)
+            resp.raise_for_status()
+
+        chunk_size = _chunk_size()
+        written = 0
+        with open(ts_path, "wb") as ts_f:
+            for chunk in _iter_body(resp, chunk_size):
+                if _should_cancel():
+                    _log("[Cancelled] User cancelled (downloading TS segment).")
+                    raise RuntimeError("Cancelled")
+                if pause_event is not None and not pause_event.is_set():
+                    # A paused download must not keep others from running
+                    with slot.released():
+                        _wait_if_paused()
+                if chunk:
+                    with profiling.span("write", "disk"):
+                        ts_f.write(chunk)
+                    written += len(chunk)
+                    slot.add_bytes(len(chunk))
+                    if meter is not None:
+                        meter.add_bytes(len(chunk))
+    verify.check_length(ts_path, written, verify.expected_length(resp))
 
     if progress_cb:
         progress_cb(idx + 1, total)
@@ -89,6 +250,7 @@ def _download_ts_segment(ts_url, ts_path, idx, total, log, pause_event, cancel_e
         _log(f"[TS] {idx + 1}/{total}")
 
 
+@profiling.traced("download_and_merge", "download")
 def download_and_merge(
         file_url: str,
         target_dir: str,
@@ -99,6 +261,8 @@ def download_and_merge(
         cancel_event=None,
         on_ffmpeg=None,
         progress_cb=None,
+        account=None,
+        on_first_segment=None,
 ):
     """Download a video (m3u8/mp4) and merge segments via ffmpeg.
 
@@ -123,8 +287,32 @@ def download_and_merge(
         when processing ends.
     progress_cb: callable, optional
         Receives ``(current, total)`` to report progress.
+    account: core.accounts.Account, optional
+        Login to download as; defaults to the global session.
+    on_first_segment: callable, optional
+        Receives the path of the first TS segment of an HLS video once it is
+        on disk, before the rest is downloaded.
+
+    Returns
+    -------
+    float or None
+        Duration in seconds of a merged HLS video, once checked against its
+        playlist (see :mod:`core.verify`); None for other files or when
+        verification is off. Raises ``verify.VerificationError`` when a
+        file does not match the server's size or the playlist's duration.
     """
-
+    meter = metrics.JobMeter(sanitize_filename(output_name),
+                             kind=url_type or infer_url_type(file_url))
+    with meter:
+        return _download_and_merge(
+            file_url, target_dir, output_name, url_type, log,
+            pause_event, cancel_event, on_ffmpeg, progress_cb, meter, account,
+            on_first_segment)
+
+
+def _download_and_merge(file_url, target_dir, output_name, url_type, log,
+                        pause_event, cancel_event, on_ffmpeg, progress_cb, meter,
+                        account=None, on_first_segment=None):
     def _log(msg):
         if log:
             log(msg)
@@ -132,12 +320,14 @@ def download_and_merge(
             app_log(msg)
 
     def _wait_if_paused():
-        if pause_event is not None:
-            pause_event.wait()
+        meter.wait_if_paused(pause_event)
 
     def _should_cancel():
         return cancel_event is not None and cancel_event.is_set()
 
+    def _is_paused():
+        return pause_event is not None and not pause_event.is_set()
+
     output_name = sanitize_filename(output_name)
     url_type = url_type or infer_url_type(file_url)
 
@@ -153,31 +343,74 @@ def download_and_merge(
     if url_type == "mp4" or url_type == "jpg":
         output_path = os.path.join(target_dir, output_name + f".{url_type}")
         _log(f"[Download {url_type.upper()}] {output_path}")
-        resp = safe_get(file_url, headers=HEADERS, stream=True)
+        resp = safe_get(file_url, stream=True, endpoint="media", account=account)
         resp.raise_for_status()
         total_size = int(resp.headers.get("content-length", 0)) or None
+        chunk_size = _chunk_size()
+        connections = _range_connections(total_size or 0)
+        if (url_type == "mp4" and connections > 1
+                and resp.headers.get("accept-ranges", "").lower() == "bytes"):
+            resp.close()
+            _log(f"[Download MP4] Using {connections} connections")
+            pbar = None
+            if progress_cb is None and log is None:
+                pbar = tqdm(total=total_size, unit="B", unit_scale=True, desc=output_name)
+            lock = threading.Lock()
+            received = [0]
+
+            def on_bytes(n):
+                meter.add_bytes(n)
+                with lock:
+                    received[0] += n
+                    current = received[0]
+                if pbar is not None:
+                    pbar.update(n)
+                elif progress_cb:
+                    progress_cb(current, total_size)
+
+            try:
+                _download_ranged(file_url, output_path, total_size, connections,
+                                 on_bytes, _should_cancel, _wait_if_paused, account,
+                                 _is_paused)
+                verify.check_length(output_path, received[0], total_size)
+                _log(f"[Download complete] {output_path}")
+                return None
+            except RuntimeError:
+                _log(f"[Cancelled] User cancelled ({url_type}).")
+                raise
+            except _RangesUnsupported:
+                _log("[Download MP4] Server ignored Range requests, using a single connection")
+                resp = safe_get(file_url, stream=True, endpoint="media", account=account)
+                resp.raise_for_status()
+            finally:
+                if pbar is not None:
+                    pbar.close()
         with open(output_path, "wb") as f:
             downloaded = 0
             if progress_cb is None and log is None:
                 with tqdm(total=total_size or 0, unit="B", unit_scale=True, desc=output_name) as pbar:
-                    for chunk in resp.iter_content(1024 * 1024):
+                    for chunk in _iter_body(resp, chunk_size):
                         if _should_cancel():
                             _log(f"[Cancelled] User cancelled ({url_type}).")
                             raise RuntimeError("Cancelled")
                         _wait_if_paused()
                         if chunk:
-                            f.write(chunk)
+                            with profiling.span("write", "disk"):
+                                f.write(chunk)
                             downloaded += len(chunk)
+                            meter.add_bytes(len(chunk))
                             pbar.update(len(chunk))
             else:
-                for chunk in resp.iter_content(1024 * 1024):
+                for chunk in _iter_body(resp, chunk_size):
                     if _should_cancel():
                         _log(f"[Cancelled] User cancelled ({url_type}).")
                         raise RuntimeError("Cancelled")
                     _wait_if_paused()
                     if chunk:
-                        f.write(chunk)
+                        with profiling.span("write", "disk"):
+                            f.write(chunk)
                         downloaded += len(chunk)
+                        meter.add_bytes(len(chunk))
                         if progress_cb:
                             progress_cb(downloaded, total_size or 0)
                         elif total_size and log is not None:
@@ -185,14 +418,18 @@ def download_and_merge(
                                 f"[Progress] {output_name}: {downloaded * 100 // total_size}%")
             if progress_cb and downloaded and (total_size or 0):
                 progress_cb(downloaded, total_size or downloaded)
+        verify.check_length(output_path, downloaded, verify.expected_length(resp))
         _log(f"[Download complete] {output_path}")
         return None
 
     # ---- m3u8 playlist ----
-    r = safe_get(file_url, headers=HEADERS)
+    # Segments are assembled in work_dir, which may be on a faster volume
+    work_dir = layout.work_dir(target_dir, output_name)
+    ensure_dir(work_dir)
+    r = safe_get(file_url, endpoint="playlist", account=account)
     r.raise_for_status()
     m3u8_text = r.text
-    m3u8_filename = os.path.join(target_dir, "playlist.m3u8")
+    m3u8_filename = os.path.join(work_dir, "playlist.m3u8")
     with open(m3u8_filename, "w", encoding="utf-8") as f:
         f.write(m3u8_text)
 
@@ -204,16 +441,19 @@ def download_and_merge(
                 base = file_url.rsplit("/", 1)[0] + "/"
                 sub_url = sub_1 if sub_1.startswith(
                     "http") else urljoin(base, sub_1)
-                return download_and_merge(
+                return _download_and_merge(
                     sub_url,
                     target_dir,
                     output_name,
                     "m3u8",
-                    log=log,
-                    pause_event=pause_event,
-                    cancel_event=cancel_event,
-                    on_ffmpeg=on_ffmpeg,
-                    progress_cb=progress_cb,
+                    log,
+                    pause_event,
+                    cancel_event,
+                    on_ffmpeg,
+                    progress_cb,
+                    meter,
+                    account,
+                    on_first_segment,
                 )
 
     base = file_url.rsplit("/", 1)[0] + "/"
@@ -223,140 +463,299 @@ def download_and_merge(
         if not l.startswith("#")
     ]
 
-    filelist_path = os.path.join(target_dir, "filelist.txt")
-    with open(filelist_path, "w", encoding="utf-8") as list_f:
-        total = len(ts_urls)
-        if progress_cb is None and log is None:
-            with tqdm(total=total, unit="ts", desc="TS download") as pbar:
-                for idx, ts in enumerate(ts_urls):
-                    if _should_cancel():
-                        _check_cancel_or_pause()
-
-                    ts_name = f"{idx:04d}.ts"
-                    ts_path = os.path.join(target_dir, ts_name)
-                    _download_ts_segment(
-                        ts, ts_path, idx, total, log, pause_event, cancel_event)
-                    list_f.write(f"file '{ts_name}'\n")
-                    pbar.update(1)
-        else:
-            for idx, ts in enumerate(ts_urls):
-                if _should_cancel():
-                    _check_cancel_or_pause()
+    # Segments are fetched in parallel, as many at once as the concurrency
+    # controller allows (see core.tuning)
+    total = len(ts_urls)
+    controller = tuning.get_controller()
+    pbar = None
+    if progress_cb is None and log is None:
+        pbar = tqdm(total=total, unit="ts", desc="TS download")
+    failed = threading.Event()
+    lock = threading.Lock()
+    finished = [0]
+
+    def fetch_segment(idx, ts):
+        if failed.is_set():
+            return
+        _check_cancel_or_pause()
+        ts_path = os.path.join(work_dir, f"{idx:04d}.ts")
+        _download_ts_segment(ts, ts_path, idx, total, log, pause_event, cancel_event,
+                             meter=meter, account=account)
+        if idx == 0 and on_first_segment:
+            on_first_segment(ts_path)
+        with lock:
+            finished[0] += 1
+            current = finished[0]
+        if pbar is not None:
+            pbar.update(1)
+        elif progress_cb:
+            progress_cb(current, total)
 
-                ts_name = f"{idx:04d}.ts"
-                ts_path = os.path.join(target_dir, ts_name)
-                _download_ts_segment(
-                    ts, ts_path, idx, total, log, pause_event, cancel_event, progress_cb=progress_cb)
-                list_f.write(f"file '{ts_name}'\n")
+    try:
+        with ThreadPoolExecutor(max_workers=max(min(controller.maximum, total), 1),
+                                thread_name_prefix="segment") as pool:
+            futures = [pool.submit(fetch_segment, idx, ts) for idx, ts in enumerate(ts_urls)]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                failed.set()
+                raise
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+    filelist_path = os.path.join(work_dir, "filelist.txt")
+    with open(filelist_path, "w", encoding="utf-8") as list_f:
+        for idx in range(total):
+            list_f.write(f"file '{idx:04d}.ts'\n")
 
     output_path = os.path.join(target_dir, output_name + ".mp4")
     _log(
         f"[Starting FFmpeg] Merging {len(ts_urls)} TS segments into {output_path}")
 
-    def _run_ffmpeg(command):
-        if log is None and pause_event is None and cancel_event is None and on_ffmpeg is None:
-            subprocess.run(command, check=True)
-        else:
-            try:
-                p = subprocess.Popen(
-                    command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                    universal_newlines=True, bufsize=1, encoding='utf-8', errors='replace')
-                if on_ffmpeg:
-                    on_ffmpeg(p)
+    expected_duration = playlist_duration(m3u8_text)
+    merge_segments(
+        ffmpeg_path,
+        filelist_path,
+        output_path,
+        duration=expected_duration,
+        log=log,
+        pause_event=pause_event,
+        cancel_event=cancel_event,
+        on_ffmpeg=on_ffmpeg,
+        progress_cb=progress_cb,
+        meter=meter,
+    )
 
-                while True:
-                    if _should_cancel():
-                        _log("[Cancelled] Terminating FFmpeg process...")
-                        try:
-                            p.terminate()
-                        except ProcessLookupError:
-                            pass  # process already ended
-                        try:
-                            p.wait(timeout=5)
-                        except subprocess.TimeoutExpired:
-                            try:
-                                p.kill()
-                            except ProcessLookupError:
-                                pass  # process already ended
-                        raise RuntimeError("Cancelled")
-                    _wait_if_paused()
+    _log(f"[Merge complete] {output_path}")
 
-                    # Read and discard output to prevent buffer overflow
-                    if p.stdout:
-                        try:
-                            p.stdout.readline()
-                        except:
-                            pass
-
-                    ret = p.poll()
-                    if ret is not None:
-                        # Read any remaining output to clean up
-                        if p.stdout:
-                            try:
-                                p.stdout.read()
-                            except:
-                                pass
-                        if ret != 0:
-                            raise subprocess.CalledProcessError(ret, command)
-                        break
-                    time.sleep(0.1)
-            finally:
-                if on_ffmpeg:
-                    on_ffmpeg(None)
+    if work_dir != target_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        for filename in os.listdir(target_dir):
+            if filename.endswith(".ts") or filename.endswith(".m3u8") or filename == "filelist.txt":
+                os.remove(os.path.join(target_dir, filename))
+    _log(f"[Cleanup] Temporary files removed")
+    if not verify.enabled():
+        return None
+    return verify.check_duration(output_path, expected_duration)
+
+
+def build_post_jobs(source: str, username: str, post_id, title: str,
+                    attachments: list, download_dir: str, account: str = "",
+                    month: str = "") -> list[dict]:
+    """Return one job dict per downloadable attachment of a post.
 
+    Files go to ``download_dir/<username>/<post_id>-<title>/`` unless the
+    ``layout`` and ``storage_targets`` config keys say otherwise (see
+    :mod:`core.layout`); posts with several attachments get a ``_<n>``
+    suffix so files do not overwrite each other. *account* names the login
+    the URLs were fetched with ("" for the default one); *month* fills the
+    ``{month}`` layout field.
+    """
+    urls = [a.get("default") for a in attachments or [] if a.get("default")]
+    target_dir = layout.post_dir(download_dir, {
+        "username": sanitize_filename(username),
+        "post_id": sanitize_filename(str(post_id)),
+        "title": sanitize_filename(title),
+        "month": sanitize_filename(month) if month else "",
+        "source": source,
+    })
+    jobs = []
+    for n, url in enumerate(urls, start=1):
+        name = sanitize_filename(title)
+        jobs.append({
+            "source": source,
+            "username": username,
+            "post_id": str(post_id),
+            "title": title,
+            "url": url,
+            "url_type": infer_url_type(url),
+            "target_dir": target_dir,
+            "output_name": f"{name}_{n}" if len(urls) > 1 else name,
+            "account": account,
+        })
+    return jobs
+
+
+def job_output_path(job: dict) -> str:
+    """Return the final file path a job produces."""
+    ext = "jpg" if job["url_type"] == "jpg" else "mp4"
+    return os.path.join(job["target_dir"], f"{job['output_name']}.{ext}")
+
+
+def claim_job(store, job: dict) -> bool:
+    """Claim *job* in *store* before downloading it (see :meth:`core.jobs.JobStore.claim`).
+
+    A job recorded as ``done`` whose file has gone missing is re-opened
+    first, so it is downloaded again.
+    """
+    if job["state"] == jobstore.DONE and not os.path.exists(job_output_path(job)):
+        store.reopen(job["id"])
+    return store.claim(job["id"])
+
+
+def download_job(job: dict, store=None, log=None, pause_event=None,
+                 cancel_event=None, on_ffmpeg=None, progress_cb=None):
+    """Download a queued *job* and record its outcome in *store*.
+
+    A cancelled job is put back to ``pending`` so it can be resumed later
+    (runners mark jobs the user cancelled on their own ``cancelled``, see
+    :mod:`core.control`); other errors mark it ``failed`` and are re-raised. Media already
+    downloaded for another job is linked instead of fetched again (see
+    :mod:`core.dedup`). The job is fetched with the session of its
+    ``account`` (see :mod:`core.accounts`). With thumbnails enabled the
+    post's thumbnail is rendered in the background (see
+    :mod:`core.thumbnails`). Finished files are checked and recorded (see
+    :mod:`core.verify`); one that fails the checks is removed and the job
+    marked ``failed``.
+    """
+
+    def _log(msg):
+        if log:
+            log(msg)
+        else:
+            app_log(msg)
+
+    if store is not None:
+        store.mark(job["id"], jobstore.RUNNING)
+    output_path = job_output_path(job)
     try:
-        cmd = [
-            ffmpeg_path,
-            "-y",
-            "-f",
-            "concat",
-            "-safe",
-            "0",
-            "-i",
-            filelist_path,
-            "-c",
-            "copy",
-            "-ignore_unknown",
-            "-fflags",
-            "+genpts",
-            "-f",
-            "mp4",
-            output_path,
-        ]
-        _log(f"[FFmpeg Command] {' '.join(cmd)}")
-        _run_ffmpeg(cmd)
-    except subprocess.CalledProcessError as e:
-        _log(f"Warning: FFmpeg merge failed, trying to re-encode: {e}")
-        cmd = [
-            ffmpeg_path,
-            "-y",
-            "-f",
-            "concat",
-            "-safe",
-            "0",
-            "-i",
-            filelist_path,
-            "-c:v",
-            "libx264",
-            "-c:a",
-            "aac",
-            "-ignore_unknown",
-            "-fflags",
-            "+genpts",
-            "-f",
-            "mp4",
-            output_path,
-        ]
-        _log(f"[FFmpeg Re-encode Command] {' '.join(cmd)}")
-        _run_ffmpeg(cmd)
+        source = dedup.reuse_existing(job["url"], output_path)
+        if source:
+            _log(f"[Dedup] Linked {os.path.basename(output_path)} to {source}")
+            verify.record(store, job, output_path)
+            if store is not None:
+                store.mark(job["id"], jobstore.DONE)
+            thumbnails.submit(job, output_path)
+            return
+        duration = download_and_merge(
+            job["url"],
+            job["target_dir"],
+            job["output_name"],
+            url_type=job["url_type"],
+            log=log,
+            pause_event=pause_event,
+            cancel_event=cancel_event,
+            on_ffmpeg=on_ffmpeg,
+            progress_cb=progress_cb,
+            account=get_account(job.get("account")),
+            on_first_segment=lambda path: thumbnails.submit(job, path, copy=True),
+        )
+        if job["url_type"] != "m3u8":
+            thumbnails.submit(job, output_path)
+        sha256 = verify.record(store, job, output_path, duration)
+        source = dedup.register_download(job["url"], output_path, sha256)
+        if source:
+            _log(f"[Dedup] {os.path.basename(output_path)} is identical to {source}; linked")
+    except Exception as e:
+        if isinstance(e, verify.VerificationError) and os.path.exists(output_path):
+            # Never leave a broken file where a finished one is expected
+            os.remove(output_path)
+        if store is not None:
+            cancelled = isinstance(e, RuntimeError) and str(e) == "Cancelled"
+            store.mark(job["id"], jobstore.PENDING if cancelled else jobstore.FAILED,
+                       None if cancelled else str(e))
+        raise
+    if store is not None:
+        store.mark(job["id"], jobstore.DONE)
+
+
+def download_images(jobs: list[dict], store=None, log=None, pause_event=None,
+                    cancel_event=None, progress_cb=None) -> dict:
+    """Download the image *jobs* of a post concurrently.
+
+    Images are small, so per-request latency dominates: up to
+    ``image_workers`` (default 8) are fetched at once over kept-alive
+    connections, within the shared limit of :mod:`core.tuning`, each body is
+    read whole and written in a single call, and output directories are
+    created once per batch. *progress_cb* receives
+    ``(images_done, len(jobs))``. Returns counts of ``downloaded``,
+    ``skipped`` and ``failed`` images; raises ``RuntimeError("Cancelled")``
+    after marking unfinished images ``pending`` when cancelled.
+    """
 
-    _log(f"[Merge complete] {output_path}")
+    def _log(msg):
+        if log:
+            log(msg)
+        else:
+            app_log(msg)
 
-    for filename in os.listdir(target_dir):
-        if filename.endswith(".ts") or filename.endswith(".m3u8") or filename == "filelist.txt":
-            os.remove(os.path.join(target_dir, filename))
-    _log(f"[Cleanup] Temporary files removed")
-    return None
+    def _should_cancel():
+        return cancel_event is not None and cancel_event.is_set()
+
+    for target_dir in {job["target_dir"] for job in jobs}:
+        ensure_dir(target_dir)
+    counts = {"downloaded": 0, "skipped": 0, "failed": 0}
+    lock = threading.Lock()
+    done = [0]
+    meter = metrics.JobMeter(sanitize_filename(jobs[0]["title"]) if jobs else "", kind="jpg")
+    controller = tuning.get_controller()
+
+    def fetch(job):
+        output_path = job_output_path(job)
+        if _should_cancel():
+            return "cancelled"
+        meter.wait_if_paused(pause_event)
+        if store is not None:
+            store.mark(job["id"], jobstore.RUNNING)
+        try:
+            if job["state"] == jobstore.DONE and os.path.exists(output_path):
+                outcome = "skipped"
+            elif dedup.reuse_existing(job["url"], output_path):
+                outcome = "skipped"
+            else:
+                with profiling.span("image", "network"), controller.slot() as slot:
+                    resp = safe_get(job["url"], endpoint="image",
+                                    account=get_account(job.get("account")))
+                    slot.response(resp)
+                    resp.raise_for_status()
+                    data = resp.content
+                    slot.add_bytes(len(data))
+                verify.check_length(output_path, len(data), verify.expected_length(resp))
+                with profiling.span("write", "disk"):
+                    with open(output_path, "wb") as f:
+                        f.write(data)
+                meter.add_bytes(len(data))
+                sha256 = verify.record(store, job, output_path)
+                dedup.register_download(job["url"], output_path, sha256)
+                outcome = "downloaded"
+        except Exception as e:
+            if store is not None:
+                store.mark(job["id"], jobstore.FAILED, str(e))
+            _log(f"    [Failed] {job['output_name']}: {e}")
+            outcome = "failed"
+        else:
+            if store is not None:
+                store.mark(job["id"], jobstore.DONE)
+        with lock:
+            counts[outcome] += 1
+            done[0] += 1
+            current = done[0]
+        if progress_cb:
+            progress_cb(current, len(jobs))
+        return outcome
+
+    workers = max(int(cfg.get("image_workers") or IMAGE_WORKERS), 1)
+    with meter, ThreadPoolExecutor(max_workers=min(workers, len(jobs) or 1),
+                                   thread_name_prefix="image") as pool:
+        outcomes = list(pool.map(fetch, jobs))
+        if "cancelled" in outcomes:
+            if store is not None:
+                for job, outcome in zip(jobs, outcomes):
+                    if outcome == "cancelled":
+                        store.mark(job["id"], jobstore.PENDING)
+            _log("[Cancelled] User cancelled (jpg).")
+            raise RuntimeError("Cancelled")
+    for job, outcome in zip(jobs, outcomes):
+        if outcome != "failed":
+            thumbnails.submit(job, job_output_path(job))
+            break
+    if jobs:
+        _log(f"[Images] {counts['downloaded']} downloaded, {counts['skipped']} skipped, "
+             f"{counts['failed']} failed in {jobs[0]['target_dir']}")
+    return counts
 
 
 def download_purchased_contents(
@@ -368,6 +767,9 @@ def download_purchased_contents(
     cancel_event=None,
     on_ffmpeg=None,
     progress_cb=None,
+    dry_run: bool = False,
+    account=None,
+    shard=None,
 ):
     """Download purchased contents from CandFans.
 
@@ -389,6 +791,13 @@ def download_purchased_contents(
         Callback receiving the ffmpeg ``Popen`` object.
     progress_cb: callable, optional
         Receives ``(current, total)`` to report progress.
+    dry_run: bool
+        Only queue and plan the batch; nothing is downloaded.
+    account: core.accounts.Account, optional
+        Login whose purchases are downloaded; defaults to the global session.
+    shard: core.shards.Shard, optional
+        Only download this worker's part of the attachments. Attachments
+        claimed by another worker are skipped.
     """
 
     def _log(msg):
@@ -400,36 +809,35 @@ def download_purchased_contents(
     def _should_cancel():
         return cancel_event is not None and cancel_event.is_set()
 
+    # Apply filters while the list streams in; only matches are kept
+    filtered_contents = []
+    found = 0
     try:
         _log("Fetching purchased contents...")
-        resp = get_purchased_contents()
-        contents = parse_purchased_contents(resp)
-        _log(f"Found {len(contents)} purchased contents")
-    except Exception as e:
-        _log(f"[Error] Failed to fetch purchased contents: {e}")
-        return
-
-    # Apply filters
-    filtered_contents = []
-    for content in contents:
-        if _should_cancel():
-            _log("[Cancelled] User cancelled during filtering.")
-            return
+        for content in iter_purchased_contents(account):
+            found += 1
+            if _should_cancel():
+                _log("[Cancelled] User cancelled during filtering.")
+                return
 
-        # Filter by keyword
-        if keyword and keyword.lower() not in content.get("title", "").lower():
-            continue
+            # Filter by keyword
+            if keyword and keyword.lower() not in content.get("title", "").lower():
+                continue
 
-        # Filter by month
-        if month_filter and content.get("purchase_month", "") != month_filter:
-            continue
+            # Filter by month
+            if month_filter and content.get("purchase_month", "") != month_filter:
+                continue
 
-        # Only include content with attachments
-        attachments = content.get("attachments", [])
-        if not attachments:
-            continue
+            # Only include content with attachments
+            attachments = content.get("attachments", [])
+            if not attachments:
+                continue
 
-        filtered_contents.append(content)
+            filtered_contents.append(content)
+        _log(f"Found {found} purchased contents")
+    except Exception as e:
+        _log(f"[Error] Failed to fetch purchased contents: {e}")
+        return
 
     _log(f"After filtering: {len(filtered_contents)} contents to download")
 
@@ -437,8 +845,45 @@ def download_purchased_contents(
         _log("No contents to download after filtering")
         return
 
+    # Queue every attachment first so an interrupted run can be resumed
+    store = jobstore.get_job_store()
+    queued = []
+    for content in filtered_contents:
+        title = content.get(
+            "title", f"content_{content.get('post_id', 'unknown')}")
+        post_jobs = build_post_jobs(
+            "purchased",
+            content.get("username", "unknown_user"),
+            content.get("post_id", "unknown"),
+            title,
+            content.get("attachments", []),
+            target_dir,
+            account.name if account is not None else "",
+            content.get("purchase_month", ""),
+        )
+        if shard is not None:
+            post_jobs = [job for job in post_jobs if shard.owns(job)]
+            if not post_jobs:
+                continue
+        queued.append((content, store.enqueue(post_jobs)))
+
+    pending = [job for _, post_jobs in queued for job in post_jobs
+               if not (job["state"] == jobstore.DONE and os.path.exists(job_output_path(job)))]
+    if pending and (dry_run or cfg.get("preflight", True)):
+        plan = planner.plan_jobs(pending, target_dir, cancel_event)
+        _log(planner.format_plan(plan))
+        if not plan["fits"]:
+            _log("[Error] Not enough free space in the download directory for this batch")
+            return
+        # Keep each content's attachments together, in the policy's order
+        rank = {job["id"]: n for n, job in enumerate(planner.order_jobs(pending, plan=plan))}
+        queued.sort(key=lambda item: min(
+            (rank.get(job["id"], len(rank)) for job in item[1]), default=len(rank)))
+    if dry_run:
+        return
+
     # Download each content
-    for i, content in enumerate(filtered_contents):
+    for i, (content, post_jobs) in enumerate(queued):
         if _should_cancel():
             _log("[Cancelled] User cancelled during download.")
             return
@@ -446,69 +891,61 @@ def download_purchased_contents(
         title = content.get(
             "title", f"content_{content.get('post_id', 'unknown')}")
         username = content.get("username", "unknown_user")
-        post_id = str(content.get("post_id", "unknown"))
-        purchase_month = content.get("purchase_month", "unknown_month")
 
-        _log(f"[{i+1}/{len(filtered_contents)}] Downloading: {username} / {title}")
+        _log(f"[{i+1}/{len(queued)}] Downloading: {username} / {title}")
+
+        # Images of a post are fetched together, the other attachments in turn
+        images = [job for job in post_jobs if job["url_type"] == "jpg" and claim_job(store, job)]
+        if images:
+            def images_progress_cb(current, total):
+                if progress_cb:
+                    share = current / (total or 1) * len(images) / len(post_jobs)
+                    progress_cb(int((i + share) / len(queued) * 1000), 1000)
 
-        # Create directory structure: target_dir/username/post_id-title/
-        user_dir = os.path.join(target_dir, sanitize_filename(username))
-        content_dir = os.path.join(
-            user_dir, f"{post_id}-{sanitize_filename(title)}")
-        ensure_dir(content_dir)
+            try:
+                download_images(images, store, log=log, pause_event=pause_event,
+                                cancel_event=cancel_event, progress_cb=images_progress_cb)
+            except RuntimeError:
+                return
 
-        # Download all attachments
-        attachments = content.get("attachments", [])
-        for j, attachment in enumerate(attachments):
+        others = [job for job in post_jobs if job["url_type"] != "jpg"]
+        for j, job in enumerate(others, start=len(images)):
             if _should_cancel():
                 _log("[Cancelled] User cancelled during attachment download.")
                 return
 
-            # Get the main URL (default quality)
-            url = attachment.get("default")
-            if not url:
+            output_file = os.path.basename(job_output_path(job))
+            if job["state"] == jobstore.DONE and os.path.exists(job_output_path(job)):
+                _log(f"    Skipped (already downloaded): {output_file}")
+                continue
+            if not claim_job(store, job):
+                _log(f"    Skipped (taken or finished by another worker): {output_file}")
                 continue
-
-            # Determine file type
-            if infer_url_type(url) == "m3u8":
-                url_type = "m3u8"
-                file_ext = "mp4"  # m3u8 will be converted to mp4
-            else:
-                url_type = "mp4"
-                file_ext = "mp4"
-
-            # Create filename for this attachment
-            if len(attachments) > 1:
-                output_name = f"{sanitize_filename(title)}_{j+1}"
-            else:
-                output_name = sanitize_filename(title)
 
             try:
                 def attachment_progress_cb(current, total):
                     if progress_cb:
                         # Calculate overall progress
-                        content_progress = i / len(filtered_contents)
+                        content_progress = i / len(queued)
                         attachment_progress = (
-                            j + current / (total or 1)) / len(attachments)
+                            j + current / (total or 1)) / len(post_jobs)
                         overall_progress = content_progress + \
-                            attachment_progress / len(filtered_contents)
+                            attachment_progress / len(queued)
                         progress_cb(int(overall_progress * 1000), 1000)
 
-                download_and_merge(
-                    url,
-                    content_dir,
-                    output_name,
-                    url_type=url_type,
+                download_job(
+                    job,
+                    store,
                     log=log,
                     pause_event=pause_event,
                     cancel_event=cancel_event,
                     on_ffmpeg=on_ffmpeg,
                     progress_cb=attachment_progress_cb,
                 )
-                _log(f"    Downloaded: {output_name}.{file_ext}")
+                _log(f"    Downloaded: {output_file}")
 
             except Exception as e:
-                _log(f"    [Failed] {output_name}: {e}")
+                _log(f"    [Failed] {job['output_name']}: {e}")
                 continue
 
-    _log(f"[Complete] Downloaded {len(filtered_contents)} purchased contents")
+    _log(f"[Complete] Downloaded {len(queued)} purchased contents")
@@ -0,0 +1,293 @@
+"""Supervised FFmpeg subprocesses with progress reporting.
+
+FFmpeg is started with ``-progress pipe:1`` and its stdout/stderr are drained
+by dedicated reader threads, so the supervising loop never blocks on a pipe
+and reacts to cancel or pause within :data:`POLL_INTERVAL`.
+"""
+
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+from . import metrics, profiling
+from .app_log import log as app_log
+from .config import cfg
+
+POLL_INTERVAL = 0.05
+STDERR_TAIL = 40
+
+# Merge strategies tried in order: (name, input options, output codec options).
+# Stream-copy variants come first; the full re-encode options are built from
+# the configuration in _reencode_options().
+MERGE_TIERS = (
+    ("copy", [], ["-c", "copy"]),
+    ("copy_fixed", ["-fflags", "+genpts+igndts"],
+     ["-c", "copy", "-bsf:a", "aac_adtstoasc", "-avoid_negative_ts", "make_zero"]),
+    ("audio_reencode", ["-fflags", "+genpts+igndts"],
+     ["-c:v", "copy", "-c:a", "aac", "-avoid_negative_ts", "make_zero"]),
+    ("reencode", [], None),
+)
+
+_reencode_slots = None
+_reencode_slots_lock = threading.Lock()
+
+
+def playlist_duration(m3u8_text: str) -> float:
+    """Return the summed ``#EXTINF`` durations of a media playlist."""
+    total = 0.0
+    for line in m3u8_text.splitlines():
+        if line.startswith("#EXTINF:"):
+            try:
+                total += float(line[8:].split(",", 1)[0])
+            except ValueError:
+                pass
+    return total
+
+
+def _suspend(proc) -> bool:
+    """Suspend *proc*; return True when the platform supports it."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            return ctypes.windll.ntdll.NtSuspendProcess(int(proc._handle)) == 0
+        os.kill(proc.pid, signal.SIGSTOP)
+        return True
+    except (OSError, AttributeError, ValueError):
+        return False
+
+
+def _resume(proc) -> None:
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            ctypes.windll.ntdll.NtResumeProcess(int(proc._handle))
+        else:
+            os.kill(proc.pid, signal.SIGCONT)
+    except (OSError, AttributeError, ValueError):
+        pass
+
+
+def terminate(proc) -> None:
+    """Stop *proc*, killing it if it has not exited after 5 seconds."""
+    _resume(proc)  # a stopped process cannot handle SIGTERM
+    try:
+        proc.terminate()
+    except ProcessLookupError:
+        pass  # process already ended
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass  # process already ended
+
+
+def run_ffmpeg(
+        command: list,
+        duration: float | None = None,
+        log=None,
+        pause_event=None,
+        cancel_event=None,
+        on_ffmpeg=None,
+        progress_cb=None,
+        meter=None,
+) -> None:
+    """Run an FFmpeg *command* under supervision.
+
+    Parameters
+    ----------
+    command: list
+        Full FFmpeg argument list; ``command[0]`` is the executable.
+    duration: float, optional
+        Expected output duration in seconds. When given, ``progress_cb``
+        receives ``(out_time_ms, duration_ms)`` as FFmpeg advances.
+    pause_event: threading.Event, optional
+        While cleared the FFmpeg process is suspended.
+    cancel_event: threading.Event, optional
+        When set, FFmpeg is terminated and ``RuntimeError("Cancelled")`` raised.
+    on_ffmpeg: callable, optional
+        Receives the ``Popen`` object, then ``None`` once FFmpeg exits.
+    meter: metrics.JobMeter, optional
+        Accounts time spent paused.
+
+    Raises ``subprocess.CalledProcessError`` (with the stderr tail as
+    ``stderr``) when FFmpeg exits with a non-zero status.
+    """
+
+    def _log(msg):
+        if log:
+            log(msg)
+        else:
+            app_log(msg)
+
+    cmd = [command[0], "-hide_banner", "-nostats", "-progress", "pipe:1", *command[1:]]
+    proc = subprocess.Popen(
+        cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        text=True, encoding="utf-8", errors="replace")
+    stderr_tail = deque(maxlen=STDERR_TAIL)
+    finished = threading.Event()
+    duration_ms = int(duration * 1000) if duration else 0
+    last_pct = [-1]
+
+    def _read_progress():
+        try:
+            for line in proc.stdout:
+                key, _, value = line.strip().partition("=")
+                # out_time_ms is in microseconds despite its name
+                if key in ("out_time_us", "out_time_ms") and duration_ms and value.isdigit():
+                    current = min(int(value) // 1000, duration_ms)
+                    if progress_cb:
+                        progress_cb(current, duration_ms)
+                    pct = current * 100 // duration_ms
+                    if log is not None and pct // 10 > last_pct[0] // 10:
+                        last_pct[0] = pct
+                        _log(f"[FFmpeg] {pct}%")
+        finally:
+            finished.set()
+
+    def _read_stderr():
+        for line in proc.stderr:
+            stderr_tail.append(line.rstrip())
+
+    readers = [
+        threading.Thread(target=_read_progress, name="ffmpeg-progress", daemon=True),
+        threading.Thread(target=_read_stderr, name="ffmpeg-stderr", daemon=True),
+    ]
+    for t in readers:
+        t.start()
+    if on_ffmpeg:
+        on_ffmpeg(proc)
+
+    try:
+        while proc.poll() is None:
+            if cancel_event is not None and cancel_event.is_set():
+                _log("[Cancelled] Terminating FFmpeg process...")
+                terminate(proc)
+                raise RuntimeError("Cancelled")
+            if pause_event is not None and not pause_event.is_set():
+                suspended = _suspend(proc)
+                paused_at = time.monotonic()
+                try:
+                    # Wake up regularly so cancel still works while paused
+                    with profiling.span("pause_wait", "pause"):
+                        while not pause_event.is_set() and not (
+                                cancel_event is not None and cancel_event.is_set()):
+                            pause_event.wait(POLL_INTERVAL * 4)
+                finally:
+                    if suspended:
+                        _resume(proc)
+                    if meter is not None:
+                        meter.add_paused(time.monotonic() - paused_at)
+                continue
+            if finished.wait(POLL_INTERVAL):
+                try:
+                    proc.wait(timeout=POLL_INTERVAL)
+                except subprocess.TimeoutExpired:
+                    pass
+        for t in readers:
+            t.join(timeout=5)
+    finally:
+        if on_ffmpeg:
+            on_ffmpeg(None)
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(
+            proc.returncode, command, stderr="\n".join(stderr_tail))
+    if progress_cb and duration_ms:
+        progress_cb(duration_ms, duration_ms)
+
+
+def _reencode_options() -> list:
+    """Return libx264/aac options from ``ffmpeg_*`` config keys."""
+    if cfg.get("ffmpeg_fast_reencode"):
+        preset = "ultrafast"
+    else:
+        preset = cfg.get("ffmpeg_preset") or "medium"
+    options = ["-c:v", "libx264", "-preset", str(preset), "-c:a", "aac"]
+    threads = cfg.get("ffmpeg_threads")
+    if threads:
+        options += ["-threads", str(threads)]
+    return options
+
+
+def _reencode_semaphore() -> threading.BoundedSemaphore:
+    """Limit concurrent full re-encodes (``max_concurrent_reencodes``, default 1)."""
+    global _reencode_slots
+    with _reencode_slots_lock:
+        if _reencode_slots is None:
+            limit = max(int(cfg.get("max_concurrent_reencodes") or 1), 1)
+            _reencode_slots = threading.BoundedSemaphore(limit)
+        return _reencode_slots
+
+
+def merge_segments(
+        ffmpeg_path: str,
+        filelist_path: str,
+        output_path: str,
+        duration: float | None = None,
+        log=None,
+        pause_event=None,
+        cancel_event=None,
+        on_ffmpeg=None,
+        progress_cb=None,
+        meter=None,
+) -> str:
+    """Concatenate the segments listed in *filelist_path* into an mp4.
+
+    Tries each of :data:`MERGE_TIERS` in turn, so a plain stream copy is
+    retried with bitstream and timestamp fixes, then with only the audio
+    re-encoded, before falling back to a full re-encode. Returns the name of
+    the tier that succeeded.
+    """
+
+    def _log(msg):
+        if log:
+            log(msg)
+        else:
+            app_log(msg)
+
+    started = time.monotonic()
+    for n, (mode, input_options, codec_options) in enumerate(MERGE_TIERS):
+        slots = None
+        if codec_options is None:
+            codec_options = _reencode_options()
+            slots = _reencode_semaphore()
+            while not slots.acquire(timeout=0.5):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RuntimeError("Cancelled")
+        cmd = [
+            ffmpeg_path, "-y",
+            *input_options,
+            "-f", "concat", "-safe", "0", "-i", filelist_path,
+            *codec_options,
+            "-ignore_unknown", "-fflags", "+genpts",
+            "-f", "mp4", output_path,
+        ]
+        _log(f"[FFmpeg Command] ({mode}) {' '.join(cmd)}")
+        try:
+            with profiling.span("ffmpeg", "ffmpeg", mode=mode):
+                run_ffmpeg(cmd, duration=duration, log=log, pause_event=pause_event,
+                           cancel_event=cancel_event, on_ffmpeg=on_ffmpeg,
+                           progress_cb=progress_cb, meter=meter)
+        except subprocess.CalledProcessError as e:
+            if n == len(MERGE_TIERS) - 1:
+                raise
+            if e.stderr:
+                _log(e.stderr)
+            next_mode = MERGE_TIERS[n + 1][0]
+            _log(f"Warning: FFmpeg merge ({mode}) failed, trying {next_mode}: {e}")
+            metrics.inc("ffmpeg_fallbacks_total", mode=next_mode)
+            continue
+        finally:
+            if slots is not None:
+                slots.release()
+        metrics.observe("ffmpeg_merge_seconds", time.monotonic() - started, mode=mode)
+        return mode
+    raise AssertionError("unreachable")
@@ -0,0 +1,279 @@
+"""Durable download queue backed by SQLite.
+
+Every attachment to download becomes one row. Rows survive restarts, so an
+interrupted batch can be resumed without re-fetching timelines. Jobs are keyed
+by their output location; enqueueing the same file again refreshes its URL
+(signed CDN URLs expire) but never re-opens a finished job or touches one a
+worker holds.
+
+Several processes, on one host or on several hosts sharing the database,
+can work through the same table: :meth:`JobStore.claim` takes a lease on a
+job with a single conditional UPDATE, so each file is downloaded by one
+worker. Leases are renewed while the download runs and expire after
+``claim_lease`` seconds (default 120) if the worker dies.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from .config import cfg, state_dir
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+UNFINISHED = (PENDING, RUNNING, FAILED)
+
+# Seconds a claim stays valid without being renewed
+DEFAULT_LEASE = 120
+
+# Identifies this process in the owner column of claimed jobs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    username TEXT NOT NULL DEFAULT '',
+    post_id TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL,
+    url_type TEXT NOT NULL,
+    target_dir TEXT NOT NULL,
+    output_name TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    account TEXT NOT NULL DEFAULT '',
+    owner TEXT NOT NULL DEFAULT '',
+    lease REAL NOT NULL DEFAULT 0,
+    size INTEGER,
+    duration REAL,
+    sha256 TEXT,
+    UNIQUE (target_dir, output_name, url_type)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+_COLUMNS = ("source", "username", "post_id", "title", "url", "url_type",
+            "target_dir", "output_name", "account")
+
+# Columns added after the first release, for databases created before them
+_MIGRATIONS = {
+    "account": "ALTER TABLE jobs ADD COLUMN account TEXT NOT NULL DEFAULT ''",
+    "owner": "ALTER TABLE jobs ADD COLUMN owner TEXT NOT NULL DEFAULT ''",
+    "lease": "ALTER TABLE jobs ADD COLUMN lease REAL NOT NULL DEFAULT 0",
+    "size": "ALTER TABLE jobs ADD COLUMN size INTEGER",
+    "duration": "ALTER TABLE jobs ADD COLUMN duration REAL",
+    "sha256": "ALTER TABLE jobs ADD COLUMN sha256 TEXT",
+}
+
+
+class JobStore:
+    """Thread-safe SQLite job table."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        # Jobs being downloaded by a thread of this process (see claim())
+        self._claimed: set[int] = set()
+        self._heartbeat: threading.Thread | None = None
+        self._closed = False
+        self.owner = WORKER_ID
+        self.lease = float(cfg.get("claim_lease") or DEFAULT_LEASE)
+        with self._lock, self._conn:
+            # WAL needs shared memory; hosts sharing the file over the
+            # network must use "DELETE" instead
+            self._conn.execute(f"PRAGMA journal_mode={cfg.get('job_db_journal') or 'WAL'}")
+            self._conn.executescript(_SCHEMA)
+            columns = {r[1] for r in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, statement in _MIGRATIONS.items():
+                if column not in columns:
+                    self._conn.execute(statement)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+
+    def enqueue(self, jobs: list[dict]) -> list[dict]:
+        """Insert *jobs* and return them as stored rows (with ``id``).
+
+        Existing rows are reset to ``pending`` with the new URL, unless they
+        are ``done`` or leased by a live worker (see :meth:`claim`).
+        """
+        now = time.time()
+        out = []
+        with self._lock, self._conn:
+            for job in jobs:
+                values = [str(job.get(c, "")) for c in _COLUMNS]
+                self._conn.execute(
+                    f"""INSERT INTO jobs ({", ".join(_COLUMNS)}, created, updated)
+                        VALUES ({", ".join("?" * len(_COLUMNS))}, ?, ?)
+                        ON CONFLICT (target_dir, output_name, url_type) DO UPDATE SET
+                            url = excluded.url,
+                            account = excluded.account,
+                            state = CASE WHEN state = 'done' THEN state ELSE 'pending' END,
+                            updated = excluded.updated
+                        WHERE owner = '' OR lease < ?""",
+                    (*values, now, now, now))
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE target_dir = ? AND output_name = ? AND url_type = ?",
+                    (job["target_dir"], job["output_name"], job["url_type"])).fetchone()
+                out.append(dict(row))
+        return out
+
+    def claim(self, job_id: int) -> bool:
+        """Reserve *job_id* for the calling thread; False if already claimed.
+
+        Lets concurrent syncs that discover the same file (e.g. two accounts
+        subscribed to one creator, or worker processes sharing the database)
+        download it only once. The claim ends when the job is marked anything
+        but ``running``, or when its lease runs out. Jobs already ``done`` or
+        ``cancelled`` (e.g. by another worker since the caller read the row)
+        cannot be claimed.
+        """
+        with self._lock, self._conn:
+            if job_id in self._claimed:
+                return False
+            now = time.time()
+            cur = self._conn.execute(
+                """UPDATE jobs SET owner = ?, lease = ?
+                   WHERE id = ? AND state NOT IN (?, ?)
+                       AND (owner = '' OR owner = ? OR lease < ?)""",
+                (self.owner, now + self.lease, job_id, DONE, CANCELLED, self.owner, now))
+            if cur.rowcount != 1:
+                return False
+            self._claimed.add(job_id)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(
+                    target=self._renew_leases, name="job-leases", daemon=True)
+                self._heartbeat.start()
+            return True
+
+    def reopen(self, job_id: int) -> bool:
+        """Put *job_id* back to ``pending`` if it is ``done``; True if it was.
+
+        For finished jobs whose file has gone missing, which cannot be
+        claimed otherwise.
+        """
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = ?, updated = ? WHERE id = ? AND state = ?",
+                (PENDING, time.time(), job_id, DONE))
+        return cur.rowcount == 1
+
+    def _renew_leases(self) -> None:
+        """Keep the leases of jobs claimed by this process from expiring."""
+        while True:
+            time.sleep(self.lease / 3)
+            with self._lock:
+                if self._closed:
+                    return
+                job_ids = list(self._claimed)
+                if not job_ids:
+                    continue
+                try:
+                    with self._conn:
+                        self._conn.execute(
+                            f"""UPDATE jobs SET lease = ?
+                                WHERE owner = ? AND id IN ({", ".join("?" * len(job_ids))})""",
+                            (time.time() + self.lease, self.owner, *job_ids))
+                except sqlite3.OperationalError:
+                    # Locked by another worker for too long; retry next round
+                    pass
+
+    def mark(self, job_id: int, state: str, error: str | None = None) -> None:
+        """Update the state of *job_id*."""
+        with self._lock, self._conn:
+            if state != RUNNING:
+                self._claimed.discard(job_id)
+            self._conn.execute(
+                """UPDATE jobs SET state = ?, error = ?, updated = ?,
+                       attempts = attempts + (? = 'running'),
+                       owner = CASE WHEN ? = 'running' THEN owner ELSE '' END
+                   WHERE id = ?""",
+                (state, error, time.time(), state, state, job_id))
+
+    def record_file(self, job_id: int, size: int, duration: float | None = None,
+                    sha256: str | None = None) -> None:
+        """Remember the size, duration and hash of *job_id*'s finished file."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET size = ?, duration = ?, sha256 = ? WHERE id = ?",
+                (size, duration, sha256, job_id))
+
+    def get(self, job_id: int) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def unfinished(self) -> list[dict]:
+        """Return jobs that were queued but never completed, oldest first.
+
+        Jobs leased by another live worker are left out.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT * FROM jobs WHERE state IN ({', '.join('?' * len(UNFINISHED))})
+                    AND (owner = '' OR owner = ? OR lease < ?) ORDER BY id""",
+                (*UNFINISHED, self.owner, time.time())).fetchall()
+        return [dict(r) for r in rows]
+
+    def finished(self) -> list[dict]:
+        """Return completed jobs, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE state = ? ORDER BY id", (DONE,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def discard_unfinished(self) -> int:
+        """Mark every unfinished job cancelled; return how many changed.
+
+        Jobs leased by a live worker are left alone.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                f"""UPDATE jobs SET state = 'cancelled', updated = ?
+                    WHERE state IN ({', '.join('?' * len(UNFINISHED))})
+                        AND (owner = '' OR lease < ?)""",
+                (now, *UNFINISHED, now))
+        return cur.rowcount
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+
+_store: JobStore | None = None
+_store_lock = threading.Lock()
+
+
+def default_job_db() -> str:
+    """Return the job database path (``job_db`` config key or state dir)."""
+    return cfg.get("job_db") or os.path.join(state_dir(), "jobs.sqlite3")
+
+
+def get_job_store() -> JobStore:
+    """Return the shared :class:`JobStore`, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = default_job_db()
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            _store = JobStore(path)
+        return _store
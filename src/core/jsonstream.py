@@ -0,0 +1,184 @@
+"""Incremental JSON reading for large API responses.
+
+:class:`JsonStream` decodes a body delivered as byte chunks, one JSON value at
+a time, so callers can walk into a large object and handle its members as
+they arrive instead of materialising the whole document with ``resp.json()``.
+Only the unparsed tail of the body is kept in memory. The end of each value
+is found by scanning every chunk once before the value is decoded, so a large
+value costs time linear in its size however many chunks it spans.
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+import re
+
+_WHITESPACE = " \t\r\n"
+
+# Characters that matter when looking for the end of a value
+_CONTAINER_RE = re.compile(r'["\[\]{}]')
+_STRING_RE = re.compile(r'["\\]')
+_SCALAR_END_RE = re.compile(r'[\s,\]}:]')
+
+
+class _EndScanner:
+    """Finds where a JSON value ends, fed its text piece by piece."""
+
+    def __init__(self, first: str):
+        self.scalar = first not in '{["'
+        self.in_string = first == '"'
+        self.depth = 0
+        self.escape = False
+
+    def feed(self, text: str, i: int) -> int:
+        """Scan *text* from *i*; return the index after the value's end, or -1."""
+        if self.scalar:
+            m = _SCALAR_END_RE.search(text, i)
+            return m.start() if m else -1
+        while True:
+            if self.escape:
+                # The character after a backslash, possibly in the next piece
+                if i >= len(text):
+                    return -1
+                i += 1
+                self.escape = False
+            if self.in_string:
+                m = _STRING_RE.search(text, i)
+                if not m:
+                    return -1
+                i = m.end()
+                if m.group() == "\\":
+                    self.escape = True
+                    continue
+                self.in_string = False
+                if not self.depth:
+                    return i
+                continue
+            m = _CONTAINER_RE.search(text, i)
+            if not m:
+                return -1
+            i = m.end()
+            char = m.group()
+            if char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if not self.depth:
+                    return i
+
+
+class JsonStream:
+    """Cursor over a JSON document arriving as an iterable of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read(self) -> str | None:
+        """Return the text of the next chunk, or None at end of body."""
+        if self._eof:
+            return None
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            return self._text.decode(b"", final=True) or None
+        return self._text.decode(chunk)
+
+    def _fill(self) -> bool:
+        """Append the next chunk to the buffer; return False at end of body."""
+        tail = self._read()
+        if tail is None:
+            return False
+        self._buf = self._buf[self._pos:] + tail
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character ("" at end of body)."""
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        """Consume *char*, raising ``ValueError`` if something else follows."""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self._pos += 1
+
+    def value(self):
+        """Decode and return the next complete JSON value.
+
+        Chunks are collected until the value's end is found (a scalar also
+        needs the character after it, as a number may continue in the next
+        chunk), then the value is decoded once.
+        """
+        first = self.peek()
+        start = self._pos
+        scanner = _EndScanner(first)
+        end = scanner.feed(self._buf, start + (first == '"')) if first else -1
+        if end < 0 and first:
+            parts = [self._buf[start:]]
+            while True:
+                tail = self._read()
+                if tail is None:
+                    break
+                parts.append(tail)
+                if scanner.feed(tail, 0) >= 0:
+                    break
+            self._buf = "".join(parts)
+            self._pos = 0
+        obj, self._pos = self._decoder.raw_decode(self._buf, self._pos)
+        return obj
+
+    def more(self, close: str) -> bool:
+        """Consume the separator after a member; False once *close* is reached."""
+        char = self.peek()
+        self._pos += 1
+        if char == close:
+            return False
+        if char != ",":
+            raise ValueError(f"Expected ',' or {close!r} in JSON stream, found {char!r}")
+        return True
+
+    def iter_object(self):
+        """Yield the keys of the object at the cursor.
+
+        After each key the cursor sits on its value, which the caller must
+        consume (e.g. with :meth:`value` or :meth:`iter_array`) before
+        advancing the generator.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if not self.more("}"):
+                return
+
+    def iter_array(self):
+        """Yield the elements of the array at the cursor one by one."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if not self.more("]"):
+                return
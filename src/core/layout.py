@@ -0,0 +1,112 @@
+"""Where downloads are written: layout templates and storage targets.
+
+A post's files go to ``<target>/<layout>``. The layout comes from the
+``layout`` config key, a ``/``-separated template with the fields
+``{username}``, ``{post_id}``, ``{title}``, ``{month}``, ``{source}`` and
+``{prefix}`` (the first ``layout_prefix_len`` characters of the post id,
+default 3). The default ``{username}/{post_id}-{title}`` is the historical
+layout; ``{username}/{month}/{post_id}-{title}`` or
+``{username}/{prefix}/{post_id}-{title}`` keep creator folders small.
+
+The target is the download directory, or one of ``storage_targets`` as
+well, chosen per post by ``storage_policy``: ``free_space`` (default, the
+target with the most room) or ``round_robin``. A post that already has a
+folder on some target stays there. HLS segments can be assembled on a
+separate volume with ``temp_dir``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import os
+import shutil
+import threading
+
+from .config import cfg
+
+DEFAULT_LAYOUT = "{username}/{post_id}-{title}"
+DEFAULT_PREFIX_LEN = 3
+STORAGE_POLICIES = ("free_space", "round_robin")
+
+_round_robin = itertools.count()
+_round_robin_lock = threading.Lock()
+
+
+def existing_ancestor(path: str) -> str | None:
+    """Return the nearest existing directory at or above *path*."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    return path
+
+
+def free_space(path: str) -> int | None:
+    """Return free bytes on the volume that holds (or will hold) *path*."""
+    path = existing_ancestor(path)
+    if path is None:
+        return None
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+def relative_dir(fields: dict) -> str:
+    """Return the post directory for *fields*, relative to the target.
+
+    *fields* must already be safe as path components. Segments that come
+    out empty are dropped.
+    """
+    template = cfg.get("layout") or DEFAULT_LAYOUT
+    prefix_len = int(cfg.get("layout_prefix_len") or DEFAULT_PREFIX_LEN)
+    values = dict(fields)
+    values.setdefault("prefix", str(fields.get("post_id", ""))[:prefix_len] or "0")
+    parts = [part.format(**values) for part in template.split("/")]
+    return os.path.join(*[p for p in parts if p.strip()])
+
+
+def storage_targets(download_dir: str) -> list[str]:
+    """Return *download_dir* followed by the ``storage_targets`` config key."""
+    targets = [download_dir]
+    for target in cfg.get("storage_targets") or []:
+        if target and target not in targets:
+            targets.append(target)
+    return targets
+
+
+def choose_target(rel: str, download_dir: str) -> str:
+    """Return the target directory that should hold the post folder *rel*."""
+    targets = storage_targets(download_dir)
+    if len(targets) == 1:
+        return targets[0]
+    for target in targets:
+        if os.path.isdir(os.path.join(target, rel)):
+            return target
+    if (cfg.get("storage_policy") or "free_space") == "round_robin":
+        with _round_robin_lock:
+            return targets[next(_round_robin) % len(targets)]
+    return max(targets, key=lambda t: free_space(t) or 0)
+
+
+def post_dir(download_dir: str, fields: dict) -> str:
+    """Return the absolute-or-relative directory for a post's files."""
+    rel = relative_dir(fields)
+    return os.path.join(choose_target(rel, download_dir), rel)
+
+
+def work_dir(target_dir: str, output_name: str) -> str:
+    """Return the directory for temporary HLS files of one output.
+
+    This is *target_dir* itself unless ``temp_dir`` is configured, in which
+    case each output gets its own subdirectory there.
+    """
+    temp = cfg.get("temp_dir")
+    if not temp:
+        return target_dir
+    digest = hashlib.sha1(
+        os.path.join(os.path.abspath(target_dir), output_name).encode("utf-8")).hexdigest()
+    return os.path.join(temp, digest[:16])
@@ -0,0 +1,285 @@
+"""Lightweight in-process metrics for requests and downloads.
+
+Counters, gauges and latency histograms are keyed by name plus a small set of
+labels (e.g. ``endpoint="timeline"``). Per-job throughput is tracked separately by
+:class:`JobMeter`. Everything is thread-safe and can be rendered as JSON or
+Prometheus text exposition format.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import deque
+
+from . import profiling
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Window used for the "current" overall transfer rate
+RATE_WINDOW = 10.0
+
+# Finished jobs kept in snapshots; older ones are dropped
+MAX_FINISHED_JOBS = 200
+
+_lock = threading.Lock()
+_counters: dict = {}
+_gauges: dict = {}
+_histograms: dict = {}
+_jobs: dict = {}
+_recent_bytes: deque = deque()  # (timestamp, nbytes)
+_started = time.monotonic()
+_total_bytes = 0
+_job_seq = 0
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Increment counter *name* by *value*."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Set gauge *name* to its current *value*."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record *value* (seconds) in histogram *name*."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {
+                "buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "sum": 0.0, "max": 0.0}
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                hist["buckets"][i] += 1
+                break
+        hist["count"] += 1
+        hist["sum"] += value
+        hist["max"] = max(hist["max"], value)
+
+
+class timer:
+    """Context manager observing the elapsed time of its block."""
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.monotonic() - self.start, **self.labels)
+        return False
+
+
+def _record_bytes(nbytes: int) -> None:
+    global _total_bytes
+    now = time.monotonic()
+    _total_bytes += nbytes
+    _recent_bytes.append((now, nbytes))
+    while _recent_bytes and now - _recent_bytes[0][0] > RATE_WINDOW:
+        _recent_bytes.popleft()
+
+
+class JobMeter:
+    """Track bytes, wall time and paused time for a single download job."""
+
+    def __init__(self, name: str, kind: str = ""):
+        global _job_seq
+        self.name = name
+        self.kind = kind
+        self.bytes = 0
+        self.paused = 0.0
+        self.started = time.monotonic()
+        self.finished = None
+        with _lock:
+            _job_seq += 1
+            self.id = _job_seq
+            _jobs[self.id] = self
+
+    def add_bytes(self, nbytes: int) -> None:
+        with _lock:
+            self.bytes += nbytes
+            _record_bytes(nbytes)
+
+    def wait_if_paused(self, pause_event) -> None:
+        """Block on *pause_event* and account the time spent waiting."""
+        if pause_event is None or pause_event.is_set():
+            return
+        start = time.monotonic()
+        with profiling.span("pause_wait", "pause", job=self.name):
+            pause_event.wait()
+        self.add_paused(time.monotonic() - start)
+
+    def add_paused(self, seconds: float) -> None:
+        """Account *seconds* spent paused."""
+        with _lock:
+            self.paused += seconds
+        inc("pause_seconds_total", seconds)
+
+    def finish(self, status: str = "done") -> None:
+        if self.finished is not None:
+            return
+        self.finished = time.monotonic()
+        inc("jobs_total", status=status)
+        with _lock:
+            done = [k for k, job in _jobs.items() if job.finished is not None]
+            for k in done[:-MAX_FINISHED_JOBS]:
+                del _jobs[k]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is None:
+            self.finish()
+        elif isinstance(exc, RuntimeError) and str(exc) == "Cancelled":
+            self.finish("cancelled")
+        else:
+            self.finish("failed")
+        return False
+
+    def as_dict(self) -> dict:
+        end = self.finished or time.monotonic()
+        active = max(end - self.started - self.paused, 1e-9)
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "bytes": self.bytes,
+            "seconds": round(end - self.started, 3),
+            "paused_seconds": round(self.paused, 3),
+            "bytes_per_sec": round(self.bytes / active, 1),
+            "running": self.finished is None,
+        }
+
+
+def snapshot() -> dict:
+    """Return a JSON-serialisable view of all collected metrics."""
+    now = time.monotonic()
+    with _lock:
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+        gauges = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_gauges.items())
+        ]
+        histograms = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": h["count"],
+                "sum": round(h["sum"], 6),
+                "avg": round(h["sum"] / h["count"], 6) if h["count"] else 0.0,
+                "max": round(h["max"], 6),
+                "buckets": dict(zip(map(str, LATENCY_BUCKETS), h["buckets"])),
+            }
+            for (name, labels), h in sorted(_histograms.items())
+        ]
+        jobs = [job.as_dict() for job in _jobs.values()]
+        window = [b for t, b in _recent_bytes if now - t <= RATE_WINDOW]
+        total_bytes = _total_bytes
+    return {
+        "uptime_seconds": round(now - _started, 3),
+        "bytes_total": total_bytes,
+        "bytes_per_sec_overall": round(total_bytes / max(now - _started, 1e-9), 1),
+        "bytes_per_sec_current": round(sum(window) / RATE_WINDOW, 1),
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": histograms,
+        "jobs": jobs,
+    }
+
+
+def to_json(indent: int | None = 2) -> str:
+    """Render :func:`snapshot` as JSON."""
+    return json.dumps(snapshot(), indent=indent, ensure_ascii=False)
+
+
+def _prom_escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(labels: dict, extra: dict | None = None) -> str:
+    items = dict(labels)
+    if extra:
+        items.update(extra)
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{_prom_escape(v)}"' for k, v in items.items())
+    return "{" + body + "}"
+
+
+def to_prometheus() -> str:
+    """Render metrics in the Prometheus text exposition format."""
+    snap = snapshot()
+    lines = [
+        "# TYPE candfans_bytes_total counter",
+        f"candfans_bytes_total {snap['bytes_total']}",
+        "# TYPE candfans_bytes_per_second gauge",
+        f"candfans_bytes_per_second {snap['bytes_per_sec_current']}",
+    ]
+    seen = set()
+    for c in snap["counters"]:
+        name = f"candfans_{c['name']}"
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_prom_labels(c['labels'])} {c['value']}")
+    for g in snap["gauges"]:
+        name = f"candfans_{g['name']}"
+        if name not in seen:
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(f"{name}{_prom_labels(g['labels'])} {g['value']}")
+    for h in snap["histograms"]:
+        name = f"candfans_{h['name']}"
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cumulative = 0
+        for bound, count in h["buckets"].items():
+            cumulative += count
+            lines.append(
+                f"{name}_bucket{_prom_labels(h['labels'], {'le': bound})} {cumulative}")
+        lines.append(
+            f"{name}_bucket{_prom_labels(h['labels'], {'le': '+Inf'})} {h['count']}")
+        lines.append(f"{name}_sum{_prom_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_prom_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(path: str, fmt: str = "json") -> None:
+    """Write metrics to *path* as ``json`` or ``prometheus`` text."""
+    text = to_prometheus() if fmt == "prometheus" else to_json()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def reset() -> None:
+    """Drop all collected metrics."""
+    global _started, _total_bytes
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+        _jobs.clear()
+        _recent_bytes.clear()
+        _started = time.monotonic()
+        _total_bytes = 0
@@ -1,9 +1,33 @@
+import time
+
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 
+from . import metrics, profiling
+from .config import cfg, default_credentials
+
+# Responses meaning the session cookie or XSRF token is no longer valid
+AUTH_FAILURE_STATUSES = (401, 419)
+
+# Times one request is replayed with refreshed credentials
+MAX_AUTH_REPLAYS = 2
+
+# Endpoints of the CandFans API, whose rejections a new login can fix. Media
+# requests go to signed CDN URLs that a new login does not renew, so they fail
+# right away.
+API_ENDPOINTS = frozenset({
+    "subscriptions", "user_info", "user_mine", "timeline", "purchased", "purchased_page",
+})
+
+# Seconds an API request waits for new credentials unless auth_wait_timeout is set
+DEFAULT_AUTH_WAIT_TIMEOUT = 600
 
-def _create_session() -> requests.Session:
+# Kept-alive connections per host, enough for concurrent image fetches
+POOL_SIZE = 16
+
+
+def create_session() -> requests.Session:
     """Create and configure a requests Session with retry strategy."""
     session_obj = requests.Session()
     retry_strategy = Retry(
@@ -13,7 +37,7 @@ def _create_session() -> requests.Session:
         allowed_methods=["HEAD", "GET", "OPTIONS"],
         raise_on_status=False,
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=POOL_SIZE)
     session_obj.mount("http://", adapter)
     session_obj.mount("https://", adapter)
     return session_obj
@@ -26,7 +50,7 @@ def get_session() -> requests.Session:
     """Return a shared Session instance."""
     global _session
     if _session is None:
-        _session = _create_session()
+        _session = create_session()
     return _session
 
 
@@ -34,6 +58,80 @@ def get_session() -> requests.Session:
 session = get_session()
 
 
-def safe_get(url: str, **kwargs):
-    """Wrapper around session.get with default timeout."""
-    return get_session().get(url, timeout=10, **kwargs)
+def retry_count(resp) -> int:
+    """Return how many times urllib3 retried the request behind *resp*."""
+    retries = getattr(getattr(resp, "raw", None), "retries", None)
+    return len(getattr(retries, "history", None) or ())
+
+
+def _send(session, method: str, url: str, endpoint: str, **kwargs):
+    start = time.monotonic()
+    try:
+        with profiling.span(f"{method} {endpoint}", "network"):
+            resp = session.request(method, url, timeout=10, **kwargs)
+    except requests.RequestException as e:
+        metrics.inc("request_errors_total", endpoint=endpoint,
+                    error=type(e).__name__)
+        raise
+    finally:
+        metrics.observe("request_seconds", time.monotonic() - start,
+                        endpoint=endpoint)
+    metrics.inc("requests_total", endpoint=endpoint, status=resp.status_code)
+    retries = retry_count(resp)
+    if retries:
+        metrics.inc("request_retries_total", retries, endpoint=endpoint)
+    return resp
+
+
+def _request(method: str, url: str, endpoint: str, extra_headers=None, account=None,
+             **kwargs):
+    """Send a request, using the account's credentials unless ``headers`` is given.
+
+    *account* is a :class:`core.accounts.Account`; without one the global
+    session and the credentials from ``config.yaml`` are used. A 401/419
+    response to an API request (see :data:`API_ENDPOINTS`) blocks the
+    calling thread until the credentials are renewed (see
+    :class:`core.config.Credentials`) or ``auth_wait_timeout`` passes, and
+    then replays the request with the new headers. Other responses are
+    returned as they are. Explicit ``headers`` are sent as-is, which login
+    checks rely on.
+    """
+    session = account.session if account is not None else get_session()
+    if account is not None:
+        account.throttle()
+    if "headers" in kwargs:
+        return _send(session, method, url, endpoint, **kwargs)
+    credentials = account.credentials if account is not None else default_credentials()
+    timeout = cfg.get("auth_wait_timeout")
+    timeout = DEFAULT_AUTH_WAIT_TIMEOUT if timeout is None else float(timeout)
+    for _ in range(MAX_AUTH_REPLAYS + 1):
+        headers, generation = credentials.snapshot()
+        if extra_headers:
+            headers.update(extra_headers)
+        resp = _send(session, method, url, endpoint, headers=headers, **kwargs)
+        if resp.status_code not in AUTH_FAILURE_STATUSES or endpoint not in API_ENDPOINTS:
+            return resp
+        metrics.inc("auth_failures_total", endpoint=endpoint)
+        resp.close()
+        if not credentials.wait(generation, timeout):
+            return resp
+        metrics.inc("auth_replays_total", endpoint=endpoint)
+    return resp
+
+
+def safe_get(url: str, endpoint: str = "other", extra_headers=None, account=None, **kwargs):
+    """Wrapper around session.get with default timeout.
+
+    *endpoint* labels the request in :mod:`core.metrics`; latency is measured
+    up to the response headers, so streamed bodies are not included. Unless
+    ``headers`` is passed, the credentials of *account* (or the global ones)
+    plus *extra_headers* are sent and an expired session is waited out (see
+    :func:`_request`).
+    """
+    return _request("GET", url, endpoint, extra_headers, account, **kwargs)
+
+
+def safe_head(url: str, endpoint: str = "other", extra_headers=None, account=None, **kwargs):
+    """Like :func:`safe_get` but issues a HEAD request (redirects followed)."""
+    kwargs.setdefault("allow_redirects", True)
+    return _request("HEAD", url, endpoint, extra_headers, account, **kwargs)
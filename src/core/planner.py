@@ -0,0 +1,209 @@
+"""Preflight planning for download batches.
+
+Before a batch starts, every job is probed concurrently: direct files with a
+HEAD request, HLS playlists by fetching the playlist and one segment. The
+resulting :func:`plan_jobs` report gives the batch size, an estimated
+duration and whether the volumes it writes to have room for it, and
+:func:`order_jobs` can use it to reorder the queue.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+from . import metrics
+from .accounts import get_account
+from .config import cfg
+from .ffmpeg import playlist_duration
+from .layout import existing_ancestor, free_space, work_dir
+from .network import safe_get, safe_head
+
+# Probes issued in parallel
+PLAN_WORKERS = 8
+
+# HLS downloads keep the segments on disk until the merge finishes
+M3U8_SPACE_FACTOR = 2
+
+# Free space kept in reserve on top of the estimate
+SPACE_MARGIN = 256 * 1024 * 1024
+
+ORDER_POLICIES = ("fifo", "smallest_first", "round_robin")
+
+
+def _content_length(resp) -> int | None:
+    try:
+        return int(resp.headers["content-length"]) or None
+    except (KeyError, ValueError):
+        return None
+
+
+def _probe_m3u8(url: str, account=None) -> dict:
+    r = safe_get(url, endpoint="playlist", account=account)
+    r.raise_for_status()
+    lines = [l.strip() for l in r.text.splitlines() if l.strip()]
+    for i, l in enumerate(lines):
+        if l.startswith("#EXT-X-STREAM-INF") and i + 1 < len(lines):
+            sub_url = urljoin(url.rsplit("/", 1)[0] + "/", lines[i + 1])
+            return _probe_m3u8(sub_url, account)
+    segments = [urljoin(url.rsplit("/", 1)[0] + "/", l)
+                for l in lines if not l.startswith("#")]
+    info = {"segments": len(segments), "duration": playlist_duration(r.text),
+            "size": None}
+    if segments:
+        head = safe_head(segments[0], endpoint="plan", account=account)
+        if head.ok and _content_length(head):
+            info["size"] = _content_length(head) * len(segments)
+    return info
+
+
+def probe_job(job: dict) -> dict:
+    """Return ``{"size", "duration", "segments", "error"}`` for one job.
+
+    Sizes of HLS jobs are estimated from the first segment. Probes use the
+    session of the job's ``account``.
+    """
+    info = {"size": None, "duration": None, "segments": None, "error": None}
+    account = get_account(job.get("account"))
+    try:
+        if job["url_type"] == "m3u8":
+            info.update(_probe_m3u8(job["url"], account))
+        else:
+            resp = safe_head(job["url"], endpoint="plan", account=account)
+            resp.raise_for_status()
+            info["size"] = _content_length(resp)
+    except requests.RequestException as e:
+        info["error"] = str(e)
+    return info
+
+
+def _volume(path: str):
+    """Return an identifier of the volume that holds (or will hold) *path*."""
+    existing = existing_ancestor(path)
+    if existing is None:
+        return None
+    try:
+        return os.stat(existing).st_dev
+    except OSError:
+        return existing
+
+
+def _throughput() -> float:
+    """Bytes/sec used for time estimates (``plan_bandwidth_mbps`` or observed)."""
+    configured = cfg.get("plan_bandwidth_mbps")
+    if configured:
+        return float(configured) * 1024 * 1024 / 8
+    return metrics.snapshot()["bytes_per_sec_overall"]
+
+
+def plan_jobs(jobs: list[dict], download_dir: str, cancel_event=None) -> dict:
+    """Probe *jobs* concurrently and summarise the batch.
+
+    Returns a dict with ``total_bytes`` (known sizes only), ``unknown`` (jobs
+    whose size could not be determined), ``required_bytes`` (disk space
+    needed, counting HLS temporary segments), ``free_bytes`` (summed over
+    the volumes the batch writes to), ``fits`` (every volume has room),
+    ``duration`` (seconds of video), ``eta_seconds`` (``None`` without a
+    throughput estimate) and ``sizes`` mapping job ``id`` to its probe.
+    """
+    def probe(job):
+        if cancel_event is not None and cancel_event.is_set():
+            return {"size": None, "duration": None, "segments": None, "error": "Cancelled"}
+        return probe_job(job)
+
+    workers = max(int(cfg.get("plan_workers") or PLAN_WORKERS), 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan") as pool:
+        probes = list(pool.map(probe, jobs))
+
+    total = 0
+    duration = 0.0
+    unknown = 0
+    # Volume -> [bytes needed, a path on it]; jobs may span storage targets
+    volumes: dict = {_volume(download_dir): [0, download_dir]}
+
+    def need(path, nbytes):
+        entry = volumes.setdefault(_volume(path), [0, path])
+        entry[0] += nbytes
+
+    for job, info in zip(jobs, probes):
+        if info["size"] is None:
+            unknown += 1
+            continue
+        total += info["size"]
+        need(job["target_dir"], info["size"])
+        if job["url_type"] == "m3u8":
+            # Segments stay on disk until the merge finishes
+            need(work_dir(job["target_dir"], job["output_name"]),
+                 info["size"] * (M3U8_SPACE_FACTOR - 1))
+        duration += info["duration"] or 0.0
+    required = sum(n for n, _ in volumes.values())
+    frees = [(n, free_space(path)) for n, path in volumes.values()]
+    known = [free for _, free in frees if free is not None]
+    free = sum(known) if known else None
+    rate = _throughput()
+    return {
+        "jobs": len(jobs),
+        "total_bytes": total,
+        "required_bytes": required,
+        "unknown": unknown,
+        "free_bytes": free,
+        "fits": all(f is None or n == 0 or n + SPACE_MARGIN <= f for n, f in frees),
+        "duration": duration,
+        "eta_seconds": total / rate if rate else None,
+        "sizes": {job.get("id"): info for job, info in zip(jobs, probes)},
+    }
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def format_plan(plan: dict) -> str:
+    """Return a one-line human readable summary of *plan*."""
+    parts = [f"{plan['jobs']} file(s), {_fmt_bytes(plan['total_bytes'])}"]
+    if plan["unknown"]:
+        parts.append(f"{plan['unknown']} of unknown size")
+    if plan["duration"]:
+        parts.append(f"{plan['duration'] / 60:.0f} min of video")
+    if plan["eta_seconds"] is not None:
+        parts.append(f"about {plan['eta_seconds'] / 60:.0f} min to download")
+    if plan["free_bytes"] is not None:
+        parts.append(f"{_fmt_bytes(plan['free_bytes'])} free")
+    return "[Plan] " + ", ".join(parts)
+
+
+def order_jobs(jobs: list[dict], policy: str | None = None, plan: dict | None = None) -> list[dict]:
+    """Return *jobs* reordered by *policy* (``download_order`` config key).
+
+    ``fifo`` keeps the queue order, ``smallest_first`` uses the sizes in
+    *plan* (unknown sizes last) and ``round_robin`` interleaves creators so
+    one large account does not hold up the others.
+    """
+    policy = policy or cfg.get("download_order") or "fifo"
+    if policy == "smallest_first" and plan is not None:
+        sizes = plan["sizes"]
+
+        def size(job):
+            value = sizes.get(job.get("id"), {}).get("size")
+            return (value is None, value or 0)
+
+        return sorted(jobs, key=size)
+    if policy == "round_robin":
+        by_user: dict = {}
+        for job in jobs:
+            by_user.setdefault(job.get("username", ""), []).append(job)
+        ordered = []
+        queues = list(by_user.values())
+        while queues:
+            for q in queues:
+                ordered.append(q.pop(0))
+            queues = [q for q in queues if q]
+        return ordered
+    return list(jobs)
@@ -0,0 +1,171 @@
+"""Opt-in timing spans written as a Chrome trace-event file.
+
+Enable with the ``CANDFANS_PROFILE`` environment variable (a file path, or
+``1`` for ``candfans-trace.json``) or the ``profile_trace`` config key. Events
+are streamed to disk as they happen using the JSON array form of the trace
+format, so a trace survives a crash or a frozen GUI and can be opened directly
+in ``chrome://tracing`` or Perfetto.
+"""
+
+from __future__ import annotations
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+ENV_VAR = "CANDFANS_PROFILE"
+DEFAULT_TRACE_PATH = "candfans-trace.json"
+FLUSH_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_file = None
+_path: str | None = None
+_named_threads: set = set()
+_last_flush = 0.0
+_pid = os.getpid()
+
+
+def is_enabled() -> bool:
+    return _file is not None
+
+
+def enable(path: str) -> None:
+    """Start streaming trace events to *path*."""
+    global _file, _path
+    with _lock:
+        if _file is not None:
+            return
+        _path = path
+        _file = open(path, "w", encoding="utf-8")
+        _file.write("[\n")
+        _named_threads.clear()
+    atexit.register(disable)
+
+
+def disable() -> None:
+    """Stop tracing and close the trace file."""
+    global _file
+    with _lock:
+        if _file is None:
+            return
+        _file.write("{}]\n")
+        _file.close()
+        _file = None
+
+
+def configure(cfg: dict | None = None, suffix: str = "") -> str | None:
+    """Enable tracing from the environment or *cfg*; return the trace path.
+
+    *suffix* goes before the file extension, so processes that run at the
+    same time each write a trace of their own.
+    """
+    path = os.environ.get(ENV_VAR) or (cfg or {}).get("profile_trace")
+    if not path or path == "0":
+        return None
+    if path == "1":
+        path = DEFAULT_TRACE_PATH
+    if suffix:
+        root, ext = os.path.splitext(path)
+        path = f"{root}{suffix}{ext}"
+    enable(path)
+    return path
+
+
+def _now_us() -> float:
+    return time.perf_counter_ns() / 1000
+
+
+def _emit(event: dict) -> None:
+    global _last_flush
+    thread = threading.current_thread()
+    tid = thread.ident
+    with _lock:
+        if _file is None:
+            return
+        if tid not in _named_threads:
+            _named_threads.add(tid)
+            _file.write(json.dumps({
+                "name": "thread_name", "ph": "M", "pid": _pid, "tid": tid,
+                "args": {"name": thread.name}}) + ",\n")
+        event["pid"] = _pid
+        event["tid"] = tid
+        _file.write(json.dumps(event, ensure_ascii=False, default=str) + ",\n")
+        now = time.monotonic()
+        if now - _last_flush >= FLUSH_INTERVAL:
+            _file.flush()
+            _last_flush = now
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = _now_us()
+        args = self.args
+        if exc is not None:
+            args = dict(args or {}, error=repr(exc))
+        event = {"name": self.name, "cat": self.cat, "ph": "X",
+                 "ts": self.start, "dur": end - self.start}
+        if args:
+            event["args"] = args
+        _emit(event)
+        return False
+
+
+def span(name: str, cat: str = "app", **args):
+    """Return a context manager recording *name* as a complete event.
+
+    Costs a single attribute check when profiling is disabled.
+    """
+    if _file is None:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def traced(name: str | None = None, cat: str = "app"):
+    """Decorator wrapping each call of the function in a :func:`span`."""
+
+    def decorator(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if _file is None:
+                return fn(*a, **kw)
+            with _Span(label, cat, None):
+                return fn(*a, **kw)
+
+        return wrapper
+
+    return decorator
+
+
+def instant(name: str, cat: str = "app", **args) -> None:
+    """Record a point-in-time marker."""
+    if _file is None:
+        return
+    _emit({"name": name, "cat": cat, "ph": "i", "s": "t", "ts": _now_us(), "args": args})
@@ -0,0 +1,196 @@
+"""Priority and fair-share ordering for a running download batch.
+
+:class:`DownloadQueue` hands out jobs one at a time instead of in a fixed
+order, so priorities can change while the batch runs. The next job is the
+one with the highest priority; among equal priorities, weighted fair
+sharing picks the creator (or source) that has received the least of its
+share so far, so a creator with hundreds of long videos cannot hold up
+everyone else's new posts.
+
+Configured in ``config.yaml``::
+
+    priorities:
+      creator: {some_creator: 10}
+      type: {jpg: 5}
+      source: {purchased: 1}
+    newest_first: true
+    fair_share: creator          # or "source"; omit to disable
+    fair_weights: {some_creator: 2, subscription: 3}
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+
+from .config import cfg
+
+PRIORITY_KINDS = {"creator": "username", "type": "url_type", "source": "source"}
+FAIR_SHARE_KEYS = {"creator": "username", "source": "source"}
+
+
+def _post_order(job: dict) -> int:
+    try:
+        return -int(job.get("post_id") or 0)
+    except ValueError:
+        return 0
+
+
+class DownloadQueue:
+    """Thread-safe queue of jobs ordered by priority and fair share.
+
+    *sizes* maps job ``id`` to a probe from :func:`core.planner.plan_jobs`;
+    with it, fair sharing is measured in bytes, otherwise in jobs.
+    """
+
+    def __init__(self, jobs=(), sizes: dict | None = None):
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._jobs: dict = {}       # id -> job, pending only
+        self._seq: dict = {}        # id -> insertion order
+        self._version: dict = {}    # id -> version of its live heap entry
+        self._explicit: dict = {}   # id -> priority set with set_priority()
+        self._heaps: dict = {}      # group -> heap of entries
+        self._served: dict = {}     # group -> cost handed out so far
+        self._rules = {kind: dict((cfg.get("priorities") or {}).get(kind) or {})
+                       for kind in PRIORITY_KINDS}
+        self._newest_first = bool(cfg.get("newest_first"))
+        self._share_key = FAIR_SHARE_KEYS.get(cfg.get("fair_share") or "")
+        self._weights = cfg.get("fair_weights") or {}
+        self._sizes = {}
+        known = [p["size"] for p in (sizes or {}).values() if p.get("size")]
+        self._default_cost = sum(known) / len(known) if known else 1
+        for job_id, probe in (sizes or {}).items():
+            if probe.get("size"):
+                self._sizes[job_id] = probe["size"]
+        self.push(jobs)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def _group(self, job: dict) -> str:
+        return str(job.get(self._share_key, "")) if self._share_key else ""
+
+    def _weight(self, group: str) -> float:
+        try:
+            return max(float(self._weights.get(group, 1)), 0.01)
+        except (TypeError, ValueError):
+            return 1.0
+
+    def priority(self, job: dict) -> int:
+        """Return the effective priority of *job* (higher runs first)."""
+        explicit = self._explicit.get(job["id"])
+        if explicit is not None:
+            return explicit
+        return sum(int(self._rules[kind].get(job.get(field), 0))
+                   for kind, field in PRIORITY_KINDS.items())
+
+    def _entry(self, job: dict) -> list:
+        job_id = job["id"]
+        version = self._version.get(job_id, 0) + 1
+        self._version[job_id] = version
+        order = _post_order(job) if self._newest_first else 0
+        return [-self.priority(job), order, self._seq[job_id], version, job_id]
+
+    def _activate(self, group: str) -> None:
+        """Start a newly backlogged group at the current virtual time."""
+        active = [self._served.get(g, 0) / self._weight(g)
+                  for g, heap in self._heaps.items()
+                  if g != group and self._peek(heap) is not None]
+        floor = min(active) * self._weight(group) if active else 0
+        self._served[group] = max(self._served.get(group, 0), floor)
+
+    def push(self, jobs) -> None:
+        """Add *jobs* (rows from the job store) to the queue."""
+        with self._lock:
+            for job in jobs:
+                if job["id"] in self._jobs:
+                    continue
+                self._jobs[job["id"]] = job
+                self._seq[job["id"]] = next(self._counter)
+                group = self._group(job)
+                heap = self._heaps.setdefault(group, [])
+                if self._peek(heap) is None:
+                    self._activate(group)
+                heapq.heappush(heap, self._entry(job))
+
+    def _peek(self, heap: list):
+        while heap:
+            entry = heap[0]
+            job_id = entry[4]
+            if job_id in self._jobs and self._version.get(job_id) == entry[3]:
+                return entry
+            heapq.heappop(heap)
+        return None
+
+    def pop(self) -> dict | None:
+        """Remove and return the next job to download, or None when empty."""
+        with self._lock:
+            best = best_key = None
+            for group, heap in self._heaps.items():
+                entry = self._peek(heap)
+                if entry is None:
+                    continue
+                vtime = self._served.get(group, 0) / self._weight(group)
+                key = (entry[0], vtime, entry[1], entry[2])
+                if best_key is None or key < best_key:
+                    best, best_key = group, key
+            if best is None:
+                return None
+            entry = heapq.heappop(self._heaps[best])
+            job = self._jobs.pop(entry[4])
+            self._served[best] = (self._served.get(best, 0)
+                                  + self._sizes.get(job["id"], self._default_cost))
+            return job
+
+    def take(self, match) -> list[dict]:
+        """Remove and return the pending jobs for which *match(job)* is true."""
+        with self._lock:
+            taken = [job for job in self._jobs.values() if match(job)]
+            for job in taken:
+                del self._jobs[job["id"]]
+                self._served[self._group(job)] = (
+                    self._served.get(self._group(job), 0)
+                    + self._sizes.get(job["id"], self._default_cost))
+            return taken
+
+    def _requeue(self, job_ids) -> None:
+        for job_id in job_ids:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                heapq.heappush(self._heaps[self._group(job)], self._entry(job))
+
+    def set_priority(self, job_ids, priority: int) -> None:
+        """Give the pending *job_ids* an explicit *priority*."""
+        with self._lock:
+            job_ids = [i for i in job_ids if i in self._jobs]
+            for job_id in job_ids:
+                self._explicit[job_id] = int(priority)
+            self._requeue(job_ids)
+
+    def set_rule(self, kind: str, key: str, priority: int) -> None:
+        """Give jobs whose *kind* (creator, type or source) is *key* a priority.
+
+        Also applies to jobs pushed later.
+        """
+        field = PRIORITY_KINDS[kind]
+        with self._lock:
+            self._rules[kind][key] = int(priority)
+            self._requeue([i for i, job in self._jobs.items() if job.get(field) == key])
+
+    def promote(self, match) -> int:
+        """Move pending jobs for which *match(job)* is true to the front.
+
+        Returns how many jobs were promoted.
+        """
+        with self._lock:
+            if not self._jobs:
+                return 0
+            top = max(self.priority(job) for job in self._jobs.values())
+            job_ids = [i for i, job in self._jobs.items() if match(job)]
+            for job_id in job_ids:
+                self._explicit[job_id] = top + 1
+            self._requeue(job_ids)
+            return len(job_ids)
@@ -0,0 +1,52 @@
+"""Splitting a batch between worker processes.
+
+A :class:`Shard` is one worker's part of the job list. Jobs are assigned by
+a stable hash of the creator or of the post id, so every worker computes
+the same split without talking to the others. Workers on several hosts can
+share the download folder and job database (see :mod:`core.jobs`); claims
+on the job store keep overlapping shards from downloading a file twice.
+"""
+
+from __future__ import annotations
+
+import zlib
+
+SHARD_KEYS = ("post", "creator")
+
+
+class Shard:
+    """Part *index* (0-based) of *count*, split by *key* (post or creator)."""
+
+    def __init__(self, index: int, count: int, key: str = "post"):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index + 1}/{count}")
+        if key not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key: {key}")
+        self.index = index
+        self.count = count
+        self.key = key
+
+    def __repr__(self) -> str:
+        return f"Shard({self.index + 1}/{self.count} by {self.key})"
+
+    @classmethod
+    def parse(cls, spec: str, key: str = "post") -> "Shard":
+        """Return the shard for *spec*, written ``I/N`` with I from 1 to N."""
+        try:
+            index, count = (int(part) for part in spec.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid shard {spec!r}, expected I/N") from None
+        return cls(index - 1, count, key)
+
+    def _bucket(self, value) -> int:
+        return zlib.crc32(str(value).encode("utf-8")) % self.count
+
+    def owns_creator(self, username: str) -> bool:
+        """Return False if none of *username*'s posts can be in this shard."""
+        return self.key != "creator" or self._bucket(username) == self.index
+
+    def owns(self, job: dict) -> bool:
+        """Return True if *job* belongs to this shard."""
+        if self.key == "creator":
+            return self._bucket(job.get("username", "")) == self.index
+        return self._bucket(job.get("post_id", "")) == self.index
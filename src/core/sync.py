@@ -0,0 +1,328 @@
+"""Pipelined timeline sync: download while timelines are still paginating.
+
+Instead of fetching every page of every account before the first download
+starts, :func:`download_pipelined` hands the jobs found on each page to the
+downloader as soon as the page arrives. A bounded queue between the two sides
+provides backpressure, so fetching pauses while too many jobs are waiting.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+
+from . import jobs as jobstore
+from . import metrics, profiling
+from .api import get_subscription_list, get_timeline, get_user_info_by_code, parse_subscription_list
+from .app_log import log as app_log
+from .config import cfg
+from .downloader import build_post_jobs, claim_job, download_images, download_job, job_output_path
+
+TIMELINE_PAGE_SIZE = 12
+
+# Jobs allowed to wait for download before fetching blocks
+DEFAULT_PREFETCH_QUEUE = 32
+
+_END = object()
+
+
+def resolve_creators(user_codes: list[str] | None = None, account=None) -> list[dict]:
+    """Return creator dicts for *user_codes*, or for all subscriptions.
+
+    *account* (:class:`core.accounts.Account`) selects whose subscriptions
+    are listed; defaults to the login in ``config.yaml``.
+    """
+    if not user_codes:
+        user_codes = [s["user_code"]
+                      for s in parse_subscription_list(get_subscription_list(account))]
+    return [get_user_info_by_code(code, account) for code in user_codes]
+
+
+def iter_timeline(creator: dict, max_pages: int | None = None, account=None,
+                  cancel_event=None):
+    """Yield the posts of *creator*'s timeline one page at a time.
+
+    Stops before fetching another page once *cancel_event* is set.
+    """
+    page = 1
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        with profiling.span("timeline_page", "fetch", user=creator["username"], page=page):
+            posts = get_timeline(creator["user_id"], page=page, record=TIMELINE_PAGE_SIZE,
+                                 account=account)
+        yield posts
+        if (max_pages and page >= max_pages) or len(posts) < TIMELINE_PAGE_SIZE:
+            return
+        page += 1
+
+
+def timeline_jobs(creator: dict, posts: list, download_dir: str,
+                  url_types=None, keyword: str = "", account=None) -> list[dict]:
+    """Return download jobs for *posts* matching *keyword* and *url_types*."""
+    jobs = []
+    for post in posts:
+        title = post.get("title", "")
+        if keyword and keyword not in title:
+            continue
+        jobs += [
+            job for job in build_post_jobs(
+                "subscription", creator["username"], post.get("post_id"), title,
+                post.get("attachments", []), download_dir,
+                account.name if account is not None else "", post.get("month") or "")
+            if not url_types or job["url_type"] in url_types
+        ]
+    return jobs
+
+
+def download_pipelined(
+        produce,
+        log=None,
+        pause_event=None,
+        cancel_event=None,
+        on_ffmpeg=None,
+        progress_cb=None,
+        maxsize: int | None = None,
+        controls=None,
+) -> dict:
+    """Download jobs while *produce* is still discovering them.
+
+    Parameters
+    ----------
+    produce: callable
+        Run on a separate thread with a ``put(jobs)`` function. Each call
+        records *jobs* in the job store and queues them for download,
+        blocking while ``maxsize`` jobs are waiting. It should also stop
+        fetching once *cancel_event* is set, as ``put`` is not called for
+        pages without jobs (see :func:`iter_timeline`).
+    maxsize: int, optional
+        Queue bound; defaults to the ``prefetch_queue`` config key (32).
+    controls: core.control.JobControls, optional
+        Per-job pause and cancel. Jobs are registered as they are queued and
+        downloaded with their own events and FFmpeg tracking (instead of
+        *on_ffmpeg*); a job paused on its own is moved aside and the next
+        one started, and the batch ends once paused jobs have finished or
+        been cancelled.
+
+    Jobs are downloaded one at a time in the order they were found;
+    the images of a post are fetched together (see
+    :func:`core.downloader.download_images`).
+    Returns counts of ``downloaded``, ``skipped`` and ``failed`` jobs. An
+    exception raised by *produce* is re-raised after the jobs queued before
+    it have been downloaded.
+    """
+
+    def _log(msg):
+        if log:
+            log(msg)
+        else:
+            app_log(msg)
+
+    def _cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    store = jobstore.get_job_store()
+    maxsize = maxsize or int(cfg.get("prefetch_queue") or DEFAULT_PREFETCH_QUEUE)
+    pending = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    errors = []
+    found = [0]
+
+    def _offer(item) -> bool:
+        waited = False
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                if not waited:
+                    waited = True
+                    metrics.inc("prefetch_backpressure_total")
+        return False
+
+    def put(jobs):
+        # The images of a post travel as one list and download together
+        items = []
+        images: dict = {}
+        jobs = store.enqueue(jobs)
+        if controls is not None:
+            controls.add(jobs)
+        for job in jobs:
+            if job["url_type"] == "jpg":
+                key = (job["username"], job["post_id"])
+                if key not in images:
+                    images[key] = []
+                    items.append(images[key])
+                images[key].append(job)
+            else:
+                items.append(job)
+        for item in items:
+            if _cancelled() or not _offer(item):
+                raise RuntimeError("Cancelled")
+            found[0] += len(item) if isinstance(item, list) else 1
+
+    def producer():
+        try:
+            produce(put)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _offer(_END)
+
+    thread = threading.Thread(target=producer, name="prefetch", daemon=True)
+    thread.start()
+    counts = {"downloaded": 0, "skipped": 0, "failed": 0}
+    counts_lock = threading.Lock()
+
+    def count(key, value=1):
+        # Jobs moved to the background finish on their own threads
+        with counts_lock:
+            counts[key] += value
+
+    def items():
+        while True:
+            if controls is not None:
+                yield from controls.take_resumed()
+            try:
+                item = pending.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _END:
+                break
+            yield item
+        # Jobs paused on their own still belong to the batch
+        while controls is not None:
+            resumed = controls.wait_for_work()
+            if not resumed:
+                break
+            yield from resumed
+
+    def process(item, n, control):
+        pause = control.pause_event if control is not None else pause_event
+        cancel = control.cancel_event if control is not None else cancel_event
+        if isinstance(item, list):
+            _log(f"[{n + 1}/{found[0]}+] {item[0]['username']} / {item[0]['title']} "
+                 f"({len(item)} images)")
+            images = [j for j in item if claim_job(store, j)]
+            count("skipped", len(item) - len(images))
+
+            def images_progress(current, total, size=len(images)):
+                if progress_cb:
+                    progress_cb(int((n + current / (total or 1) * size) * 1000 / found[0]),
+                                1000)
+
+            try:
+                for key, value in download_images(
+                        images, store, log=log, pause_event=pause,
+                        cancel_event=cancel, progress_cb=images_progress).items():
+                    count(key, value)
+            except RuntimeError:
+                if not _cancelled():
+                    _log(f"    [Cancelled] {item[0]['title']}")
+                if control is not None:
+                    controls.record_cancelled(control, images)
+            return
+        job = item
+        output_path = job_output_path(job)
+        if job["state"] == jobstore.DONE and os.path.exists(output_path):
+            count("skipped")
+            return
+        # Another sync or worker process may be fetching the same file
+        if not claim_job(store, job):
+            _log(f"    [Skipped] {job['output_name']} was taken by another sync or worker")
+            count("skipped")
+            return
+
+        def job_progress(current, total):
+            if progress_cb:
+                progress_cb(int((n + current / (total or 1)) * 1000 / found[0]), 1000)
+
+        _log(f"[{n + 1}/{found[0]}+] {job['username']} / {job['output_name']}")
+        try:
+            download_job(job, store, log=log, pause_event=pause, cancel_event=cancel,
+                         on_ffmpeg=control.on_ffmpeg if control is not None else on_ffmpeg,
+                         progress_cb=job_progress)
+            count("downloaded")
+        except Exception as e:
+            if cancel is not None and cancel.is_set():
+                if not _cancelled():
+                    _log(f"    [Cancelled] {job['output_name']}")
+                if control is not None:
+                    controls.record_cancelled(control, [job])
+                return
+            count("failed")
+            _log(f"    [Failed] {job['output_name']}: {e}")
+
+    n = 0
+    try:
+        for item in items():
+            if _cancelled():
+                _log("[Status] Cancelled")
+                return counts
+            head = item[0] if isinstance(item, list) else item
+            size = len(item) if isinstance(item, list) else 1
+            if controls is None:
+                process(item, n, None)
+            else:
+                control = controls.get(head)
+                if control.cancelled:
+                    _log(f"    [Cancelled] {head['output_name']}")
+                    count("skipped", size)
+                elif control.held:
+                    _log(f"    [Paused] {head['output_name']} starts once resumed")
+                    controls.hold(head, item)
+                    continue
+                else:
+                    controls.run(head, lambda c, item=item, n=n: process(item, n, c))
+            n += size
+    finally:
+        stop.set()
+        if controls is not None:
+            # Paused jobs may still be writing after a cancel
+            controls.wait_background()
+    if errors and not _cancelled():
+        raise errors[0]
+    return counts
+
+
+def sync_timelines(
+        creators: list[dict],
+        download_dir: str,
+        url_types=None,
+        keyword: str = "",
+        max_pages: int | None = None,
+        log=None,
+        pause_event=None,
+        cancel_event=None,
+        on_ffmpeg=None,
+        progress_cb=None,
+        account=None,
+        shard=None,
+        controls=None,
+) -> dict:
+    """Download matching attachments of *creators* while paginating.
+
+    Timelines are fetched as *account* (:class:`core.accounts.Account`),
+    and its name is recorded on the jobs so downloads use the same login.
+    With a *shard* (:class:`core.shards.Shard`) only its part of the jobs
+    is queued. Fetching stops once *cancel_event* is set, even on pages
+    without matching jobs. See :func:`download_pipelined` for *controls*
+    and the return value.
+    """
+
+    def produce(put):
+        for creator in creators:
+            if shard is not None and not shard.owns_creator(creator["username"]):
+                continue
+            for posts in iter_timeline(creator, max_pages, account, cancel_event):
+                jobs = timeline_jobs(creator, posts, download_dir, url_types, keyword,
+                                     account)
+                if shard is not None:
+                    jobs = [job for job in jobs if shard.owns(job)]
+                if jobs:
+                    put(jobs)
+
+    return download_pipelined(produce, log=log, pause_event=pause_event,
+                              cancel_event=cancel_event, on_ffmpeg=on_ffmpeg,
+                              progress_cb=progress_cb, controls=controls)
@@ -0,0 +1,246 @@
+"""Thumbnail cache for previewing posts without opening the media.
+
+With ``thumbnails: true`` every download leaves a small PNG of its post in
+the cache: videos from a keyframe (HLS videos as soon as the first segment
+arrives), images downsized. :func:`preview_job` builds one on demand from
+just the first segment or the first megabytes of a video, so a post can be
+inspected without downloading it.
+
+Thumbnails are PNG so Tk can display them without extra packages. The cache
+(``thumbnail_dir``, default ``thumbnails`` next to ``config.yaml``) is
+capped at ``thumbnail_cache_mb`` (default 200); the least recently used
+files are evicted first.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+from . import metrics
+from .accounts import get_account
+from .app_log import log as app_log
+from .config import cfg, state_dir
+from .ffmpeg import run_ffmpeg
+from .network import safe_get
+
+THUMBNAIL_WIDTH = 320
+DEFAULT_CACHE_MB = 200
+
+# Bytes of a direct mp4 fetched for a preview
+DEFAULT_PREVIEW_MB = 4
+
+# Seconds into a video where the thumbnail frame is taken
+SEEK_SECONDS = 1.0
+
+
+def enabled() -> bool:
+    """Return True when thumbnails are generated during downloads."""
+    return bool(cfg.get("thumbnails"))
+
+
+def post_key(username: str, post_id) -> str:
+    """Return the cache key of a post."""
+    return hashlib.sha1(f"{username}/{post_id}".encode("utf-8")).hexdigest()
+
+
+class ThumbnailCache:
+    """Directory of PNG thumbnails with a size cap and LRU eviction.
+
+    File modification times record the last use; :meth:`get` refreshes them.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.path, key + ".png")
+
+    def get(self, key: str) -> str | None:
+        """Return the thumbnail file for *key*, or None if not cached."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key: str, media_path: str, seek: float = SEEK_SECONDS) -> str:
+        """Render a thumbnail of *media_path* (video or image) for *key*.
+
+        Raises ``subprocess.CalledProcessError`` if FFmpeg cannot decode it.
+        """
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg not found")
+        dest = self.path_for(key)
+        tmp = dest + ".tmp.png"
+        base = [ffmpeg, "-y", "-loglevel", "error"]
+        scale = ["-vf", f"scale={THUMBNAIL_WIDTH}:-2", "-frames:v", "1", tmp]
+        try:
+            try:
+                run_ffmpeg(base + ["-ss", str(seek), "-i", media_path] + scale)
+            except subprocess.CalledProcessError:
+                pass
+            if not os.path.exists(tmp):
+                # Too short to seek into, or a still image: use the first frame
+                run_ffmpeg(base + ["-i", media_path] + scale)
+            os.replace(tmp, dest)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        metrics.inc("thumbnails_total")
+        self.evict()
+        return dest
+
+    def evict(self) -> int:
+        """Delete least recently used thumbnails over the cap; return the count."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.path):
+                if entry.is_file() and entry.name.endswith(".png"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            return removed
+
+
+_cache: ThumbnailCache | None = None
+_cache_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """Return the shared :class:`ThumbnailCache`, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = cfg.get("thumbnail_dir") or os.path.join(state_dir(), "thumbnails")
+            max_mb = float(cfg.get("thumbnail_cache_mb") or DEFAULT_CACHE_MB)
+            _cache = ThumbnailCache(path, int(max_mb * 1024 * 1024))
+        return _cache
+
+
+def _render(key: str, media_path: str, cleanup: bool) -> None:
+    try:
+        get_thumbnail_cache().put(key, media_path)
+    except subprocess.CalledProcessError as e:
+        app_log(f"[Thumbnail] FFmpeg could not decode {os.path.basename(media_path)} "
+                f"(exit status {e.returncode})")
+    except (OSError, RuntimeError) as e:
+        app_log(f"[Thumbnail] Could not create a thumbnail of {os.path.basename(media_path)}: {e}")
+    finally:
+        if cleanup:
+            try:
+                os.remove(media_path)
+            except OSError:
+                pass
+
+
+def submit(job: dict, media_path: str, copy: bool = False) -> None:
+    """Render the thumbnail of *job*'s post from *media_path* in the background.
+
+    Does nothing when thumbnails are disabled or the post already has one.
+    With *copy*, *media_path* is copied first because the caller is about to
+    delete it (e.g. a TS segment before the merge cleanup).
+    """
+    global _executor
+    if not enabled():
+        return
+    key = post_key(job["username"], job["post_id"])
+    if get_thumbnail_cache().get(key):
+        return
+    if copy:
+        fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(media_path)[1])
+        os.close(fd)
+        shutil.copyfile(media_path, tmp)
+        media_path = tmp
+    with _cache_lock:
+        if _executor is None:
+            # One worker: thumbnails must not compete with downloads for CPU
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail")
+    _executor.submit(_render, key, media_path, copy)
+
+
+def _first_segment_url(url: str, account=None) -> str | None:
+    r = safe_get(url, endpoint="playlist", account=account)
+    r.raise_for_status()
+    lines = [l.strip() for l in r.text.splitlines() if l.strip()]
+    base = url.rsplit("/", 1)[0] + "/"
+    for i, l in enumerate(lines):
+        if l.startswith("#EXT-X-STREAM-INF") and i + 1 < len(lines):
+            return _first_segment_url(urljoin(base, lines[i + 1]), account)
+    for l in lines:
+        if not l.startswith("#"):
+            return urljoin(base, l)
+    return None
+
+
+def preview_job(job: dict) -> str | None:
+    """Return a thumbnail of *job*'s post, fetching only what is needed.
+
+    Uses the cached thumbnail if there is one. Otherwise HLS videos fetch
+    their first segment, direct mp4 files the first ``preview_mb`` megabytes
+    (enough when the index is at the start) and images the whole file.
+    Returns None when no frame could be decoded.
+    """
+    cache = get_thumbnail_cache()
+    key = post_key(job["username"], job["post_id"])
+    cached = cache.get(key)
+    if cached:
+        return cached
+    account = get_account(job.get("account"))
+    limit = int(float(cfg.get("preview_mb") or DEFAULT_PREVIEW_MB) * 1024 * 1024)
+    suffix = {"m3u8": ".ts", "jpg": ".jpg"}.get(job["url_type"], ".mp4")
+    fd, tmp = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        url, headers = job["url"], None
+        if job["url_type"] == "m3u8":
+            url = _first_segment_url(url, account)
+            if url is None:
+                return None
+        elif job["url_type"] == "mp4":
+            headers = {"Range": f"bytes=0-{limit - 1}"}
+        with open(tmp, "wb") as f:
+            resp = safe_get(url, endpoint="preview", extra_headers=headers,
+                            stream=True, account=account)
+            with resp:
+                resp.raise_for_status()
+                written = 0
+                for chunk in resp.iter_content(256 * 1024):
+                    f.write(chunk)
+                    written += len(chunk)
+                    # Servers ignoring Range send the whole file
+                    if headers and written >= limit:
+                        break
+        try:
+            return cache.put(key, tmp)
+        except subprocess.CalledProcessError:
+            return None
+    except requests.RequestException as e:
+        app_log(f"[Thumbnail] Preview of {job['output_name']} failed: {e}")
+        return None
+    finally:
+        os.remove(tmp)
@@ -0,0 +1,210 @@
+"""Adaptive limit on concurrent media requests.
+
+HLS segments, byte ranges of large mp4 files and images are fetched in
+parallel, but how many requests a link and the CDN sustain varies. A
+:class:`ConcurrencyController` sets the number of requests in flight with
+AIMD (additive increase, multiplicative decrease), like TCP congestion
+control. Every ``tune_interval`` seconds it looks at the last window:
+
+- errors, 429/5xx answers or retries halve the limit;
+- if every slot was busy and throughput grew, the limit goes up by one;
+- if every slot was busy, throughput stopped growing and latency rose well
+  above the best seen recently, the limit goes down by one;
+- otherwise it stays.
+
+The limit starts at ``concurrency`` (default 4) and stays between 1 and
+``concurrency_max`` (default 16). ``auto_concurrency: false`` keeps it at
+``concurrency``. Decisions are logged and published as metrics
+(``concurrency_limit`` and friends), so they show up in the statistics.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from . import metrics
+from .app_log import log as app_log
+from .config import cfg
+from .network import retry_count
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_INTERVAL = 2.0
+
+# Relative throughput gain that counts as "still growing"
+GROWTH = 0.05
+
+# Latency over the best seen, by this factor, means queues are building up
+LATENCY_FACTOR = 2.0
+
+# Per window, the best latency seen drifts up by this factor, so it follows
+# a change of workload (e.g. from images to video segments)
+LATENCY_DRIFT = 1.1
+
+# Statuses meaning the server wants fewer requests
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+
+class Slot:
+    """One request in flight; see :meth:`ConcurrencyController.slot`."""
+
+    def __init__(self, controller: "ConcurrencyController"):
+        self._controller = controller
+        self.bytes = 0
+        self.error = False
+        self.started = 0.0
+
+    def add_bytes(self, nbytes: int) -> None:
+        self.bytes += nbytes
+
+    def response(self, resp) -> None:
+        """Note the status and urllib3 retries of *resp*."""
+        if resp.status_code in OVERLOAD_STATUSES or retry_count(resp):
+            self.error = True
+
+    @contextmanager
+    def released(self):
+        """Give the slot up for the block, e.g. while the download is paused."""
+        self._controller._suspend()
+        suspended = time.monotonic()
+        try:
+            yield
+        finally:
+            self._controller._acquire()
+            # Time spent without the slot is not request latency
+            self.started += time.monotonic() - suspended
+
+    def __enter__(self):
+        self._controller._acquire()
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Cancellations and local errors say nothing about the link
+        self._controller._release(self, isinstance(exc, requests.RequestException))
+        return False
+
+
+class ConcurrencyController:
+    """Thread-safe AIMD limit on requests in flight (see module docstring)."""
+
+    def __init__(self, name: str, initial: int, maximum: int, adaptive: bool = True,
+                 interval: float = DEFAULT_INTERVAL):
+        self.name = name
+        self.maximum = max(int(maximum), 1)
+        self.limit = min(max(int(initial), 1), self.maximum)
+        self.adaptive = adaptive
+        self.interval = interval
+        self.in_flight = 0
+        self.last_decision = ""
+        self._cond = threading.Condition()
+        self._reset_window(time.monotonic())
+        self._previous_rate = 0.0
+        self._best_latency = None
+        self._publish()
+
+    def _reset_window(self, now: float) -> None:
+        self._window_start = now
+        self._bytes = 0
+        self._requests = 0
+        self._errors = 0
+        self._latency = 0.0
+        self._saturated = False
+
+    def slot(self) -> Slot:
+        """Return a context manager holding one request slot.
+
+        Blocks while ``limit`` requests are in flight. Inside the block,
+        report bytes with ``add_bytes`` and the response with ``response``;
+        a ``requests`` exception counts as an error.
+        """
+        return Slot(self)
+
+    def _acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._saturated = True
+            metrics.set_gauge("concurrency_in_flight", self.in_flight, pool=self.name)
+
+    def _suspend(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            metrics.set_gauge("concurrency_in_flight", self.in_flight, pool=self.name)
+            self._cond.notify_all()
+
+    def _release(self, slot: Slot, failed: bool) -> None:
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            self._requests += 1
+            self._bytes += slot.bytes
+            self._latency += now - slot.started
+            if failed or slot.error:
+                self._errors += 1
+            if self.adaptive and now - self._window_start >= self.interval:
+                self._decide(now)
+            metrics.set_gauge("concurrency_in_flight", self.in_flight, pool=self.name)
+            self._cond.notify_all()
+
+    def _decide(self, now: float) -> None:
+        """Adjust the limit from the window that just ended (lock held)."""
+        elapsed = now - self._window_start
+        rate = self._bytes / elapsed
+        latency = self._latency / self._requests
+        if self._best_latency is None:
+            self._best_latency = latency
+        self._best_latency = min(latency, self._best_latency * LATENCY_DRIFT)
+        old = self.limit
+        if self._errors:
+            self.limit = max(self.limit // 2, 1)
+            action = "backoff"
+        elif (self._saturated and self.limit < self.maximum
+              and rate > self._previous_rate * (1 + GROWTH)):
+            self.limit += 1
+            action = "increase"
+        elif (self._saturated and self.limit > 1
+              and latency > self._best_latency * LATENCY_FACTOR):
+            self.limit -= 1
+            action = "latency"
+        else:
+            action = "hold"
+        self.last_decision = (
+            f"{action}: {old} -> {self.limit} ({rate / 1024 ** 2:.1f} MB/s, "
+            f"{latency:.2f}s per request, {self._errors}/{self._requests} errors)")
+        if self.limit != old:
+            metrics.inc("concurrency_changes_total", pool=self.name, action=action)
+            app_log(f"[Tuning] {self.name} {self.last_decision}")
+        self._previous_rate = rate
+        self._reset_window(now)
+        self._publish(rate, latency)
+
+    def _publish(self, rate: float = 0.0, latency: float = 0.0) -> None:
+        metrics.set_gauge("concurrency_limit", self.limit, pool=self.name)
+        metrics.set_gauge("concurrency_bytes_per_sec", round(rate, 1), pool=self.name)
+        metrics.set_gauge("concurrency_request_seconds", round(latency, 3), pool=self.name)
+
+
+_controller: ConcurrencyController | None = None
+_controller_lock = threading.Lock()
+
+
+def get_controller() -> ConcurrencyController:
+    """Return the controller shared by all media requests."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = ConcurrencyController(
+                "media",
+                int(cfg.get("concurrency") or DEFAULT_CONCURRENCY),
+                int(cfg.get("concurrency_max") or DEFAULT_MAX_CONCURRENCY),
+                adaptive=bool(cfg.get("auto_concurrency", True)),
+                interval=float(cfg.get("tune_interval") or DEFAULT_INTERVAL),
+            )
+        return _controller
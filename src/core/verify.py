@@ -0,0 +1,188 @@
+"""Integrity checks for downloaded media.
+
+Downloads are checked as they finish: the bytes written must match the
+server's ``Content-Length``, and a merged HLS video must last as long as its
+playlist says (the summed ``#EXTINF`` durations, measured with ffprobe, or
+FFmpeg when ffprobe is not installed). A failed check fails the job, so it
+stays in the queue to be resumed instead of being reported as complete.
+
+The size, the duration of HLS videos and, with ``verify_hash: true``, the
+SHA-256 of each finished file are recorded in the job store.
+:func:`scan_archive` re-checks recorded files on several processes and
+returns the broken ones so they can be queued again.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from .config import cfg
+from .dedup import file_sha256
+
+# Seconds a merged video may differ from its playlist (or 1%, if larger)
+DEFAULT_TOLERANCE = 2.0
+
+
+class VerificationError(Exception):
+    """A downloaded file does not match what the server announced."""
+
+
+def enabled() -> bool:
+    """Return True unless ``verify_downloads`` is turned off."""
+    return bool(cfg.get("verify_downloads", True))
+
+
+def hashing() -> bool:
+    """Return True when content hashes are recorded (``verify_hash``)."""
+    return bool(cfg.get("verify_hash"))
+
+
+def tolerance() -> float:
+    return float(cfg.get("verify_tolerance") or DEFAULT_TOLERANCE)
+
+
+def expected_length(resp) -> int | None:
+    """Return the body size announced by *resp*, if it can be compared.
+
+    Compressed bodies are decoded while reading, so their ``Content-Length``
+    does not match the bytes written and is ignored.
+    """
+    encoding = resp.headers.get("content-encoding", "identity").lower()
+    if encoding not in ("identity", ""):
+        return None
+    try:
+        return int(resp.headers["content-length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def check_length(path: str, written: int, expected: int | None) -> None:
+    """Raise :class:`VerificationError` if *written* is not *expected*."""
+    if enabled() and expected is not None and written != expected:
+        raise VerificationError(
+            f"{os.path.basename(path)} is incomplete: "
+            f"{written} of {expected} bytes received")
+
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def probe_tool() -> str | None:
+    """Return ffprobe, or FFmpeg as a fallback; None if neither is installed."""
+    return shutil.which("ffprobe") or shutil.which("ffmpeg")
+
+
+def probe_duration(path: str, tool: str | None = None) -> float | None:
+    """Return the duration of the media file at *path* in seconds.
+
+    *tool* is the ffprobe or FFmpeg executable (default :func:`probe_tool`).
+    Returns None when neither is installed; raises
+    :class:`VerificationError` when the file cannot be read.
+    """
+    tool = tool or probe_tool()
+    if tool is None:
+        return None
+    name = os.path.basename(tool).lower()
+    if name.startswith("ffprobe"):
+        result = subprocess.run(
+            [tool, "-v", "error", "-show_entries", "format=duration", "-of", "json", path],
+            capture_output=True, text=True)
+        try:
+            return float(json.loads(result.stdout)["format"]["duration"])
+        except (ValueError, KeyError, TypeError):
+            pass
+    else:
+        # "ffmpeg -i" exits with an error (no output given) after printing
+        # the input's duration
+        result = subprocess.run([tool, "-hide_banner", "-i", path],
+                                capture_output=True, text=True)
+        match = _DURATION_RE.search(result.stderr)
+        if match:
+            hours, minutes, seconds = match.groups()
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    raise VerificationError(f"{os.path.basename(path)} is not a readable video")
+
+
+def check_duration(path: str, expected: float, tool: str | None = None,
+                   slack: float | None = None) -> float | None:
+    """Check that *path* lasts *expected* seconds; return the measured duration.
+
+    Raises :class:`VerificationError` on a mismatch, e.g. a merge that lost
+    segments. Returns None without checking when no probe tool is installed.
+    """
+    duration = probe_duration(path, tool)
+    if duration is None or not expected:
+        return duration
+    slack = tolerance() if slack is None else slack
+    if abs(duration - expected) > max(slack, expected * 0.01):
+        raise VerificationError(
+            f"{os.path.basename(path)} lasts {duration:.1f}s, "
+            f"the playlist {expected:.1f}s")
+    return duration
+
+
+def record(store, job: dict, path: str, duration: float | None = None) -> str | None:
+    """Record the size (and hash, with ``verify_hash``) of a finished job.
+
+    Returns the SHA-256 digest when one was computed.
+    """
+    sha256 = file_sha256(path) if hashing() else None
+    if store is not None:
+        store.record_file(job["id"], os.path.getsize(path), duration, sha256)
+    return sha256
+
+
+def check_file(path: str, url_type: str, size: int | None, duration: float | None,
+               sha256: str | None, tool: str | None, slack: float) -> str | None:
+    """Re-check a finished download; return the problem, or None if it is fine.
+
+    Runs in worker processes, so it gets every setting as an argument.
+    """
+    try:
+        actual = os.path.getsize(path)
+    except OSError:
+        return "missing"
+    if size is not None and actual != size:
+        return f"size changed from {size} to {actual} bytes"
+    try:
+        if url_type == "m3u8" and tool:
+            check_duration(path, duration or 0, tool, slack)
+    except VerificationError as e:
+        return str(e)
+    if sha256 and file_sha256(path) != sha256:
+        return "content hash changed"
+    return None
+
+
+def scan_archive(jobs: list[dict], processes: int | None = None,
+                 check_hash: bool = False, progress_cb=None) -> list[tuple[dict, str]]:
+    """Re-check the files of finished *jobs* in parallel.
+
+    Returns ``(job, problem)`` pairs for the broken ones. Hashes are only
+    compared with *check_hash*, since that reads every file in full.
+    *progress_cb* receives ``(checked, len(jobs))``.
+    """
+    from .downloader import job_output_path
+
+    tool = probe_tool()
+    slack = tolerance()
+    broken = []
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(check_file, job_output_path(job), job["url_type"], job.get("size"),
+                        job.get("duration"), job.get("sha256") if check_hash else None,
+                        tool, slack)
+            for job in jobs
+        ]
+        for n, (job, future) in enumerate(zip(jobs, futures), start=1):
+            problem = future.result()
+            if problem:
+                broken.append((job, problem))
+            if progress_cb:
+                progress_cb(n, len(jobs))
+    return broken
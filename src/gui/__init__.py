@@ -4,7 +4,8 @@ import sys
 import yaml
 import ctypes
 
-from core.config import check_requirements, load_config
+from core import profiling
+from core.config import cfg, check_requirements, load_config
 from core.app_log import show_error, log
 
 __all__ = ["DownloaderGUI", "ConfigDialog", "main"]
@@ -22,6 +23,10 @@ def main() -> None:
         log(msg)
         sys.exit(1)
 
+    trace_path = profiling.configure(cfg)
+    if trace_path:
+        log(f"[Profile] Writing trace to {trace_path}")
+
     # if not check_requirements():
     #     print("\nPlease install missing dependencies:")
     #     print("pip install -r requirements.txt")
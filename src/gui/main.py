@@ -1,11 +1,12 @@
 import ctypes
 import os.path
 import queue
+import sqlite3
 import sys
 import threading
 import time
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 
 from requests import HTTPError
 
@@ -15,20 +16,33 @@ from core.api import (
     get_timeline,
     get_user_info_by_code,
     get_user_mine,
-    get_purchased_contents,
-    parse_purchased_contents,
+    iter_purchased_contents,
 )
 from core.config import (
     cfg,
     save_config,
-    HEADERS,
+    add_credentials_expired_listener,
+    get_headers,
+    release_credential_waiters,
 )
-from core.downloader import download_and_merge, infer_url_type, sanitize_filename
+from core.downloader import (
+    build_post_jobs, claim_job, download_images, download_job, infer_url_type,
+    job_output_path)
+from core.jobs import DONE, get_job_store
 from .config_dialog import ConfigDialog
+from .stats_dialog import StatsDialog
 from core.app_log import set_logger, log as app_log
+from core import planner, profiling, thumbnails
+from core.catalog import Catalog
+from core.control import BatchEvent, JobControls
+from core.scheduler import DownloadQueue
+from core.sync import download_pipelined, iter_timeline, timeline_jobs
 
 
 class DownloaderGUI(tk.Tk):
+    # Purchased contents handed to the Tk thread at a time while streaming
+    PURCHASED_BATCH = 200
+
     def __init__(self):
         super().__init__()
         dpi = 96
@@ -51,22 +65,33 @@ class DownloaderGUI(tk.Tk):
         self.all_posts_raw = {}  # user_code -> [post_dict...]
         self.purchased_contents = []  # List of purchased content items
         self.log_queue = queue.Queue()
+        # (callable, args) pairs posted by worker threads, run on the Tk thread
+        self.ui_queue = queue.Queue()
+        self._progress_pending = None
+        self._progress_lock = threading.Lock()
         self.downloading = False
-        self.pause_event = threading.Event()
+        # BatchEvents wake the per-job controls as soon as they change
+        self.pause_event = BatchEvent()
         self.pause_event.set()  # start in running state
-        self.cancel_event = threading.Event()
-        # current ffmpeg process (Popen), terminated on cancel
-        self.current_proc = None
+        self.cancel_event = BatchEvent()
+        # JobControls of the running batch: per-job pause, cancel and FFmpeg
+        self.controls = None
+        # DownloadQueue of the running batch, reprioritised from the UI
+        self.download_queue = None
         self.username = ""
 
         # UI
         self._build_ui()
         set_logger(self._log)
+        add_credentials_expired_listener(
+            lambda: self._ui(self._on_credentials_expired))
 
         self.auto_login()
+        self.after(500, self._offer_resume)
 
-        # Timer: flush logs
+        # Timer: flush logs and run UI updates posted by workers
         self.after(100, self._flush_logs)
+        self.after(50, self._drain_ui)
 
     # ---------- UI ----------
     def _build_subscription_tab(self):
@@ -99,6 +124,7 @@ class DownloaderGUI(tk.Tk):
         self.tree.column("type", width=60, anchor="center")
         self.tree.column("post_id", width=120, anchor="center")
         self.tree.pack(fill="both", expand=True, padx=8, pady=(8, 0))
+        self._bind_job_menu(self.tree)
 
         btns = ttk.Frame(right)
         btns.pack(fill="x", padx=8, pady=8)
@@ -106,9 +132,13 @@ class DownloaderGUI(tk.Tk):
                    command=self.select_all_visible).pack(side="left")
         ttk.Button(btns, text="Clear selection", command=self.clear_selection).pack(
             side="left", padx=(8, 0))
+        ttk.Button(btns, text="Preview", command=self.on_preview).pack(
+            side="left", padx=(8, 0))
         self.btn_download = ttk.Button(
             btns, text="Start download", command=self.on_download)
         self.btn_download.pack(side="right", padx=(8, 0))
+        ttk.Button(btns, text="Download first", command=self.on_download_first).pack(
+            side="right", padx=(8, 0))
         self.btn_pause = ttk.Button(
             btns, text="Pause", command=self.on_pause_resume, state="disabled")
         self.btn_pause.pack(side="right", padx=(8, 0))
@@ -162,6 +192,7 @@ class DownloaderGUI(tk.Tk):
         self.purchased_tree.column("price", width=80, anchor="center")
         self.purchased_tree.column("post_id", width=120, anchor="center")
         self.purchased_tree.pack(fill="both", expand=True, padx=8, pady=(8, 0))
+        self._bind_job_menu(self.purchased_tree)
 
         purchased_btns = ttk.Frame(content_frame)
         purchased_btns.pack(fill="x", padx=8, pady=8)
@@ -169,9 +200,13 @@ class DownloaderGUI(tk.Tk):
                    command=self.select_all_purchased_visible).pack(side="left")
         ttk.Button(purchased_btns, text="Clear selection",
                    command=self.clear_purchased_selection).pack(side="left", padx=(8, 0))
+        ttk.Button(purchased_btns, text="Preview",
+                   command=self.on_preview_purchased).pack(side="left", padx=(8, 0))
         self.btn_download_purchased = ttk.Button(
             purchased_btns, text="Start download", command=self.on_download_purchased)
         self.btn_download_purchased.pack(side="right", padx=(8, 0))
+        ttk.Button(purchased_btns, text="Download first",
+                   command=self.on_download_first_purchased).pack(side="right", padx=(8, 0))
         self.btn_pause_purchased = ttk.Button(
             purchased_btns, text="Pause", command=self.on_pause_resume, state="disabled")
         self.btn_pause_purchased.pack(side="right", padx=(8, 0))
@@ -197,6 +232,10 @@ class DownloaderGUI(tk.Tk):
             top_row1, text="Config", command=self.open_config)
         self.btn_config.pack(side="left", padx=(8, 0))
 
+        self.btn_stats = ttk.Button(
+            top_row1, text="Stats", command=self.open_stats)
+        self.btn_stats.pack(side="left", padx=(8, 0))
+
         self.username_var = tk.StringVar(value="Not logged in")
         self.lbl_username = ttk.Label(top_row1, textvariable=self.username_var)
         self.lbl_username.pack(side="right", padx=(0, 8))
@@ -239,6 +278,19 @@ class DownloaderGUI(tk.Tk):
             top_row1, text="Fetch posts", command=self.on_fetch_posts)
         self.btn_fetch_posts.pack(side="left", padx=(12, 0))
 
+        self.btn_save_catalog = ttk.Button(
+            top_row1, text="Save catalog", command=self.on_save_catalog)
+        self.btn_save_catalog.pack(side="left", padx=(12, 0))
+
+        self.btn_open_catalog = ttk.Button(
+            top_row1, text="Open catalog", command=self.on_open_catalog)
+        self.btn_open_catalog.pack(side="left", padx=(8, 0))
+
+        self.prefetch_var = tk.BooleanVar(value=False)
+        self.chk_prefetch = ttk.Checkbutton(
+            top_row2, text="Download while fetching", variable=self.prefetch_var)
+        self.chk_prefetch.pack(side="left", padx=(12, 0))
+
         self.btn_apply_filter = ttk.Button(
             top_row2, text="Apply filter", command=self.apply_filter)
         self.btn_apply_filter.pack(side="left", padx=(8, 0))
@@ -281,6 +333,58 @@ class DownloaderGUI(tk.Tk):
             pass
         self.after(120, self._flush_logs)
 
+    # ---------- UI dispatch ----------
+    def _ui(self, fn, *args):
+        """Run ``fn(*args)`` on the Tk thread.
+
+        Tkinter is not thread-safe, so worker threads must never touch widgets
+        or Tk variables directly; they post the update here instead.
+        """
+        self.ui_queue.put((fn, args))
+
+    def _drain_ui(self):
+        try:
+            while True:
+                fn, args = self.ui_queue.get_nowait()
+                try:
+                    with profiling.span(
+                            "ui:" + getattr(fn, "__name__", "call"), "gui"):
+                        fn(*args)
+                except Exception as e:
+                    self._log(f"[Error] UI update failed: {e}")
+        except queue.Empty:
+            pass
+        self.after(50, self._drain_ui)
+
+    def _ask_from_worker(self, fn, *args):
+        """Run dialog *fn* on the Tk thread and block the worker for its result."""
+        done = threading.Event()
+        result = []
+
+        def run():
+            try:
+                result.append(fn(*args))
+            finally:
+                done.set()
+
+        self._ui(run)
+        done.wait()
+        return result[0] if result else None
+
+    def _ui_progress(self, current, total):
+        """Post a progress update, coalescing bursts from chunked downloads."""
+        with self._progress_lock:
+            pending = self._progress_pending is not None
+            self._progress_pending = (current, total)
+        if not pending:
+            self._ui(self._apply_pending_progress)
+
+    def _apply_pending_progress(self):
+        with self._progress_lock:
+            values, self._progress_pending = self._progress_pending, None
+        if values is not None:
+            self._update_progress(*values)
+
     def _update_progress(self, current, total):
         self.progress_bar.config(maximum=total or 1)
         self.progress_var.set(current)
@@ -295,7 +399,7 @@ class DownloaderGUI(tk.Tk):
         def task():
             username = None
             try:
-                resp = get_user_mine(headers=HEADERS)
+                resp = get_user_mine(headers=get_headers())
                 if resp.get("data") and resp["data"].get("users"):
                     user = resp["data"]["users"][0]
                     username = "Current User: " + user.get("username", "")
@@ -306,11 +410,23 @@ class DownloaderGUI(tk.Tk):
             except Exception as e:
                 app_log(e)
 
-            self.after(0, lambda: self.username_var.set(
-                username or "Not logged in"))
+            self._ui(self.username_var.set, username or "Not logged in")
 
         threading.Thread(target=task, daemon=True).start()
 
+    def _on_credentials_expired(self):
+        """Requests are blocked on an expired session; offer to log in again."""
+        self.username_var.set("Session expired")
+        if messagebox.askyesno(
+                "Session expired",
+                "CandFans rejected the saved login. Downloads are paused and "
+                "will continue where they stopped once you log in again.\n\n"
+                "Log in now?"):
+            self.on_login()
+        else:
+            release_credential_waiters()
+            self._log("[Session] Not logging in; waiting requests will fail")
+
     def on_login(self):
         """Open login window and capture cookies after user logs in."""
         if getattr(self, "_logging_in", False):
@@ -367,8 +483,8 @@ class DownloaderGUI(tk.Tk):
                             cfg["cookie"] = cookie_str
                             save_config(cfg.copy())
                             window.destroy()
-                            self.username_var.set(
-                                'Current User: ' + self.username)
+                            self._ui(self.username_var.set,
+                                     'Current User: ' + self.username)
                             break
 
                     except HTTPError as e:
@@ -395,6 +511,9 @@ class DownloaderGUI(tk.Tk):
         # Open dialog
         ConfigDialog(self, cfg, on_save=self.on_config_saved)
 
+    def open_stats(self):
+        StatsDialog(self)
+
     def on_config_saved(self, new_cfg: dict):
         """Update configuration after dialog save and persist to disk"""
         save_config(new_cfg)  # write back config/config.yaml and refresh header
@@ -404,44 +523,62 @@ class DownloaderGUI(tk.Tk):
     def on_fetch_purchased(self):
         """Fetch purchased contents from API."""
         def worker():
+            months = set()
+            count = 0
             try:
                 self._log("Fetching purchased contents...")
-                resp = get_purchased_contents()
-                contents = parse_purchased_contents(resp)
-                self.purchased_contents = contents
-                self._log(f"Fetched {len(contents)} purchased contents")
-
-                # Update month filter options
-                months = set()
-                for content in contents:
+                self._ui(self._on_purchased_fetch_started)
+                batch = []
+                for content in iter_purchased_contents():
+                    batch.append(content)
+                    count += 1
                     month = content.get("purchase_month", "")
                     if month:
                         months.add(month)
-                months_list = ["All"] + sorted(months, reverse=True)
-                self.purchased_month_combo.config(values=months_list)
-
+                    if len(batch) >= self.PURCHASED_BATCH:
+                        self._ui(self._on_purchased_batch, batch)
+                        batch = []
+                if batch:
+                    self._ui(self._on_purchased_batch, batch)
+                self._log(f"Fetched {count} purchased contents")
             except Exception as e:
                 self._log(f"[Error] Failed to fetch purchased contents: {e}")
-                return
             finally:
-                self.btn_fetch_purchased.config(state="normal")
+                self._ui(lambda: self.btn_fetch_purchased.config(state="normal"))
 
-            self.apply_purchased_filter()
+            months_list = ["All"] + sorted(months, reverse=True)
+            self._ui(self._on_purchased_fetched, months_list)
 
         self.btn_fetch_purchased.config(state="disabled")
         threading.Thread(target=worker, daemon=True).start()
 
+    def _on_purchased_fetch_started(self):
+        self.purchased_contents = []
+        for row in self.purchased_tree.get_children():
+            self.purchased_tree.delete(row)
+
+    def _on_purchased_batch(self, contents):
+        """Show a batch of streamed purchased contents as it arrives."""
+        self.purchased_contents.extend(contents)
+        self._insert_purchased_rows(contents)
+
+    def _on_purchased_fetched(self, months_list):
+        self.purchased_month_combo.config(values=months_list)
+
     def apply_purchased_filter(self):
         """Apply filters to purchased contents and update the tree."""
         # Clear table
         for row in self.purchased_tree.get_children():
             self.purchased_tree.delete(row)
+        self._insert_purchased_rows(self.purchased_contents)
 
+    def _insert_purchased_rows(self, contents):
+        """Add rows for the *contents* that pass the current filters."""
         keyword = self.purchased_keyword_var.get().strip().lower()
         month_filter = self.purchased_month_var.get()
 
         # Apply filters and populate tree
-        for content in self.purchased_contents:
+        for content in contents:
             # Filter by keyword
             if keyword and keyword not in content.get("title", "").lower():
                 continue
@@ -505,70 +642,24 @@ class DownloaderGUI(tk.Tk):
 
     def _download_purchased_worker(self, tasks):
         """Worker thread for downloading purchased contents."""
-        from core.downloader import download_and_merge, sanitize_filename
-
-        for i, content in enumerate(tasks):
-            if self.cancel_event.is_set():
-                self._log("[Status] Cancelled")
-                break
-
-            title = content.get(
-                "title", f"content_{content.get('post_id', 'unknown')}")
-            username = content.get("username", "unknown_user")
-            post_id = str(content.get("post_id", "unknown"))
-
-            self._log(
-                f"[{i+1}/{len(tasks)}] Downloading: {username} / {title}")
-
-            # Create directory path
-            download_dir = cfg.get("download_dir") or "downloads"
-            user_dir = os.path.join(download_dir, sanitize_filename(username))
-            content_dir = os.path.join(
-                user_dir, f"{post_id}-{sanitize_filename(title)}")
-
-            # Download all attachments
-            attachments = content.get("attachments", [])
-            for j, attachment in enumerate(attachments):
-                if self.cancel_event.is_set():
-                    break
-
-                url = attachment.get("default")
-                if not url:
-                    continue
-
-                # Create filename for this attachment
-                if len(attachments) > 1:
-                    output_name = f"{sanitize_filename(title)}_{j+1}"
-                else:
-                    output_name = sanitize_filename(title)
-
-                try:
-                    def progress_cb(current, total):
-                        progress = (i + (j + current / (total or 1)
-                                         ) / len(attachments)) / len(tasks)
-                        self.after(0, self._update_progress,
-                                   int(progress * 1000), 1000)
-
-                    url_type = infer_url_type(url)
-
-                    download_and_merge(
-                        url,
-                        content_dir,
-                        output_name,
-                        url_type=url_type,
-                        log=self._log,
-                        pause_event=self.pause_event,
-                        cancel_event=self.cancel_event,
-                        on_ffmpeg=lambda p: setattr(self, 'current_proc', p),
-                        progress_cb=progress_cb,
-                    )
-                    self._log(f"    Downloaded: {output_name}")
-
-                except Exception as e:
-                    self._log(f"    [Failed] {output_name}: {e}")
-                    continue
+        download_dir = cfg.get("download_dir") or "downloads"
+        jobs = []
+        for content in tasks:
+            jobs += build_post_jobs(
+                "purchased",
+                content.get("username", "unknown_user"),
+                content.get("post_id", "unknown"),
+                content.get("title", f"content_{content.get('post_id', 'unknown')}"),
+                content.get("attachments", []),
+                download_dir,
+                month=content.get("purchase_month", ""),
+            )
+        self._run_jobs(get_job_store().enqueue(jobs))
 
         self._log("[Status] Downloaded purchased contents")
+        self._ui(self._on_purchased_download_finished)
+
+    def _on_purchased_download_finished(self):
         self.downloading = False
         self.btn_download_purchased.config(state="normal")
         self.btn_pause_purchased.config(state="disabled", text="Pause")
@@ -589,79 +680,197 @@ class DownloaderGUI(tk.Tk):
                         "user_code": info["user_code"],
                         "user_id": info["user_id"],
                     })
-                self.accounts = accounts
                 self._log(f"Loaded successfully, {len(accounts)} accounts")
             except Exception as e:
                 self._log(f"[Error] Failed to load account list: {e}")
                 return
             finally:
-                self.btn_load_accounts.config(state="normal")
+                self._ui(lambda: self.btn_load_accounts.config(state="normal"))
 
-            # Refresh UI
-            self.acc_list.delete(0, "end")
-            for acc in accounts:
-                self.acc_list.insert(
-                    "end", f"{acc['username']} ({acc['user_code']})")
+            self._ui(self._on_accounts_loaded, accounts)
 
         self.btn_load_accounts.config(state="disabled")
         threading.Thread(target=worker, daemon=True).start()
 
+    def _on_accounts_loaded(self, accounts):
+        self.accounts = accounts
+        self.acc_list.delete(0, "end")
+        for acc in accounts:
+            self.acc_list.insert(
+                "end", f"{acc['username']} ({acc['user_code']})")
+
     def on_fetch_posts(self):
         selected_indices = self.acc_list.curselection()
         if not selected_indices:
             messagebox.showerror("Error", "Please select account(s) first")
             return
         selected_accounts = [self.accounts[i] for i in selected_indices]
+        # Tk variables may only be read on the Tk thread
+        max_pages = None if self.all_pages_var.get() else self.pages_var.get()
+        keyword = self.keyword_var.get().strip()
+        filter_type = self.type_var.get()
+        if filter_type == "All":
+            filter_type = None
+
+        prefetch = self.prefetch_var.get()
+        if prefetch and self.downloading:
+            messagebox.showerror("Error", "A download is already running")
+            return
+        download_dir = cfg.get("download_dir") or "downloads"
+
+        def fetch(put=None):
+            all_posts = []
+            posts_raw = {}
+            for acc in selected_accounts:
+                self._log(
+                    f"Loading posts for account {acc['username']}...")
+                posts = []
+                # While downloading, a cancel also stops the page fetching
+                cancel = self.cancel_event if put is not None else None
+                for page in iter_timeline(acc, max_pages, cancel_event=cancel):
+                    posts.extend(page)
+                    if put is not None:
+                        jobs = timeline_jobs(acc, page, download_dir,
+                                             filter_type and [filter_type], keyword)
+                        if jobs:
+                            put(jobs)
+                posts_raw[acc["user_code"]] = posts
+                for post in posts:
+                    urls = []
+                    for media in post.get("attachments", []):
+                        url = media.get("default")
+                        if not url:
+                            continue
+                        if filter_type and not url.endswith(filter_type):
+                            continue
+                        urls.append(url)
+                    if keyword and keyword not in post.get("title", ""):
+                        continue
+                    for url in urls:
+                        url_type = infer_url_type(url)
+                        all_posts.append((acc, post, url_type, url))
+            self._log(f"Finished fetching, {len(all_posts)} items")
+            self._ui(self._on_posts_fetched, all_posts, posts_raw)
 
         def worker():
             try:
-                self.posts.clear()
-                self.all_posts_raw.clear()
-                max_pages = None if self.all_pages_var.get() else self.pages_var.get()
-                keyword = self.keyword_var.get().strip()
-                filter_type = self.type_var.get()
-                if filter_type == "All":
-                    filter_type = None
-                for acc in selected_accounts:
-                    self._log(
-                        f"Loading posts for account {acc['username']}...")
-                    posts = []
-                    page = 1
-                    while True:
-                        tl = get_timeline(acc["user_id"], page=page)
-                        posts.extend(tl)
-                        if max_pages and page >= max_pages:
-                            break
-                        if len(tl) < 12:
-                            break
-                        page += 1
-                    self.all_posts_raw[acc["user_code"]] = posts
-                    for post in posts:
-                        urls = []
-                        for media in post.get("attachments", []):
-                            url = media.get("default")
-                            if not url:
-                                continue
-                            if filter_type and not url.endswith(filter_type):
-                                continue
-                            urls.append(url)
-                        if keyword and keyword not in post.get("title", ""):
-                            continue
-                        for url in urls:
-                            url_type = infer_url_type(url)
-                            self.posts.append((acc, post, url_type, url))
-                self._log(f"Finished fetching, {len(self.posts)} items")
+                fetch()
             except Exception as e:
                 self._log(f"[Error] Failed to fetch posts: {e}")
-                return
             finally:
-                self.btn_fetch_posts.config(state="normal")
+                self._ui(lambda: self.btn_fetch_posts.config(state="normal"))
 
-            self.apply_filter()
+        def prefetch_worker():
+            self.controls = JobControls(self.pause_event, self.cancel_event, get_job_store())
+            try:
+                counts = download_pipelined(
+                    fetch,
+                    log=self._log,
+                    pause_event=self.pause_event,
+                    cancel_event=self.cancel_event,
+                    progress_cb=self._ui_progress,
+                    controls=self.controls,
+                )
+                self._log(f"[Status] Download finished: {counts['downloaded']} downloaded, "
+                          f"{counts['skipped']} skipped, {counts['failed']} failed")
+            except Exception as e:
+                self._log(f"[Error] Failed to fetch posts: {e}")
+            finally:
+                self.controls = None
+                self._ui(lambda: self.btn_fetch_posts.config(state="normal"))
+                self._ui(self._on_download_finished)
 
         self.btn_fetch_posts.config(state="disabled")
+        if prefetch:
+            self.downloading = True
+            self.btn_download.config(state="disabled")
+            self.btn_pause.config(state="normal")
+            self.btn_cancel.config(state="normal")
+            self.cancel_event.clear()
+            threading.Thread(target=prefetch_worker, daemon=True).start()
+        else:
+            threading.Thread(target=worker, daemon=True).start()
+
+    def _on_posts_fetched(self, all_posts, posts_raw):
+        self.posts = all_posts
+        self.all_posts_raw = posts_raw
+        self.apply_filter()
+
+    # ---------- Catalog ----------
+    def on_save_catalog(self):
+        """Write the fetched subscriptions, posts and purchased contents to a file."""
+        if not (self.all_posts_raw or self.purchased_contents):
+            messagebox.showerror("Error", "Fetch posts or purchased contents first")
+            return
+        path = filedialog.asksaveasfilename(
+            title="Save catalog", defaultextension=".sqlite3",
+            filetypes=[("Catalog", "*.sqlite3"), ("All files", "*.*")])
+        if not path:
+            return
+        accounts = list(self.accounts)
+        posts_raw = dict(self.all_posts_raw)
+        purchased = list(self.purchased_contents)
+
+        def worker():
+            try:
+                with Catalog(path) as catalog:
+                    catalog.add_creators(accounts)
+                    for acc in accounts:
+                        if acc["user_code"] in posts_raw:
+                            catalog.add_posts("subscription", posts_raw[acc["user_code"]], acc)
+                    catalog.add_posts("purchased", purchased)
+                    self._log(f"[Catalog] Saved {catalog.count()} posts to {path}")
+            except Exception as e:
+                self._log(f"[Error] Failed to save catalog: {e}")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_open_catalog(self):
+        """Show the posts of a saved catalog without fetching them again."""
+        path = filedialog.askopenfilename(
+            title="Open catalog", filetypes=[("Catalog", "*.sqlite3"), ("All files", "*.*")])
+        if not path:
+            return
+
+        def worker():
+            try:
+                with Catalog(path) as catalog:
+                    accounts = catalog.creators()
+                    by_name = {acc["username"]: acc for acc in accounts}
+                    all_posts = []
+                    posts_raw = {}
+                    for post in catalog.iter_posts("subscription"):
+                        acc = by_name.get(post["username"])
+                        if acc is None:
+                            continue
+                        posts_raw.setdefault(acc["user_code"], []).append(post)
+                        for media in post["attachments"]:
+                            url = media["default"]
+                            all_posts.append((acc, post, infer_url_type(url), url))
+                    self._ui(self._on_accounts_loaded, accounts)
+                    self._ui(self._on_posts_fetched, all_posts, posts_raw)
+
+                    self._ui(self._on_purchased_fetch_started)
+                    months = set()
+                    batch = []
+                    for content in catalog.iter_posts("purchased"):
+                        batch.append(content)
+                        if content["purchase_month"]:
+                            months.add(content["purchase_month"])
+                        if len(batch) >= self.PURCHASED_BATCH:
+                            self._ui(self._on_purchased_batch, batch)
+                            batch = []
+                    if batch:
+                        self._ui(self._on_purchased_batch, batch)
+                    self._ui(self._on_purchased_fetched, ["All"] + sorted(months, reverse=True))
+                self._log(f"[Catalog] Opened {path}: {len(all_posts)} items, "
+                          f"{len(months)} purchase month(s)")
+            except Exception as e:
+                self._log(f"[Error] Failed to open catalog: {e}")
+
         threading.Thread(target=worker, daemon=True).start()
 
+    @profiling.traced("apply_filter", "gui")
     def apply_filter(self):
         # Clear table
         for row in self.tree.get_children():
@@ -722,90 +931,319 @@ class DownloaderGUI(tk.Tk):
                          args=(tasks,), daemon=True).start()
 
     def _download_worker(self, tasks):
+        download_dir = cfg.get("download_dir") or "downloads"
+        jobs = []
+        seen = set()
         for acc, post, url_type, title in tasks:
+            post_id = str(post.get("post_id"))
+            # The tree has one row per attachment; each post is queued once
+            if post_id in seen:
+                continue
+            seen.add(post_id)
+            jobs += build_post_jobs("subscription", acc["username"], post_id,
+                                    title, post.get("attachments", []), download_dir,
+                                    month=post.get("month") or "")
+        self._run_jobs(get_job_store().enqueue(jobs))
+
+        self._log("[Status] Download finished")
+        self._ui(self._on_download_finished)
+
+    def on_preview(self):
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showerror("Error", "Please select a post to preview")
+            return
+        acc_name, month, title, url_type, post_id = self.tree.item(selected[0], "values")
+        acc = next(a for a in self.accounts if a["username"] == acc_name)
+        post = next(p for p in self.all_posts_raw[acc["user_code"]]
+                    if str(p.get("post_id")) == post_id)
+        self._preview_post("subscription", acc_name, post_id, title,
+                           post.get("attachments", []), post.get("month") or "")
+
+    def on_preview_purchased(self):
+        selected = self.purchased_tree.selection()
+        if not selected:
+            messagebox.showerror("Error", "Please select a content to preview")
+            return
+        username, purchase_month, title, price, post_id = self.purchased_tree.item(
+            selected[0], "values")
+        content = next((c for c in self.purchased_contents
+                        if str(c.get("post_id")) == post_id), None)
+        if content:
+            self._preview_post("purchased", username, post_id, title,
+                               content.get("attachments", []),
+                               content.get("purchase_month", ""))
+
+    def _preview_post(self, source, username, post_id, title, attachments, month=""):
+        """Fetch a thumbnail of a post on a worker thread and show it.
+
+        *month* is passed as for the download, so a ``{month}`` layout
+        finds the thumbnails the download stored.
+        """
+        jobs = build_post_jobs(source, username, post_id, title, attachments,
+                               cfg.get("download_dir") or "downloads", month=month)
+
+        def worker():
+            path = None
+            for job in jobs:
+                try:
+                    path = thumbnails.preview_job(job)
+                except Exception as e:
+                    self._log(f"[Thumbnail] Preview failed: {e}")
+                if path:
+                    break
+            self._ui(self._show_preview, title, path)
+
+        self._log(f"[Thumbnail] Loading preview of {title}...")
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _show_preview(self, title, path):
+        if not path:
+            messagebox.showinfo("Preview", "No preview is available for this post")
+            return
+        win = tk.Toplevel(self)
+        win.title(title)
+        image = tk.PhotoImage(file=path)
+        label = ttk.Label(win, image=image)
+        label.image = image  # keep a reference while the window is open
+        label.pack(padx=8, pady=8)
+
+    def _promote(self, posts):
+        """Move queued jobs of *posts* ((username, post_id) pairs) to the front."""
+        download_queue = self.download_queue
+        if download_queue is None:
+            messagebox.showinfo("Download first", "No download is running")
+            return
+        n = download_queue.promote(lambda job: (job["username"], job["post_id"]) in posts)
+        self._log(f"[Queue] Moved {n} file(s) to the front of the queue")
+
+    def _selected_posts(self, tree):
+        """Return (username, post_id) pairs of the rows selected in *tree*."""
+        return {(vals[0], vals[4]) for vals in
+                (tree.item(item, "values") for item in tree.selection())}
+
+    def on_download_first(self):
+        self._promote(self._selected_posts(self.tree))
+
+    def on_download_first_purchased(self):
+        self._promote(self._selected_posts(self.purchased_tree))
+
+    def _control_posts(self, action, posts):
+        """Pause, resume or cancel the jobs of *posts* in the running batch.
+
+        The other jobs of the batch carry on; see :mod:`core.control`.
+        """
+        controls = self.controls
+        if controls is None:
+            messagebox.showinfo("Downloads", "No download is running")
+            return
+        n = getattr(controls, action)(lambda job: (job["username"], job["post_id"]) in posts)
+        verb = {"pause": "Paused", "resume": "Resumed", "cancel": "Cancelled"}[action]
+        self._log(f"[Queue] {verb} {n} file(s)")
+
+    def _bind_job_menu(self, tree):
+        """Give *tree* a context menu controlling the downloads of its posts."""
+        menu = tk.Menu(self, tearoff=0)
+        for label, action in (("Pause download", "pause"), ("Resume download", "resume"),
+                              ("Cancel download", "cancel")):
+            menu.add_command(label=label, command=lambda action=action: self._control_posts(
+                action, self._selected_posts(tree)))
+        menu.add_separator()
+        menu.add_command(label="Download first",
+                         command=lambda: self._promote(self._selected_posts(tree)))
+
+        def popup(event):
+            row = tree.identify_row(event.y)
+            if row and row not in tree.selection():
+                tree.selection_set(row)
+            menu.tk_popup(event.x_root, event.y_root)
+
+        tree.bind("<Button-3>", popup)
+        if sys.platform == "darwin":
+            tree.bind("<Button-2>", popup)
+
+    def _run_jobs(self, jobs):
+        """Download queued *jobs* by priority (runs on a worker thread).
+
+        Jobs come from a :class:`core.scheduler.DownloadQueue`, so their
+        order follows the configured priorities and fair share and can be
+        changed with "Download first" while the batch runs. Each job can be
+        paused or cancelled on its own (see :class:`core.control.JobControls`).
+        Jobs are claimed before they start, so headless workers sharing the
+        job database never fetch the same file.
+        """
+        store = get_job_store()
+        pending = [job for job in jobs
+                   if not (job["state"] == DONE and os.path.exists(job_output_path(job)))]
+        plan = None
+        if pending and cfg.get("preflight", True):
+            self._log(f"[Plan] Checking {len(pending)} file(s)...")
+            plan = planner.plan_jobs(pending, pending[0]["target_dir"], self.cancel_event)
+            self._log(planner.format_plan(plan))
+            if not plan["fits"] and not self._ask_from_worker(
+                    messagebox.askyesno, "Not enough space",
+                    "The download directory does not have enough free space for "
+                    "this batch.\n\nStart downloading anyway?"):
+                self._log("[Status] Cancelled: not enough free space")
+                return
+            jobs = planner.order_jobs(jobs, plan=plan)
+        download_queue = DownloadQueue(jobs, plan["sizes"] if plan else None)
+        controls = JobControls(self.pause_event, self.cancel_event, store)
+        controls.add(jobs)
+        self.download_queue = download_queue
+        self.controls = controls
+        try:
+            self._run_queue(download_queue, len(jobs), store, controls)
+            # Paused jobs may still be writing after a cancel
+            controls.wait_background()
+        finally:
+            self.download_queue = None
+            self.controls = None
+
+    def _run_queue(self, download_queue, total, store, controls):
+        current_post = None
+        n = 0
+        while True:
+            download_queue.push(controls.take_resumed())
+            job = download_queue.pop()
+            if job is None:
+                # Wait for jobs that were paused on their own
+                resumed = controls.wait_for_work()
+                if not resumed:
+                    break
+                download_queue.push(resumed)
+                continue
             if self.cancel_event.is_set():
                 self._log("[Status] Cancelled")
                 break
 
-            self._log(f"[Download] {acc['username']} / {title}")
-            medias = post.get("attachments", [])
-            urls = [m.get("default") for m in medias if m.get("default")]
-            post_id = str(post.get("post_id"))
-            for i, url in enumerate(urls, start=1):
-                self.after(0, self._reset_progress)
-                if infer_url_type(url) == "m3u8":
-                    self._download_m3u8(url, acc, title, post_id)
-                elif infer_url_type(url) == "jpg":
-                    self._download_jpg(url, acc, title, post_id, i, len(urls))
-                else:
-                    self._download_mp4(url, acc, title, post_id)
+            control = controls.get(job)
+            if control.cancelled:
+                self._log(f"    [Cancelled] {job['output_name']}")
+                n += 1
+                continue
+            if control.held:
+                self._log(f"    [Paused] {job['output_name']} starts once resumed")
+                controls.hold(job)
+                continue
+
+            if (job["username"], job["post_id"]) != current_post:
+                current_post = (job["username"], job["post_id"])
+                self._log(
+                    f"[{n + 1}/{total}] Downloading: {job['username']} / {job['title']}")
+
+            if job["url_type"] == "jpg":
+                # Fetch the post's remaining images along with this one
+                batch = [job] + download_queue.take(
+                    lambda other, post=current_post: other["url_type"] == "jpg"
+                    and (other["username"], other["post_id"]) == post)
+                claimed = [image for image in batch if claim_job(store, image)]
+                if not claimed:
+                    n += len(batch)
+                    continue
+
+                def images_progress_cb(current, count, n=n, size=len(batch)):
+                    progress = (n + current / (count or 1) * size) / total
+                    self._ui_progress(int(progress * 1000), 1000)
+
+                def fetch_images(control, batch=claimed, progress_cb=images_progress_cb):
+                    try:
+                        download_images(batch, store, log=self._log,
+                                        pause_event=control.pause_event,
+                                        cancel_event=control.cancel_event,
+                                        progress_cb=progress_cb)
+                    except RuntimeError:
+                        if not self.cancel_event.is_set():
+                            self._log(f"    [Cancelled] {batch[0]['title']}")
+                        controls.record_cancelled(control, batch)
+
+                controls.run(job, fetch_images)
+                n += len(batch)
+                continue
+
+            output_path = job_output_path(job)
+            if job["state"] == DONE and os.path.exists(output_path):
+                self._log(f"    Skipped (already downloaded): {os.path.basename(output_path)}")
+                n += 1
+                continue
+            # A headless worker sharing the job database may be fetching it
+            if not claim_job(store, job):
+                self._log(f"    Skipped (taken or finished by another worker): "
+                          f"{os.path.basename(output_path)}")
+                n += 1
+                continue
+
+            def progress_cb(current, size, n=n):
+                progress = (n + current / (size or 1)) / total
+                self._ui_progress(int(progress * 1000), 1000)
+
+            def fetch(control, job=job, output_path=output_path, progress_cb=progress_cb):
+                try:
+                    download_job(
+                        job,
+                        store,
+                        log=self._log,
+                        pause_event=control.pause_event,
+                        cancel_event=control.cancel_event,
+                        on_ffmpeg=control.on_ffmpeg,
+                        progress_cb=progress_cb,
+                    )
+                    self._log(f"    Downloaded: {os.path.basename(output_path)}")
+                except Exception as e:
+                    if not control.cancelled:
+                        self._log(f"    [Failed] {job['output_name']}: {e}")
+                    elif not self.cancel_event.is_set():
+                        self._log(f"    [Cancelled] {job['output_name']}")
+                        controls.record_cancelled(control, [job])
+
+            controls.run(job, fetch)
+            n += 1
+
+    def _offer_resume(self):
+        """Offer to resume downloads left unfinished by a previous session."""
+        if self.downloading:
+            return
+        try:
+            store = get_job_store()
+            jobs = store.unfinished()
+        except sqlite3.Error as e:
+            self._log(f"[Warning] Could not open the download queue: {e}")
+            return
+        if not jobs:
+            return
+
+        answer = messagebox.askyesnocancel(
+            "Resume downloads",
+            f"{len(jobs)} download(s) from a previous session did not finish.\n\n"
+            "Yes: resume them now\nNo: discard them\nCancel: ask again next time")
+        if answer is None:
+            return
+        if not answer:
+            store.discard_unfinished()
+            self._log(f"[Queue] Discarded {len(jobs)} unfinished download(s)")
+            return
 
+        self.downloading = True
+        self.btn_download.config(state="disabled")
+        self.btn_pause.config(state="normal")
+        self.btn_cancel.config(state="normal")
+
+        self.cancel_event.clear()
+        self._log(f"[Queue] Resuming {len(jobs)} unfinished download(s)")
+        threading.Thread(target=self._resume_worker,
+                         args=(jobs,), daemon=True).start()
+
+    def _resume_worker(self, jobs):
+        self._run_jobs(jobs)
         self._log("[Status] Download finished")
+        self._ui(self._on_download_finished)
+
+    def _on_download_finished(self):
         self.downloading = False
         self.btn_download.config(state="normal")
         self.btn_pause.config(state="disabled", text="Pause")
         self.btn_cancel.config(state="disabled")
 
-    def _download_mp4(self, url, acc, title, id):
-        # Standard mp4 download
-        try:
-            def progress_cb(current, total):
-                self.after(0, self._update_progress, current, total)
-
-            download_and_merge(
-                url,
-                os.path.join(cfg.get("download_dir") or "downloads",
-                             sanitize_filename(acc["username"]),
-                             f"{id}-{sanitize_filename(title)}"),
-                sanitize_filename(title),
-                url_type="mp4",
-                progress_cb=progress_cb,
-            )
-            self._log("    Done")
-        except Exception as e:
-            self._log(f"    [Failed] {e}")
-
-    def _download_jpg(self, url, acc, title, id, index, length):
-        # Standard jpg download
-        try:
-            def progress_cb(current, total):
-                self.after(0, self._update_progress, current, total)
-
-            file_name = sanitize_filename(title)
-            file_name = f"{file_name}_{index}" if length > 1 else file_name
-
-            download_and_merge(
-                url,
-                os.path.join(cfg.get("download_dir") or "downloads",
-                             sanitize_filename(acc["username"]),
-                             f"{id}-{sanitize_filename(title)}"),
-                file_name,
-                url_type="jpg",
-                progress_cb=progress_cb,
-            )
-            self._log("    Done")
-        except Exception as e:
-            self._log(f"    [Failed] {e}")
-
-    def _download_m3u8(self, url, acc, title, id):
-        # m3u8 download
-        try:
-            def progress_cb(current, total):
-                self.after(0, self._update_progress, current, total)
-
-            download_and_merge(
-                url,
-                os.path.join(cfg.get("download_dir") or "downloads",
-                             sanitize_filename(acc["username"]),
-                             f"{id}-{sanitize_filename(title)}"),
-                sanitize_filename(title),
-                url_type="m3u8",
-                progress_cb=progress_cb,
-            )
-            self._log("    Done")
-        except Exception as e:
-            self._log(f"    [Failed] {e}")
-
     def on_pause_resume(self):
         if not self.downloading:
             return
@@ -822,14 +1260,11 @@ class DownloaderGUI(tk.Tk):
             self._log("[Status] Resumed")
 
     def on_cancel(self):
-        if not self.downloading and self.current_proc is None:
+        if not self.downloading:
             return
         self.cancel_event.set()
         self._log("[Status] Cancelling current task...")
-        # If ffmpeg is running, terminate it as soon as possible
-        if self.current_proc:
-            try:
-                self.current_proc.terminate()
-            except (OSError, ValueError) as e:
-                self._log(
-                    f"[Warning] Exception while terminating process: {e}")
+        # Terminate the FFmpeg processes of every running job right away
+        controls = self.controls
+        if controls is not None:
+            controls.terminate_all()
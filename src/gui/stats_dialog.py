@@ -0,0 +1,85 @@
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+
+from core import metrics
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+class StatsDialog(tk.Toplevel):
+    """Non-modal window showing live throughput and latency metrics."""
+
+    REFRESH_MS = 1000
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Statistics")
+        self.geometry("720x480")
+
+        self.text = tk.Text(self, height=24, wrap="none")
+        self.text.pack(fill="both", expand=True, padx=12, pady=(12, 6))
+
+        btns = ttk.Frame(self)
+        btns.pack(fill="x", padx=12, pady=(0, 12))
+        ttk.Button(btns, text="Close", command=self.destroy).pack(side="right")
+        ttk.Button(btns, text="Export...", command=self._export).pack(
+            side="right", padx=(0, 8))
+        ttk.Button(btns, text="Reset", command=metrics.reset).pack(side="left")
+
+        self.bind("<Escape>", lambda e: self.destroy())
+        self._refresh()
+
+    def _render(self, snap: dict) -> str:
+        lines = [
+            f"Uptime: {snap['uptime_seconds']:.0f}s    "
+            f"Downloaded: {_fmt_bytes(snap['bytes_total'])}    "
+            f"Rate: {_fmt_bytes(snap['bytes_per_sec_current'])}/s "
+            f"(avg {_fmt_bytes(snap['bytes_per_sec_overall'])}/s)",
+            "",
+            "Jobs:",
+        ]
+        for job in reversed(snap["jobs"][-20:]):
+            state = "running" if job["running"] else "done"
+            lines.append(
+                f"  [{state:7}] {job['kind']:5} {job['name'][:40]:40} "
+                f"{_fmt_bytes(job['bytes']):>10} {_fmt_bytes(job['bytes_per_sec']):>10}/s "
+                f"paused {job['paused_seconds']:.0f}s")
+        lines += ["", "Gauges:"]
+        for g in snap.get("gauges", []):
+            labels = ",".join(f"{k}={v}" for k, v in g["labels"].items())
+            lines.append(f"  {g['name']}[{labels}] = {g['value']:g}")
+        lines += ["", "Latency (seconds):"]
+        for h in snap["histograms"]:
+            labels = ",".join(f"{k}={v}" for k, v in h["labels"].items())
+            lines.append(
+                f"  {h['name']}[{labels}] n={h['count']} avg={h['avg']:.3f} max={h['max']:.3f}")
+        lines += ["", "Counters:"]
+        for c in snap["counters"]:
+            labels = ",".join(f"{k}={v}" for k, v in c["labels"].items())
+            lines.append(f"  {c['name']}[{labels}] = {c['value']:g}")
+        return "\n".join(lines)
+
+    def _refresh(self):
+        if not self.winfo_exists():
+            return
+        self.text.delete("1.0", "end")
+        self.text.insert("end", self._render(metrics.snapshot()))
+        self.after(self.REFRESH_MS, self._refresh)
+
+    def _export(self):
+        path = filedialog.asksaveasfilename(
+            parent=self, defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")])
+        if not path:
+            return
+        fmt = "prometheus" if path.endswith(".prom") else "json"
+        try:
+            metrics.dump(path, fmt)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to export metrics: {e}", parent=self)
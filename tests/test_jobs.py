@@ -0,0 +1,139 @@
+"""Job store state transitions and claims shared between workers."""
+
+import os
+import sqlite3
+
+from core.jobs import CANCELLED, DONE, FAILED, PENDING, RUNNING, JobStore
+
+
+def _job(n: int) -> dict:
+    return {"source": "subscription", "username": "creator", "post_id": str(n),
+            "title": f"post {n}", "url": f"https://cdn.example/{n}.mp4", "url_type": "mp4",
+            "target_dir": "/downloads/creator", "output_name": f"post {n}"}
+
+
+def _stores(tmp_path):
+    path = os.path.join(tmp_path, "jobs.sqlite3")
+    first, second = JobStore(path), JobStore(path)
+    first.owner, second.owner = "host:1", "host:2"
+    return first, second
+
+
+def test_claim_is_exclusive(tmp_path):
+    first, second = _stores(tmp_path)
+    job = first.enqueue([_job(1)])[0]
+    assert first.claim(job["id"])
+    assert not second.claim(job["id"])
+
+
+def test_finished_job_cannot_be_claimed(tmp_path):
+    first, second = _stores(tmp_path)
+    job = first.enqueue([_job(1)])[0]
+    # The second worker read the row while it was still pending
+    stale = second.get(job["id"])
+    assert first.claim(job["id"])
+    first.mark(job["id"], DONE)
+    assert stale["state"] != DONE
+    assert not second.claim(stale["id"])
+
+
+def test_cancelled_job_cannot_be_claimed(tmp_path):
+    first, second = _stores(tmp_path)
+    job = first.enqueue([_job(1)])[0]
+    first.mark(job["id"], CANCELLED)
+    assert not second.claim(job["id"])
+    assert first.unfinished() == []
+
+
+def test_enqueue_leaves_job_held_by_live_worker(tmp_path):
+    first, second = _stores(tmp_path)
+    job = first.enqueue([_job(1)])[0]
+    assert first.claim(job["id"])
+    first.mark(job["id"], RUNNING)
+    second.enqueue([dict(_job(1), url="https://cdn.example/new.mp4")])
+    row = second.get(job["id"])
+    assert row["state"] == RUNNING
+    assert row["owner"] == "host:1"
+
+
+def test_enqueue_reopens_job_with_expired_lease(tmp_path):
+    first, second = _stores(tmp_path)
+    job = first.enqueue([_job(1)])[0]
+    assert first.claim(job["id"])
+    first.mark(job["id"], RUNNING)
+    # The first worker died and its lease ran out
+    first.close()
+    with sqlite3.connect(first.path) as conn:
+        conn.execute("UPDATE jobs SET lease = 0")
+    second.enqueue([dict(_job(1), url="https://cdn.example/new.mp4")])
+    row = second.get(job["id"])
+    assert row["state"] == PENDING
+    assert row["url"] == "https://cdn.example/new.mp4"
+
+
+def test_discard_unfinished_leaves_job_held_by_live_worker(tmp_path):
+    first, second = _stores(tmp_path)
+    held, idle = first.enqueue([_job(1), _job(2)])
+    assert first.claim(held["id"])
+    first.mark(held["id"], RUNNING)
+    assert second.discard_unfinished() == 1
+    assert second.get(held["id"])["state"] == RUNNING
+    assert second.get(idle["id"])["state"] == CANCELLED
+
+
+def test_reopen_only_affects_done_jobs(tmp_path):
+    first, second = _stores(tmp_path)
+    done, pending = first.enqueue([_job(1), _job(2)])
+    first.mark(done["id"], DONE)
+    assert second.reopen(done["id"])
+    assert second.claim(done["id"])
+    assert not second.reopen(pending["id"])
+    assert second.get(pending["id"])["state"] == PENDING
+
+
+def test_enqueue_refreshes_url_but_keeps_done_jobs(tmp_path):
+    store, _ = _stores(tmp_path)
+    done, failed = store.enqueue([_job(1), _job(2)])
+    store.mark(done["id"], DONE)
+    store.mark(failed["id"], FAILED, "HTTP 403")
+    again = store.enqueue([dict(_job(1), url="https://cdn.example/1b.mp4"),
+                           dict(_job(2), url="https://cdn.example/2b.mp4")])
+    assert [job["id"] for job in again] == [done["id"], failed["id"]]
+    assert [job["state"] for job in again] == [DONE, PENDING]
+    assert [job["url"] for job in again] == ["https://cdn.example/1b.mp4",
+                                             "https://cdn.example/2b.mp4"]
+
+
+def test_mark_counts_attempts_and_releases_claim(tmp_path):
+    first, second = _stores(tmp_path)
+    job = first.enqueue([_job(1)])[0]
+    assert first.claim(job["id"])
+    first.mark(job["id"], RUNNING)
+    first.mark(job["id"], FAILED, "timeout")
+    row = first.get(job["id"])
+    assert (row["state"], row["attempts"], row["error"], row["owner"]) == (
+        FAILED, 1, "timeout", "")
+    assert second.claim(job["id"])
+
+
+def test_unfinished_and_finished(tmp_path):
+    store, _ = _stores(tmp_path)
+    jobs = store.enqueue([_job(n) for n in range(5)])
+    for job, state in zip(jobs, [PENDING, RUNNING, FAILED, DONE, CANCELLED]):
+        store.mark(job["id"], state)
+    assert [job["post_id"] for job in store.unfinished()] == ["0", "1", "2"]
+    assert [job["post_id"] for job in store.finished()] == ["3"]
+    assert store.counts() == {PENDING: 1, RUNNING: 1, FAILED: 1, DONE: 1, CANCELLED: 1}
+
+
+def test_expired_lease_can_be_taken_over(tmp_path):
+    first, second = _stores(tmp_path)
+    job = first.enqueue([_job(1)])[0]
+    assert first.claim(job["id"])
+    assert second.unfinished() == []
+    # The first worker died and its lease ran out
+    first.close()
+    with sqlite3.connect(first.path) as conn:
+        conn.execute("UPDATE jobs SET lease = 0")
+    assert [row["id"] for row in second.unfinished()] == [job["id"]]
+    assert second.claim(job["id"])
@@ -0,0 +1,61 @@
+"""Incremental JSON reading across chunk boundaries."""
+
+import json
+
+import pytest
+
+from core.jsonstream import JsonStream
+
+DOC = {
+    "status": 200,
+    "data": {
+        "2025年09月 購入履歴": [
+            {"post_id": 1, "title": "quote \" and backslash \\", "price": 1000,
+             "attachments": [{"default": "https://cdn.example/1.mp4"}]},
+            {"post_id": 22, "title": "braces } ] { [ in a string", "price": -1.5e3,
+             "tags": [], "extra": {}, "flag": True, "none": None},
+        ],
+        "2025年08月 購入履歴": [{"post_id": 333, "title": "☃ \\u escapes"}],
+    },
+    "last_page": 12345,
+}
+
+
+def _chunks(text: str, size: int):
+    data = text.encode("utf-8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _walk(stream: JsonStream) -> dict:
+    out = {}
+    for key in stream.iter_object():
+        if key != "data":
+            out[key] = stream.value()
+            continue
+        out[key] = {}
+        for month in stream.iter_object():
+            out[key][month] = list(stream.iter_array())
+    return out
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64, 4096])
+def test_walk_matches_json_loads(size):
+    text = json.dumps(DOC, ensure_ascii=False, indent=1)
+    assert _walk(JsonStream(_chunks(text, size))) == DOC
+
+
+@pytest.mark.parametrize("size", [1, 2, 3])
+def test_number_split_across_chunks(size):
+    stream = JsonStream(_chunks("[12345, 6.75e-2]", size))
+    assert list(stream.iter_array()) == [12345, 6.75e-2]
+
+
+def test_whole_value_in_many_chunks():
+    text = json.dumps(DOC)
+    assert JsonStream(_chunks(text, 1)).value() == DOC
+
+
+def test_truncated_body_raises():
+    stream = JsonStream(_chunks('{"data": [1, 2', 4))
+    with pytest.raises(ValueError):
+        _walk(stream)
@@ -0,0 +1,112 @@
+"""Download queue priority and fair-share order."""
+
+import pytest
+
+from core.config import cfg
+from core.scheduler import DownloadQueue
+
+
+@pytest.fixture
+def config(monkeypatch):
+    def apply(**values):
+        for key in ("priorities", "newest_first", "fair_share", "fair_weights"):
+            monkeypatch.setitem(cfg, key, values.get(key))
+    apply()
+    return apply
+
+
+def _jobs(spec):
+    """Build jobs from ``(username, post_id, url_type)`` tuples, numbered in order."""
+    return [{"id": n, "username": user, "post_id": str(post), "url_type": kind,
+             "source": "subscription"}
+            for n, (user, post, kind) in enumerate(spec, 1)]
+
+
+def _drain(queue):
+    order = []
+    while (job := queue.pop()) is not None:
+        order.append(job["id"])
+    return order
+
+
+def test_insertion_order_without_rules(config):
+    queue = DownloadQueue(_jobs([("a", 1, "mp4"), ("b", 3, "mp4"), ("a", 2, "jpg")]))
+    assert len(queue) == 3
+    assert _drain(queue) == [1, 2, 3]
+    assert len(queue) == 0
+
+
+def test_priority_rules_add_up(config):
+    config(priorities={"creator": {"b": 10}, "type": {"jpg": 5}})
+    queue = DownloadQueue(_jobs([("a", 1, "mp4"), ("a", 2, "jpg"),
+                                 ("b", 3, "mp4"), ("b", 4, "jpg")]))
+    assert _drain(queue) == [4, 3, 2, 1]
+
+
+def test_newest_first_breaks_ties(config):
+    config(newest_first=True, priorities={"creator": {"a": 1}})
+    queue = DownloadQueue(_jobs([("b", 5, "mp4"), ("a", 1, "mp4"),
+                                 ("b", 9, "mp4"), ("a", 2, "mp4")]))
+    assert _drain(queue) == [4, 2, 3, 1]
+
+
+def test_promote_and_set_priority_reorder_pending_jobs(config):
+    queue = DownloadQueue(_jobs([("a", 1, "mp4"), ("b", 2, "mp4"), ("c", 3, "mp4")]))
+    assert queue.pop()["id"] == 1
+    assert queue.promote(lambda job: job["username"] == "c") == 1
+    assert queue.pop()["id"] == 3
+    queue.push([{"id": 4, "username": "d", "post_id": "4", "url_type": "mp4"},
+                {"id": 5, "username": "e", "post_id": "5", "url_type": "mp4"}])
+    queue.set_priority([5], 1)
+    assert _drain(queue) == [5, 2, 4]
+
+
+def test_set_rule_applies_to_later_pushes(config):
+    queue = DownloadQueue(_jobs([("a", 1, "mp4")]))
+    queue.set_rule("creator", "b", 3)
+    queue.push(_jobs([("a", 1, "mp4"), ("b", 2, "mp4")])[1:])
+    assert _drain(queue) == [2, 1]
+
+
+def test_fair_share_interleaves_creators(config):
+    config(fair_share="creator")
+    queue = DownloadQueue(_jobs([("a", 1, "mp4"), ("a", 2, "mp4"), ("a", 3, "mp4"),
+                                 ("a", 4, "mp4"), ("b", 5, "mp4"), ("b", 6, "mp4")]))
+    assert _drain(queue) == [1, 5, 2, 6, 3, 4]
+
+
+def test_fair_share_weights(config):
+    config(fair_share="creator", fair_weights={"a": 2})
+    queue = DownloadQueue(_jobs([("a", 1, "mp4"), ("a", 2, "mp4"), ("a", 3, "mp4"),
+                                 ("a", 4, "mp4"), ("b", 5, "mp4"), ("b", 6, "mp4")]))
+    assert _drain(queue) == [1, 5, 2, 3, 6, 4]
+
+
+def test_fair_share_by_bytes(config):
+    config(fair_share="creator")
+    jobs = _jobs([("a", 1, "mp4"), ("a", 2, "mp4"), ("b", 3, "mp4"),
+                  ("b", 4, "mp4"), ("b", 5, "mp4")])
+    sizes = {1: {"size": 300}, 2: {"size": 300}, 3: {"size": 100},
+             4: {"size": 100}, 5: {"size": 100}}
+    assert _drain(DownloadQueue(jobs, sizes)) == [1, 3, 4, 5, 2]
+
+
+def test_priority_beats_fair_share(config):
+    config(fair_share="creator", priorities={"type": {"jpg": 1}})
+    queue = DownloadQueue(_jobs([("a", 1, "jpg"), ("a", 2, "jpg"), ("b", 3, "mp4")]))
+    assert _drain(queue) == [1, 2, 3]
+
+
+def test_late_group_starts_at_current_share(config):
+    config(fair_share="creator")
+    queue = DownloadQueue(_jobs([("a", n, "mp4") for n in range(1, 5)]))
+    assert [queue.pop()["id"], queue.pop()["id"]] == [1, 2]
+    queue.push([{"id": 5, "username": "b", "post_id": "5", "url_type": "mp4"},
+                {"id": 6, "username": "b", "post_id": "6", "url_type": "mp4"}])
+    assert _drain(queue) == [3, 5, 4, 6]
+
+
+def test_take_removes_matching_jobs(config):
+    queue = DownloadQueue(_jobs([("a", 1, "mp4"), ("b", 2, "mp4"), ("a", 3, "mp4")]))
+    assert [job["id"] for job in queue.take(lambda job: job["username"] == "a")] == [1, 3]
+    assert _drain(queue) == [2]
@@ -0,0 +1,111 @@
+"""AIMD concurrency limit for media requests."""
+
+from contextlib import ExitStack
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from core import tuning
+from core.tuning import ConcurrencyController
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(tuning, "time", clock)
+    return clock
+
+
+def _window(controller, clock, seconds=1.0, nbytes=0, status=200, slots=None):
+    """Run a window with *slots* requests in flight (default: all of them).
+
+    The last slot is released first and ends the window, so it carries the
+    window's bytes and status; the others count towards the next window.
+    """
+    with ExitStack() as stack:
+        for _ in range(controller.limit if slots is None else slots):
+            slot = stack.enter_context(controller.slot())
+        slot.add_bytes(nbytes)
+        slot.response(SimpleNamespace(status_code=status, raw=None))
+        clock.now += seconds
+    return controller.limit
+
+
+def test_increases_while_throughput_grows(clock):
+    controller = ConcurrencyController("test", 2, 4, interval=1)
+    assert _window(controller, clock, nbytes=1000) == 3
+    assert _window(controller, clock, nbytes=2000) == 4
+    assert _window(controller, clock, nbytes=4000) == 4
+    assert controller.last_decision.startswith("hold: 4 -> 4")
+
+
+def test_holds_when_throughput_stops_growing(clock):
+    controller = ConcurrencyController("test", 2, 8, interval=1)
+    assert _window(controller, clock, nbytes=1000) == 3
+    assert _window(controller, clock, nbytes=1000) == 3
+
+
+def test_holds_when_not_every_slot_is_busy(clock):
+    controller = ConcurrencyController("test", 4, 8, interval=1)
+    assert _window(controller, clock, nbytes=1000, slots=2) == 4
+    assert controller.last_decision.startswith("hold")
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_overload_halves_the_limit(clock, status):
+    controller = ConcurrencyController("test", 8, 16, interval=1)
+    assert _window(controller, clock, status=status) == 4
+    assert _window(controller, clock, status=status) == 2
+    assert _window(controller, clock, status=status) == 1
+    assert _window(controller, clock, status=status) == 1
+
+
+def test_retries_count_as_errors(clock):
+    controller = ConcurrencyController("test", 4, 16, interval=1)
+    with controller.slot() as slot:
+        history = SimpleNamespace(history=[object()])
+        slot.response(SimpleNamespace(status_code=200, raw=SimpleNamespace(retries=history)))
+        clock.now += 1
+    assert controller.limit == 2
+
+
+def test_request_exceptions_back_off_but_local_errors_do_not(clock):
+    controller = ConcurrencyController("test", 4, 16, interval=1)
+    with pytest.raises(ValueError):
+        with controller.slot():
+            clock.now += 1
+            raise ValueError("disk full")
+    assert controller.limit == 4
+    with pytest.raises(requests.ConnectionError):
+        with controller.slot():
+            clock.now += 1
+            raise requests.ConnectionError()
+    assert controller.limit == 2
+
+
+def test_rising_latency_steps_down(clock):
+    controller = ConcurrencyController("test", 2, 8, interval=1)
+    assert _window(controller, clock, seconds=1) == 2
+    assert _window(controller, clock, seconds=1) == 2
+    assert _window(controller, clock, seconds=5) == 1
+    assert controller.last_decision.startswith("latency: 2 -> 1")
+
+
+def test_fixed_limit_when_not_adaptive(clock):
+    controller = ConcurrencyController("test", 4, 16, adaptive=False, interval=1)
+    assert _window(controller, clock, status=503) == 4
+    assert _window(controller, clock, nbytes=1000) == 4
+
+
+def test_limit_is_clamped():
+    assert ConcurrencyController("test", 0, 4).limit == 1
+    assert ConcurrencyController("test", 32, 4).limit == 4
@@ -0,0 +1,110 @@
+"""Length and hash checks of finished downloads."""
+
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from core import verify
+from core.config import cfg
+from core.jobs import DONE, JobStore
+from core.verify import VerificationError
+
+
+@pytest.fixture
+def config(monkeypatch):
+    def apply(**values):
+        for key in ("verify_downloads", "verify_hash"):
+            if key in values:
+                monkeypatch.setitem(cfg, key, values[key])
+            else:
+                monkeypatch.delitem(cfg, key, raising=False)
+    apply()
+    return apply
+
+
+def _resp(**headers):
+    return SimpleNamespace(headers={k.replace("_", "-"): v for k, v in headers.items()})
+
+
+def test_expected_length():
+    assert verify.expected_length(_resp(content_length="1234")) == 1234
+    assert verify.expected_length(_resp(content_length="1234",
+                                        content_encoding="identity")) == 1234
+    assert verify.expected_length(_resp(content_length="1234", content_encoding="gzip")) is None
+    assert verify.expected_length(_resp(content_length="many")) is None
+    assert verify.expected_length(_resp()) is None
+
+
+def test_check_length(config):
+    verify.check_length("/downloads/a.mp4", 100, 100)
+    verify.check_length("/downloads/a.mp4", 100, None)
+    with pytest.raises(VerificationError, match="a.mp4 is incomplete: 60 of 100 bytes"):
+        verify.check_length("/downloads/a.mp4", 60, 100)
+    config(verify_downloads=False)
+    verify.check_length("/downloads/a.mp4", 60, 100)
+
+
+def _finished(tmp_path, data: bytes, hashed: bool):
+    store = JobStore(os.path.join(tmp_path, "jobs.sqlite3"))
+    job = store.enqueue([{"source": "subscription", "username": "creator", "post_id": "1",
+                          "title": "post 1", "url": "https://cdn.example/1.jpg",
+                          "url_type": "jpg", "target_dir": str(tmp_path),
+                          "output_name": "post 1"}])[0]
+    path = os.path.join(tmp_path, "post 1.jpg")
+    with open(path, "wb") as f:
+        f.write(data)
+    digest = verify.record(store, job, path)
+    store.mark(job["id"], DONE)
+    assert (digest is not None) == hashed
+    return store, path
+
+
+def test_record_size_without_hash(tmp_path, config):
+    store, path = _finished(tmp_path, b"x" * 10, hashed=False)
+    job = store.finished()[0]
+    assert (job["size"], job["sha256"]) == (10, None)
+
+
+def test_record_hash(tmp_path, config):
+    config(verify_hash=True)
+    store, path = _finished(tmp_path, b"x" * 10, hashed=True)
+    assert store.finished()[0]["sha256"] == hashlib.sha256(b"x" * 10).hexdigest()
+
+
+def test_check_file(tmp_path, config):
+    config(verify_hash=True)
+    store, path = _finished(tmp_path, b"x" * 10, hashed=True)
+    job = store.finished()[0]
+
+    def check(**kw):
+        return verify.check_file(path, "jpg", job["size"], None,
+                                 kw.get("sha256", job["sha256"]), None, 2.0)
+
+    assert check() is None
+    with open(path, "r+b") as f:
+        f.write(b"y")
+    assert check() == "content hash changed"
+    assert check(sha256=None) is None
+    with open(path, "ab") as f:
+        f.write(b"z")
+    assert check() == "size changed from 10 to 11 bytes"
+    os.remove(path)
+    assert check() == "missing"
+
+
+def test_scan_archive(tmp_path, config):
+    config(verify_hash=True)
+    store, path = _finished(tmp_path, b"x" * 10, hashed=True)
+    jobs = store.finished()
+    assert verify.scan_archive(jobs, processes=1) == []
+    with open(path, "r+b") as f:
+        f.write(b"y")
+    assert verify.scan_archive(jobs, processes=1) == []
+    seen = []
+    broken = verify.scan_archive(jobs, processes=1, check_hash=True,
+                                 progress_cb=lambda n, total: seen.append((n, total)))
+    assert [(job["id"], problem) for job, problem in broken] == [
+        (jobs[0]["id"], "content hash changed")]
+    assert seen == [(1, 1)]